@@ -0,0 +1,166 @@
+"""
+Static assets: logo lookup table, content hashes for cache-busting URLs, caching headers and an
+optional WebP build step.
+
+    python assets.py --webp            # static/logos/*.png|jpg -> *.webp (needs Pillow)
+"""
+import argparse, hashlib, os, threading, time
+from pathlib import Path
+from urllib.parse import parse_qs
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+LOGO_DIR = STATIC_DIR / "logos"
+# Versioned URLs (?v=<content hash>) never change content: cache them for a year. Plain URLs are
+# cached for STATIC_MAX_AGE seconds and then revalidated with the ETag (also the content hash).
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+_IMMUTABLE = "public, max-age=31536000, immutable"
+# 0 = logo table is built once; > 0 = rescan static/logos at most every N seconds (hot reload)
+LOGO_RELOAD_INTERVAL = float(os.getenv("LOGO_RELOAD_INTERVAL", "0"))
+
+# Preference if a logo exists in several formats: vector, then the small WebP variants, PDF last
+_IMG_EXTS = [".svg", ".webp", ".png", ".jpg", ".jpeg", ".gif"]
+_ALL_EXTS = _IMG_EXTS + [".pdf"]
+WEBP_MAX_PX = int(os.getenv("WEBP_MAX_PX", "190"))  # logos are shown at 95px: 2x for HiDPI
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+
+_hashes = {}  # path -> (mtime_ns, size, hash)
+_hashes_lock = threading.Lock()
+
+
+def file_hash(path, st: os.stat_result | None = None) -> str:
+    """Short content hash of a file; recomputed only when its mtime or size changes."""
+    path = str(path)
+    st = st or os.stat(path)
+    with _hashes_lock:
+        cached = _hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    digest = h.hexdigest()[:12]
+    with _hashes_lock:
+        _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def _pick_logo(slug: str, files: list[Path]) -> Path | None:
+    # 1) exact slug + preferred extensions
+    by_name = {p.name: p for p in files}
+    for ext in _ALL_EXTS:
+        if f"{slug}{ext}" in by_name:
+            return by_name[f"{slug}{ext}"]
+    # 2) fuzzy: any file containing slug (case-insensitive), image extensions before pdf
+    slug_flat = slug.replace("-", "").lower()
+    cand = [p for p in files if slug_flat in p.stem.replace("-", "").lower()]
+    if not cand:
+        return None
+    def _rank(p):
+        ext = p.suffix.lower()
+        return (_ALL_EXTS.index(ext) if ext in _ALL_EXTS else 999, len(p.name))
+    return min(cand, key=_rank)
+
+
+class LogoIndex:
+    """slug -> (file name, content hash), from one scan of the logo directory instead of
+    filesystem probes per request."""
+
+    def __init__(self, slugs, directory=LOGO_DIR, reload_interval: float = LOGO_RELOAD_INTERVAL):
+        self.slugs, self.directory, self.reload_interval = list(slugs), Path(directory), reload_interval
+        self._lock = threading.Lock()
+        self._table, self._signature, self._checked = {}, None, 0.0
+        self.reload()
+
+    def _scan(self):
+        files = sorted((p for p in self.directory.glob("*") if p.is_file()), key=lambda p: p.name) \
+            if self.directory.is_dir() else []
+        return files, tuple((p.name, p.stat().st_mtime_ns, p.stat().st_size) for p in files)
+
+    def reload(self):
+        files, signature = self._scan()
+        table = {}
+        for slug in self.slugs:
+            p = _pick_logo(slug, files) if slug else None
+            if p is not None:
+                table[slug] = (p.name, file_hash(p))
+        with self._lock:
+            self._table, self._signature, self._checked = table, signature, time.monotonic()
+
+    def _maybe_reload(self):
+        if self.reload_interval <= 0 or time.monotonic() - self._checked < self.reload_interval:
+            return
+        self._checked = time.monotonic()
+        if self._scan()[1] != self._signature:
+            self.reload()
+
+    def get(self, slug: str | None) -> tuple[str, str] | None:
+        if not slug:
+            return None
+        self._maybe_reload()
+        return self._table.get(slug)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with the content hash as (strong) ETag, so it stays valid across deploys, and
+    long-lived Cache-Control for ?v=<hash> URLs."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        digest = file_hash(full_path, stat_result)
+        version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+        if version == digest:
+            cache_control = _IMMUTABLE
+        elif version is None:
+            cache_control = f"public, max-age={STATIC_MAX_AGE}"
+        else:
+            cache_control = "no-cache"  # outdated hash: always revalidate
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                headers={"etag": f'"{digest}"', "cache-control": cache_control})
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def build_webp(directory=LOGO_DIR, max_px: int = WEBP_MAX_PX, quality: int = WEBP_QUALITY) -> list[tuple[str, int, int]]:
+    """Writes <name>.webp next to every PNG/JPG (scaled down to max_px); returns (name, bytes before, after)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("WebP-Konvertierung braucht Pillow: pip install Pillow")
+    out = []
+    for src in sorted(Path(directory).glob("*")):
+        if src.suffix.lower() not in (".png", ".jpg", ".jpeg"):
+            continue
+        dst = src.with_suffix(".webp")
+        if dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+            continue  # up to date
+        with Image.open(src) as img:
+            img = img.convert("RGBA" if img.mode in ("P", "LA", "RGBA") or "transparency" in img.info else "RGB")
+            img.thumbnail((max_px, max_px), Image.LANCZOS)
+            img.save(dst, "WEBP", quality=quality, method=6)
+        out.append((src.name, src.stat().st_size, dst.stat().st_size))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--webp", action="store_true", help="build WebP variants of the PNG/JPG logos")
+    ap.add_argument("--dir", default=str(LOGO_DIR))
+    ap.add_argument("--max-px", type=int, default=WEBP_MAX_PX)
+    ap.add_argument("--quality", type=int, default=WEBP_QUALITY)
+    args = ap.parse_args()
+    if args.webp:
+        converted = build_webp(args.dir, args.max_px, args.quality)
+        for name, before, after in converted:
+            print(f"{name}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+        print(f"{len(converted)} WebP-Dateien erzeugt")
+    index = LogoIndex(sorted({p.stem for p in Path(args.dir).glob("*")}), args.dir, reload_interval=0)
+    for slug in index.slugs:
+        name, digest = index.get(slug) or ("—", "")
+        print(f"{slug:<12} {name:<20} {digest}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Load test for serve.main:app: p50/p95/p99 latency and requests/s of POST / (or /stream) for
+several party counts and concurrency levels.
+
+    python bench/load_test.py --parties 1,3,7 --concurrency 1,8,32 --requests 100
+
+By default it starts bench/mock_gemini.py and the app (uvicorn) itself, with GEMINI_BASE_URL
+pointing at the mock, so no quota is used; --url tests an app that is already running instead.
+Questions get a unique suffix and similar-question matching is switched off in the started app, so
+the caches do not hide the upstream cost (--repeat-questions measures the cached path). Mock behaviour comes from its MOCK_* environment variables.
+"""
+import argparse, asyncio, math, os, random, subprocess, sys, time
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALL_PARTIES = ["SPD", "CDU", "Grüne", "Linke", "AfD", "FDP", "Die PARTEI"]
+QUESTIONS = [
+    "Was soll gegen steigende Mieten getan werden?",
+    "Wie soll die Stadt klimaneutral werden?",
+    "Wie sollen Radwege in der Innenstadt ausgebaut werden?",
+    "Was planen die Parteien für die Schulen?",
+    "Wie soll die Sicherheit auf öffentlichen Plätzen verbessert werden?",
+]
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    return s[max(0, math.ceil(p / 100 * len(s)) - 1)]  # nearest rank
+
+async def _wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+async def run_level(client, url, endpoint, n_parties, concurrency, n_requests, repeat_questions):
+    latencies, first_bytes, errors = [], [], 0
+    queue = asyncio.Queue()
+    for i in range(n_requests):
+        q = random.choice(QUESTIONS)
+        queue.put_nowait(q if repeat_questions else f"{q} ({n_parties}/{concurrency}/{i})")
+    parties = ALL_PARTIES[:n_parties]
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            question = queue.get_nowait()
+            t0 = time.perf_counter()
+            try:
+                async with client.stream("POST", url + endpoint, data={"question": question, "parties": parties}) as r:
+                    first = None
+                    async for _ in r.aiter_raw():
+                        first = first or time.perf_counter()
+                    if r.status_code != 200:
+                        errors += 1
+                        continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if first is not None:
+                first_bytes.append(first - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "parties": n_parties, "concurrency": concurrency, "requests": n_requests, "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        "ttfb_p50": percentile(first_bytes, 50),
+    }
+
+def _spawn(cmd, env):
+    return subprocess.Popen([sys.executable, *cmd], cwd=ROOT, env=env)
+
+async def main_async(args):
+    procs = []
+    url = args.url
+    try:
+        if not url:
+            mock_port, app_port = args.mock_port, args.app_port
+            env = {**os.environ}
+            procs.append(_spawn([os.path.join(ROOT, "bench", "mock_gemini.py"), "--port", str(mock_port)], env))
+            env.update({
+                "GEMINI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1beta",
+                "CORPUS_NAME": "corpora/mock", "GENAI_API_KEY": "mock", "GEN_MODEL": "models/mock",
+                "RETRIEVAL_BACKEND": "remote",
+            })
+            if not args.repeat_questions:
+                env["SEMANTIC_CACHE_THRESHOLD"] = "1"  # the suffixed questions would all match each other
+            procs.append(_spawn(["-m", "uvicorn", "serve.main:app", "--port", str(app_port), "--log-level", "warning",
+                                 "--workers", str(args.workers)], env))
+            url = f"http://127.0.0.1:{app_port}"
+            await _wait_until_up(f"http://127.0.0.1:{mock_port}/__mock")
+        await _wait_until_up(url + "/")
+
+        endpoint = "/stream" if args.endpoint == "stream" else "/"
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        print(f"{'parties':>7} {'conc':>5} | {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb ms':>8} | {'req/s':>7} {'errors':>6}")
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            for n in args.parties:
+                for c in args.concurrency:
+                    r = await run_level(client, url, endpoint, n, c, args.requests, args.repeat_questions)
+                    print(f"{n:>7} {c:>5} | {r['p50'] * 1000:>8.0f} {r['p95'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f}"
+                          f" {r['ttfb_p50'] * 1000:>8.0f} | {r['rps']:>7.2f} {r['errors']:>6}", flush=True)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ints = lambda s: [int(x) for x in s.split(",")]
+    ap.add_argument("--url", help="test this running app instead of starting mock + app")
+    ap.add_argument("--endpoint", choices=["post", "stream"], default="post")
+    ap.add_argument("--parties", type=ints, default=[1, 3, 7])
+    ap.add_argument("--concurrency", type=ints, default=[1, 8, 32])
+    ap.add_argument("--requests", type=int, default=50, help="requests per (parties, concurrency) level")
+    ap.add_argument("--repeat-questions", action="store_true", help="reuse questions (measures cache hits)")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers of the started app")
+    ap.add_argument("--mock-port", type=int, default=8765)
+    ap.add_argument("--app-port", type=int, default=8766)
+    asyncio.run(main_async(ap.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local stand-in for the Gemini API (generativelanguage.googleapis.com), for load tests without quota.
+Implements the calls utils/corpus/retrieval/rag make: corpora + documents (list/create/delete),
+chunks (list, batchCreate, batchDelete), corpus and document :query, :generateContent (incl. the
+batched JSON summaries), :streamGenerateContent?alt=sse and :countTokens.
+
+    python bench/mock_gemini.py --port 8765 --latency-ms 150 --gen-latency-ms 1200 --rate-429 0.02
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta CORPUS_NAME=corpora/mock uvicorn serve.main:app
+
+Every corpus starts seeded with one document per party (MOCK_PARTIES) and a few synthetic chunks
+per topic, so CORPUS_NAME=corpora/mock works right away. Latency, errors and 429s per call are
+configurable by flag or environment (MOCK_LATENCY_MS, MOCK_GEN_LATENCY_MS, MOCK_JITTER, MOCK_ERROR_RATE,
+MOCK_RATE_429, MOCK_SLOW_RATE/MOCK_SLOW_FACTOR for a slow tail, MOCK_STREAM_TOKENS).
+"""
+import argparse, asyncio, json, os, random, re, threading, uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "150"))        # corpus/query calls
+MOCK_GEN_LATENCY_MS = float(os.getenv("MOCK_GEN_LATENCY_MS", "1200"))  # generateContent (stream: total)
+MOCK_JITTER = float(os.getenv("MOCK_JITTER", "0.3"))                 # ± share of the latency
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))           # share of calls answered with 500
+MOCK_RATE_429 = float(os.getenv("MOCK_RATE_429", "0"))               # share of calls answered with 429
+MOCK_STREAM_TOKENS = int(os.getenv("MOCK_STREAM_TOKENS", "20"))      # SSE events per streamed summary
+MOCK_SLOW_RATE = float(os.getenv("MOCK_SLOW_RATE", "0"))             # share of calls that are MOCK_SLOW_FACTOR × slower
+MOCK_SLOW_FACTOR = float(os.getenv("MOCK_SLOW_FACTOR", "10"))
+MOCK_PARTIES = os.getenv("MOCK_PARTIES", "SPD,CDU,Grüne,Linke,AfD,FDP,Die Partei").split(",")
+
+TOPICS = {
+    "Wohnen": "Wir wollen mehr bezahlbaren Wohnraum schaffen und den sozialen Wohnungsbau stärken.",
+    "Verkehr": "Radwege werden ausgebaut, der ÖPNV wird dichter getaktet und günstiger.",
+    "Klima": "Die Stadt soll klimaneutral werden, mit Solardächern und mehr Grün in den Quartieren.",
+    "Bildung": "Schulen werden saniert und digital ausgestattet, Kitaplätze ausgebaut.",
+    "Sicherheit": "Mehr Präsenz des Ordnungsamts und bessere Beleuchtung öffentlicher Plätze.",
+}
+
+app = FastAPI(title="mock-gemini")
+_lock = threading.Lock()
+_corpora = {}  # corpus id -> {"displayName", "documents": {doc id: {"displayName", "chunks": {id: chunk}}}}
+STATS = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+
+def _meta(chunk, key):
+    for m in chunk.get("customMetadata", []):
+        if m.get("key") == key:
+            return m.get("stringValue")
+    return None
+
+def _seed(corpus_id, display_name="mock"):
+    docs = {}
+    for party in MOCK_PARTIES:
+        doc_id = re.sub(r"[^a-z0-9]+", "-", party.lower()).strip("-")
+        chunks = {}
+        for section, text in TOPICS.items():
+            for i in range(3):
+                cid = uuid.uuid4().hex[:12]
+                chunks[cid] = {
+                    "name": f"corpora/{corpus_id}/documents/{doc_id}/chunks/{cid}",
+                    "data": {"stringValue": f"{party} ({section}, Punkt {i + 1}): {text}"},
+                    "customMetadata": [{"key": "party", "stringValue": party},
+                                       {"key": "section", "stringValue": section}],
+                }
+        docs[doc_id] = {"displayName": party, "chunks": chunks}
+    _corpora[corpus_id] = {"displayName": display_name, "documents": docs}
+
+def _corpus(corpus_id):
+    with _lock:
+        if corpus_id not in _corpora:
+            _seed(corpus_id)
+        return _corpora[corpus_id]
+
+def _doc_json(corpus_id, doc_id, doc):
+    return {"name": f"corpora/{corpus_id}/documents/{doc_id}", "displayName": doc["displayName"]}
+
+def _page(items, request, key):
+    size = int(request.query_params.get("pageSize", 20))
+    start = int(request.query_params.get("pageToken") or 0)
+    out = {key: items[start:start + size]}
+    if start + size < len(items):
+        out["nextPageToken"] = str(start + size)
+    return out
+
+def _score(query, text):
+    q = set(re.findall(r"\w{4,}", query.lower()))
+    t = set(re.findall(r"\w{4,}", text.lower()))
+    return round(0.5 + 0.5 * len(q & t) / max(len(q), 1) - random.random() * 0.05, 4)
+
+def _query(chunks, body):
+    allowed = None
+    for f in body.get("metadataFilters", []):
+        if f.get("key", "").endswith(".party"):
+            allowed = {c["stringValue"] for c in f.get("conditions", [])}
+    hits = [{"chunk": c, "chunkRelevanceScore": _score(body.get("query", ""), c["data"]["stringValue"])}
+            for c in chunks if allowed is None or _meta(c, "party") in allowed]
+    hits.sort(key=lambda h: -h["chunkRelevanceScore"])
+    return {"relevantChunks": hits[:int(body.get("resultsCount", 10))]}
+
+def _prompt(body):
+    return "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+
+def _system(body):
+    return "".join(p.get("text", "") for p in (body.get("systemInstruction") or {}).get("parts", []))
+
+def _summary_text(prompt):
+    party = (re.findall(r"Partei: (.+)", prompt) or ["die Partei"])[0].strip()
+    return (f"<p><strong>{party}</strong> setzt auf konkrete Maßnahmen vor Ort. "
+            f"(Simulierte Zusammenfassung, {len(prompt)} Zeichen Prompt)</p>")
+
+def _generate(body):
+    prompt = _prompt(body)
+    if (body.get("generationConfig") or {}).get("responseSchema"):
+        parties = re.findall(r"### Partei: (.+)", prompt)
+        text = json.dumps([{"party": p.strip(), "summary": _summary_text(f"Partei: {p}")} for p in parties],
+                          ensure_ascii=False)
+    else:
+        text = _summary_text(prompt)
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}],
+            "usageMetadata": {"promptTokenCount": (len(prompt) + len(_system(body))) // 4, "candidatesTokenCount": len(text) // 4}}
+
+
+async def _delay(ms):
+    if random.random() < MOCK_SLOW_RATE:
+        ms *= MOCK_SLOW_FACTOR  # tail latency (for hedging tests)
+    await asyncio.sleep(max(0.0, ms * (1 + random.uniform(-MOCK_JITTER, MOCK_JITTER))) / 1000)
+
+def _chaos():
+    """A 429 or 500 response, by the configured rates, or None."""
+    r = random.random()
+    if r < MOCK_RATE_429:
+        STATS["rate_limited"] += 1
+        return JSONResponse({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, 429, headers={"Retry-After": "1"})
+    if r < MOCK_RATE_429 + MOCK_ERROR_RATE:
+        STATS["errors"] += 1
+        return JSONResponse({"error": {"code": 500, "status": "INTERNAL"}}, 500)
+    return None
+
+def _not_found():
+    return JSONResponse({"error": {"code": 404, "status": "NOT_FOUND"}}, 404)
+
+@app.get("/__mock")
+def mock_stats():
+    return {**STATS, "corpora": {k: len(v["documents"]) for k, v in _corpora.items()}}
+
+@app.api_route("/{version}/{path:path}", methods=["GET", "POST", "DELETE"])
+async def dispatch(version: str, path: str, request: Request):
+    STATS["requests"] += 1
+    body = await request.json() if request.method == "POST" and await request.body() else {}
+    is_gen = re.match(r"models/[^/:]+:(generateContent|streamGenerateContent)$", path)
+    await _delay(MOCK_GEN_LATENCY_MS if is_gen and is_gen.group(1) == "generateContent" else MOCK_LATENCY_MS)
+    failed = _chaos()
+    if failed is not None:
+        return failed
+
+    if m := re.match(r"models/[^/:]+:(\w+)$", path):
+        if m.group(1) == "generateContent":
+            return _generate(body)
+        if m.group(1) == "streamGenerateContent":
+            return StreamingResponse(_stream(body), media_type="text/event-stream")
+        if m.group(1) == "countTokens":
+            return {"totalTokens": max(1, len(_prompt(body)) // 4)}
+        return _not_found()
+
+    if path == "corpora":
+        if request.method == "GET":
+            return {"corpora": [{"name": f"corpora/{k}", "displayName": v["displayName"]} for k, v in _corpora.items()]}
+        corpus_id = (body.get("name") or f"corpora/{uuid.uuid4().hex[:10]}").split("/", 1)[1]
+        with _lock:
+            if corpus_id in _corpora:
+                return JSONResponse({"error": {"code": 409, "status": "ALREADY_EXISTS"}}, 409)
+            _corpora[corpus_id] = {"displayName": body.get("displayName", corpus_id), "documents": {}}
+        return {"name": f"corpora/{corpus_id}", "displayName": body.get("displayName", corpus_id)}
+
+    if m := re.match(r"corpora/([^/:]+)(:query)?$", path):
+        if m.group(2):
+            chunks = [c for d in _corpus(m.group(1))["documents"].values() for c in d["chunks"].values()]
+            return _query(chunks, body)
+        if request.method == "DELETE":
+            with _lock:
+                _corpora.pop(m.group(1), None)
+            return {}
+        return _not_found()
+
+    if m := re.match(r"corpora/([^/:]+)/documents$", path):
+        corpus_id, corpus = m.group(1), _corpus(m.group(1))
+        if request.method == "GET":
+            docs = [_doc_json(corpus_id, k, d) for k, d in corpus["documents"].items()]
+            return _page(docs, request, "documents")
+        doc_id = uuid.uuid4().hex[:12]
+        with _lock:
+            corpus["documents"][doc_id] = {"displayName": body.get("displayName", doc_id), "chunks": {}}
+        return _doc_json(corpus_id, doc_id, corpus["documents"][doc_id])
+
+    if m := re.match(r"corpora/([^/:]+)/documents/([^/:]+)(:query|/chunks|/chunks:batchCreate|/chunks:batchDelete)$", path):
+        corpus_id, doc_id, op = m.groups()
+        doc = _corpus(corpus_id)["documents"].get(doc_id)
+        if doc is None:
+            return _not_found()
+        if op == ":query":
+            return _query(list(doc["chunks"].values()), body)
+        if op == "/chunks":
+            return _page(list(doc["chunks"].values()), request, "chunks")
+        if op == "/chunks:batchDelete":
+            with _lock:
+                for r in body.get("requests", []):
+                    doc["chunks"].pop(r["name"].rsplit("/", 1)[1], None)
+            return {}
+        created = []
+        for r in body.get("requests", []):
+            text = r["chunk"]["data"]["stringValue"]
+            if not text.strip():
+                return JSONResponse({"error": {"code": 400, "message": "Chunk data must not be empty"}}, 400)
+            cid = uuid.uuid4().hex[:12]
+            created.append({"name": f"corpora/{corpus_id}/documents/{doc_id}/chunks/{cid}", **r["chunk"]})
+        with _lock:
+            for c in created:
+                doc["chunks"][c["name"].rsplit("/", 1)[1]] = c
+        return {"chunks": created}
+
+    return _not_found()
+
+async def _stream(body):
+    text = _summary_text(_prompt(body))
+    n = max(1, MOCK_STREAM_TOKENS)
+    step = -(-len(text) // n)
+    for i in range(0, len(text), step):
+        await _delay(MOCK_GEN_LATENCY_MS / n)
+        part = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}], "role": "model"}}]}
+        yield f"data: {json.dumps(part, ensure_ascii=False)}\r\n\r\n"
+
+
+def main():
+    global MOCK_LATENCY_MS, MOCK_GEN_LATENCY_MS, MOCK_ERROR_RATE, MOCK_RATE_429
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=MOCK_LATENCY_MS)
+    ap.add_argument("--gen-latency-ms", type=float, default=MOCK_GEN_LATENCY_MS)
+    ap.add_argument("--error-rate", type=float, default=MOCK_ERROR_RATE)
+    ap.add_argument("--rate-429", type=float, default=MOCK_RATE_429)
+    args = ap.parse_args()
+    MOCK_LATENCY_MS, MOCK_GEN_LATENCY_MS = args.latency_ms, args.gen_latency_ms
+    MOCK_ERROR_RATE, MOCK_RATE_429 = args.error_rate, args.rate_429
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
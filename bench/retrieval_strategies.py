@@ -0,0 +1,71 @@
+"""
+Compares the two retrieval strategies of answer_per_party_strict for 1–7 parties:
+upstream round trips and wall-clock latency per question (caches cleared before every run).
+
+    python bench/retrieval_strategies.py --corpus $CORPUS_NAME --repeats 5
+
+Runs against whatever GEMINI_BASE_URL points to (the real API costs query quota).
+"""
+import argparse, os, statistics, sys, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import retrieval
+from cache import HITS_CACHE
+from corpus import party_doc_map
+from semantic_cache import QUESTION_INDEX
+
+ALL_PARTIES = ["SPD", "CDU", "Grüne", "Linke", "AfD", "FDP", "Die PARTEI"]
+QUESTIONS = [
+    "Was soll gegen steigende Mieten getan werden?",
+    "Wie soll die Stadt klimaneutral werden?",
+    "Wie sollen Konflikte zwischen Autos und Fahrrädern in der Innenstadt gelöst werden?",
+]
+
+_calls = 0
+_post = retrieval._post
+
+def _counting_post(url, body, timeout=None):
+    global _calls
+    _calls += 1
+    return _post(url, body, timeout)
+
+def run(corpus: str, strategy: str, n_parties: int, repeats: int, k: int):
+    global _calls
+    latencies, trips = [], []
+    for r in range(repeats):
+        question = QUESTIONS[r % len(QUESTIONS)]
+        HITS_CACHE.clear()
+        QUESTION_INDEX.clear()
+        _calls = 0
+        t0 = time.perf_counter()
+        retrieval.answer_per_party_strict(corpus, question, ALL_PARTIES[:n_parties],
+                                          k_retrieve=k, max_quotes=k, strategy=strategy)
+        latencies.append(time.perf_counter() - t0)
+        trips.append(_calls)
+    return statistics.median(latencies), statistics.mean(trips)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=os.getenv("CORPUS_NAME"))
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("-k", type=int, default=5)
+    args = ap.parse_args()
+    if not args.corpus:
+        ap.error("--corpus or CORPUS_NAME is required")
+
+    retrieval._post = _counting_post
+    party_doc_map(args.corpus, refresh=True)  # listing is cached and not part of the per-question cost
+
+    print(f"{'parties':>7} | {'per_document ms':>15} {'trips':>5} | {'grouped ms':>10} {'trips':>5} | speedup")
+    for n in range(1, len(ALL_PARTIES) + 1):
+        doc_lat, doc_trips = run(args.corpus, "per_document", n, args.repeats, args.k)
+        grp_lat, grp_trips = run(args.corpus, "grouped", n, args.repeats, args.k)
+        print(f"{n:>7} | {doc_lat * 1000:>15.1f} {doc_trips:>5.1f} | {grp_lat * 1000:>10.1f} {grp_trips:>5.1f} |"
+              f" {doc_lat / grp_lat:>6.2f}x")
+
+if __name__ == "__main__":
+    main()
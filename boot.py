@@ -1,4 +1,4 @@
-import os, sys, traceback
+import os, sys, time, traceback
 from fastapi import FastAPI
 import uvicorn
 
@@ -14,11 +14,18 @@ def boot_info():
         "genai_api_key_len": len(os.getenv("GENAI_API_KEY") or "")
     }
 
+@app.get("/__ready")
+def not_ready():
+    from fastapi.responses import JSONResponse
+    return JSONResponse({"ready": False, "error": "importing serve.main failed, see /__boot and the logs"}, 503)
+
 try:
     print("BOOT: importing serve.main:app …", flush=True)
+    t0 = time.perf_counter()
     from serve.main import app as real_app
     app = real_app
-    print("BOOT: imported serve.main:app OK", flush=True)
+    import warmup
+    warmup.record("import_app", time.perf_counter() - t0, required=True)
 except Exception:
     print("BOOT: FAILED importing serve.main", flush=True)
     traceback.print_exc()  # <-- exact stack in Cloud Run logs
@@ -0,0 +1,37 @@
+import contextvars, os, time
+
+# Per-request deadline budget. The web handlers start it; everything below (retrieval timeouts,
+# rate-limiter queueing in utils) reads it from the context, so it reaches asyncio tasks spawned
+# for the request without being threaded through every signature.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "15"))  # seconds per request; <= 0 disables
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+def start(seconds: float | None = None) -> float | None:
+    """Sets the deadline (time.monotonic() value) for the current request context and returns it."""
+    seconds = REQUEST_DEADLINE if seconds is None else seconds
+    d = time.monotonic() + seconds if seconds > 0 else None
+    _deadline.set(d)
+    return d
+
+def deadline() -> float | None:
+    return _deadline.get()
+
+def remaining() -> float | None:
+    """Seconds left (>= 0), or None without a budget."""
+    d = _deadline.get()
+    return None if d is None else max(0.0, d - time.monotonic())
+
+def cap(seconds: float | None) -> float | None:
+    """The smaller of `seconds` and the remaining budget (None = unlimited)."""
+    left = remaining()
+    if left is None:
+        return seconds
+    return left if seconds is None else min(seconds, left)
+
+def unbounded_context() -> contextvars.Context:
+    """Copy of the current context without a deadline, for work that may outlive its request
+    (e.g. summaries finishing in the background to fill the cache)."""
+    ctx = contextvars.copy_context()
+    ctx.run(_deadline.set, None)
+    return ctx
@@ -0,0 +1,349 @@
+import asyncio, contextvars, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from utils import _corpus_key, normalize_question, _norm
+from metrics import record_cache
+
+# Answer caches: retrieved hits per (corpus, question, party, k) and summaries per (question, quotes).
+# Level 1 is an in-process LRU with TTL, level 2 an optional SQLite file (ANSWER_CACHE_DB) that
+# survives restarts and is shared by all uvicorn workers on the same host/volume.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))     # entries per in-memory cache
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))    # seconds; <= 0 disables expiry
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB")                      # e.g. /tmp/kommunalomat-cache.sqlite
+# How often a worker re-reads the corpus generation from SQLite (rebuilds in other processes)
+GENERATION_CHECK_INTERVAL = float(os.getenv("ANSWER_CACHE_GENERATION_CHECK", "5"))
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "maxsize": self.maxsize,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+
+class SqliteCache:
+    """Disk tier: JSON values in one SQLite file (WAL, so several processes can share it)."""
+
+    def __init__(self, path: str, ttl: float = 86400):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS generations (corpus TEXT PRIMARY KEY, gen INTEGER)")
+        self.hits = self.misses = 0
+        self.purge_expired()  # rows that expired while no worker was running
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ? AND expires < ?", (key, time.time()))
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        expires = time.time() + self.ttl if self.ttl > 0 else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                               (key, payload, expires))
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+
+    def generation(self, corpus: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT gen FROM generations WHERE corpus = ?", (corpus,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, corpus: str) -> int:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO generations (corpus, gen) VALUES (?, 1) "
+                "ON CONFLICT(corpus) DO UPDATE SET gen = gen + 1", (corpus,))
+            return self._conn.execute("SELECT gen FROM generations WHERE corpus = ?", (corpus,)).fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"path": self.path, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None}
+
+
+# Memory partitions: every corpus of the registry (registry.py) gets its own bounded LRU, so a
+# traffic spike for one city cannot evict the cached answers of another. The partition is picked
+# from the request context (like metrics/budget), so call sites stay the same.
+_partition = contextvars.ContextVar("cache_partition", default=None)
+_partition_sizes = {}  # partition -> maxsize (None: ANSWER_CACHE_SIZE)
+
+def use_partition(name: str | None, maxsize: int | None = None):
+    """Routes memory-cache reads/writes of the current request context to partition `name`."""
+    if maxsize:
+        _partition_sizes[name] = maxsize
+    _partition.set(name)
+
+def current_partition() -> str | None:
+    return _partition.get()
+
+
+class AnswerCache:
+    """Two-level cache: memory first (one LRU per partition), then (optionally) the shared SQLite tier."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float, disk: SqliteCache | None = None):
+        self.name = name
+        self.maxsize, self.ttl = maxsize, ttl
+        self._memories = {}  # partition -> TTLCache
+        self._lock = threading.Lock()
+        self.disk = disk
+        self.disk_hits = 0
+
+    @property
+    def memory(self) -> TTLCache:
+        part = _partition.get()
+        mem = self._memories.get(part)
+        if mem is None:
+            with self._lock:
+                mem = self._memories.get(part)
+                if mem is None:
+                    mem = self._memories[part] = TTLCache(_partition_sizes.get(part) or self.maxsize, self.ttl)
+        mem.maxsize = _partition_sizes.get(part) or self.maxsize  # a registry reload may resize it
+        return mem
+
+    def get(self, key: str):
+        memory = self.memory
+        value = memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(f"{self.name}:{key}")
+            if value is not None:
+                self.disk_hits += 1
+                memory.set(key, value)  # promote
+        record_cache(self.name, value is not None)
+        return value
+
+    def set(self, key: str, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(f"{self.name}:{key}", value)
+
+    def clear(self):
+        with self._lock:
+            memories = list(self._memories.values())
+        for mem in memories:
+            mem.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            memories = dict(self._memories)
+        parts = {part: mem.stats() for part, mem in memories.items()}
+        if list(parts) in ([], [None]):  # single corpus: as before
+            out = parts.get(None) or TTLCache(self.maxsize, self.ttl).stats()
+        else:
+            out = {k: sum(p[k] for p in parts.values()) for k in ("size", "maxsize", "hits", "misses", "evictions")}
+            total = out["hits"] + out["misses"]
+            out["hit_rate"] = round(out["hits"] / total, 3) if total else None
+            out["partitions"] = {part or "default": p for part, p in parts.items()}
+        if self.disk is not None:
+            out["disk_hits"] = self.disk_hits
+        return out
+
+
+DISK_CACHE = SqliteCache(ANSWER_CACHE_DB, ANSWER_CACHE_TTL) if ANSWER_CACHE_DB else None
+HITS_CACHE = AnswerCache("hits", ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, DISK_CACHE)
+SUMMARY_CACHE = AnswerCache("summary", ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, DISK_CACHE)
+
+_generations = {}  # corpus id -> (checked_at, gen)
+_generations_lock = threading.Lock()
+
+def corpus_generation(corpus_name: str) -> int:
+    """Bumped on every corpus rebuild; part of every hits key, so stale entries are never read."""
+    key = _corpus_key(corpus_name)
+    now = time.monotonic()
+    with _generations_lock:
+        entry = _generations.get(key)
+        if entry is not None and (DISK_CACHE is None or now - entry[0] < GENERATION_CHECK_INTERVAL):
+            return entry[1]
+    gen = DISK_CACHE.generation(key) if DISK_CACHE is not None else 0
+    with _generations_lock:
+        _generations[key] = (now, gen)
+    return gen
+
+def invalidate_corpus(corpus_name: str):
+    """Call after a corpus was rebuilt/changed: drops its cached hits in this and (via SQLite) other workers."""
+    key = _corpus_key(corpus_name)
+    with _generations_lock:
+        gen = DISK_CACHE.bump_generation(key) if DISK_CACHE is not None else _generations.get(key, (0, 0))[1] + 1
+        _generations[key] = (time.monotonic(), gen)
+    # Old-generation hits are unreachable now; clear memory to free them right away.
+    # Summaries are keyed on the quotes themselves and stay valid.
+    HITS_CACHE.clear()
+
+def hits_key(corpus_name: str, question: str, party: str, k: int) -> str:
+    key = _corpus_key(corpus_name)
+    return json.dumps([key, corpus_generation(key), normalize_question(question), _norm(party), k], ensure_ascii=False)
+
+def quotes_hash(quotes) -> str:
+    blob = json.dumps([[q.get("section"), q.get("quote")] for q in quotes], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+def summary_key(question: str, quotes) -> str:
+    return json.dumps([normalize_question(question), quotes_hash(quotes)], ensure_ascii=False)
+
+def cache_stats() -> dict:
+    out = {"hits": HITS_CACHE.stats(), "summaries": SUMMARY_CACHE.stats(), "in_flight": flight_stats()}
+    if DISK_CACHE is not None:
+        out["disk"] = DISK_CACHE.stats()
+    return out
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls (threads): the first caller for a key runs fn(), everybody
+    arriving while it runs waits for and shares its result - or its exception.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self.calls = self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return fut.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class FlightAborted(Exception):
+    """The leading call went away without a result (e.g. its client disconnected mid-stream)."""
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight; the shared call runs as its own task, so one waiter
+    being cancelled (client gone) does not cancel it for the others."""
+
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Future
+        self.calls = self.shared = 0
+
+    async def do(self, key, coro_fn):
+        fut = self._calls.get(key)
+        if fut is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(fut)
+            except FlightAborted:
+                return await coro_fn()
+        self.calls += 1
+        task = asyncio.ensure_future(coro_fn())
+        self._calls[key] = task
+
+        def _done(t):
+            if self._calls.get(key) is t:
+                del self._calls[key]
+        task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def pending(self, key):
+        """The in-flight future for key, if any (for callers that cannot go through do(), e.g. streams)."""
+        fut = self._calls.get(key)
+        if fut is not None:
+            self.shared += 1
+        return fut
+
+    def claim(self, key) -> asyncio.Future:
+        """Registers a manually resolved flight; resolve it with resolve() in a finally block."""
+        self.calls += 1
+        fut = self._calls[key] = asyncio.get_running_loop().create_future()
+        return fut
+
+    def resolve(self, key, fut: asyncio.Future, result=None, error: BaseException | None = None):
+        if self._calls.get(key) is fut:
+            del self._calls[key]
+        if not fut.done():
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+            fut.exception()  # mark as retrieved: nobody may be waiting
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+# Identical in-flight requests (same normalized question/party/k/corpus, or question + quotes) share
+# one upstream call. Separate from the caches: protects the quota before an entry exists.
+RETRIEVAL_FLIGHTS = SingleFlight()
+SUMMARY_FLIGHTS = SingleFlight()
+RETRIEVAL_FLIGHTS_ASYNC = AsyncSingleFlight()
+SUMMARY_FLIGHTS_ASYNC = AsyncSingleFlight()
+
+def flight_stats() -> dict:
+    return {
+        "retrieval": RETRIEVAL_FLIGHTS.stats(), "summaries": SUMMARY_FLIGHTS.stats(),
+        "retrieval_async": RETRIEVAL_FLIGHTS_ASYNC.stats(), "summaries_async": SUMMARY_FLIGHTS_ASYNC.stats(),
+    }
@@ -0,0 +1,118 @@
+import os, re
+from typing import List, Dict, Any
+from utils import estimate_tokens
+
+# Prompt context for the summaries: passages are numbered like in the UI (position in `quotes`,
+# 1-based) and then made smaller without renumbering: sentences already seen in a higher-ranked
+# passage are dropped (overlapping chunks), passages that become empty are folded into the one that
+# contains them ("[1 & 4]", or a reference if their section differs), passages of the same section
+# share one header, and the lowest-ranked passages are cut sentence by sentence until the estimated
+# tokens fit PROMPT_CONTEXT_TOKENS.
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1500"))  # per party; <= 0: no trimming
+PROMPT_DEDUP = os.getenv("PROMPT_DEDUP", "1") not in ("0", "false", "no", "off")
+_MIN_SENTENCE_CHARS = 20  # shorter fragments ("Dafür setzen wir uns ein:") are never deduplicated
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s.strip()]
+
+def _sentence_key(s: str) -> str:
+    return re.sub(r"\W+", " ", s.lower()).strip()
+
+def format_quotes_plain(quotes: List[Dict[str, Any]]) -> str:
+    """Every passage in full with its own header (the context before deduplication/trimming)."""
+    ctx_lines = []
+    for i, q in enumerate(quotes, 1):
+        sec = (q.get("section") or "").strip()
+        if sec:
+            ctx_lines.append(f"[{i}] (Section: {sec})\n{q['quote']}")
+        else:
+            ctx_lines.append(f"[{i}]\n{q['quote']}")
+    return "\n\n".join(ctx_lines)
+
+def _passages(quotes: List[Dict[str, Any]]) -> List[dict]:
+    """[{'nums': [1, 4], 'section': ..., 'sentences': [...]}] in rank order, duplicates folded in."""
+    out, owner = [], {}  # sentence key -> passage it was kept in
+    for i, q in enumerate(quotes, 1):
+        sentences = _sentences(q.get("quote", ""))
+        p = {"nums": [i], "section": (q.get("section") or "").strip(), "sentences": []}
+        first_dup, dup_keys = None, set()
+        for s in sentences:
+            key = _sentence_key(s)
+            if PROMPT_DEDUP and len(key) >= _MIN_SENTENCE_CHARS and key in owner:
+                first_dup = first_dup or owner[key]
+                if owner[key] is first_dup:
+                    dup_keys.add(key)
+                continue
+            p["sentences"].append(s)
+        if sentences and not p["sentences"] and first_dup is not None:
+            if first_dup["section"] == p["section"]:
+                first_dup["nums"].append(i)  # nothing new: same passage as far as the summary is concerned
+                continue
+            # Same text under another section: keep the section, point to the text (and remember it in
+            # case the target gets trimmed, see _resolve_references)
+            p["sentences"] = [f"(Text wie Passage {first_dup['nums'][0]})"]
+            p["ref"] = {"target": first_dup, "keys": dup_keys, "sentences": sentences}
+        for s in p["sentences"]:
+            owner.setdefault(_sentence_key(s), p)
+        out.append(p)
+    return out
+
+def _resolve_references(passages: List[dict]) -> None:
+    """A reference whose target lost the referenced sentences to trimming gets its own text back."""
+    for p in passages:
+        ref = p.get("ref")
+        if not ref or not p["sentences"]:
+            continue
+        kept = {_sentence_key(s) for s in ref["target"]["sentences"]}
+        if not ref["keys"] <= kept:
+            p["sentences"] = list(ref["sentences"])
+            del p["ref"]
+
+def _label(nums: List[int]) -> str:
+    return "[" + " & ".join(str(n) for n in nums) + "]"
+
+def _render(passages: List[dict]) -> str:
+    # Passages of one section are grouped under a single header, at the position of the best of them
+    groups, order = {}, []
+    for p in passages:
+        if not p["sentences"]:
+            continue
+        key = p["section"] or f"#{p['nums'][0]}"
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(p)
+    blocks = []
+    for key in order:
+        ps = groups[key]
+        sec = ps[0]["section"]
+        if len(ps) == 1:
+            head = f"{_label(ps[0]['nums'])} (Section: {sec})" if sec else _label(ps[0]["nums"])
+            blocks.append(f"{head}\n{' '.join(ps[0]['sentences'])}")
+        else:
+            body = "\n".join(f"{_label(p['nums'])} {' '.join(p['sentences'])}" for p in ps)
+            blocks.append(f"(Section: {sec})\n{body}")
+    return "\n\n".join(blocks)
+
+def build_context(quotes: List[Dict[str, Any]], token_budget: int | None = None) -> tuple[str, dict]:
+    """Returns (context text, stats) with stats = estimated tokens before/after and what was removed."""
+    budget = PROMPT_CONTEXT_TOKENS if token_budget is None else token_budget
+    full = estimate_tokens(format_quotes_plain(quotes))
+    passages = _passages(quotes)
+    merged = sum(len(p["nums"]) - 1 for p in passages)
+    text, trimmed = _render(passages), 0
+    if budget > 0:
+        tokens = estimate_tokens(text)
+        # Cut from the lowest-ranked passage upwards; the first sentence of passage 1 always stays
+        for p in reversed(passages):
+            while tokens > budget and len(p["sentences"]) > (1 if p is passages[0] else 0):
+                tokens -= estimate_tokens(p["sentences"].pop())
+                trimmed += 1
+            if tokens <= budget:
+                break
+        if trimmed:
+            _resolve_references(passages)
+            text = _render(passages)
+    return text, {"tokens_full": full, "tokens": estimate_tokens(text), "merged": merged, "trimmed_sentences": trimmed}
@@ -1,6 +1,26 @@
-import requests, json
+import requests, json, os, threading, time, unicodedata, hashlib
 from collections import defaultdict
-from utils import _post, _get, _check_key
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from utils import _post, _post_with_retry, _get, _delete, _check_key, _norm, _corpus_key, _meta_get, count_tokens, BASE
+from cache import invalidate_corpus
+from metrics import stage
+
+# Corpus build settings (build_lokalomat_corpus)
+CORPUS_DISPLAY_NAME = os.getenv("CORPUS_DISPLAY_NAME", "Kommunal-O-Mat Dortmund 2025")
+CORPUS_ID = os.getenv("CORPUS_ID")            # optional fixed id, else the API assigns one
+CITY = os.getenv("CORPUS_CITY", "Dortmund")
+YEAR = os.getenv("CORPUS_YEAR", "2025")
+BATCH_SIZE = int(os.getenv("CHUNK_BATCH_SIZE", "100"))          # chunks per batchCreate (API max: 100)
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))  # batches uploaded concurrently
+
+# Process-wide cache of the party → document map per corpus (see party_doc_map)
+PARTY_DOC_MAP_TTL = float(os.getenv("PARTY_DOC_MAP_TTL", "3600"))  # seconds; <= 0 disables expiry
+PARTY_DOC_MAP_STATS = {"hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0}
+_party_doc_maps = {}  # corpus id -> (loaded_at, by_norm, party_map)
+_party_doc_maps_lock = threading.Lock()  # guards the two below, never held while listing
+_party_doc_map_locks = {}  # corpus id -> lock held while that corpus is listed
+_party_doc_map_refreshing = set()  # corpus ids with a background refresh running
 
 def corpora_list():
     return _get(f"{BASE}/corpora").json().get("corpora", [])
@@ -8,8 +28,16 @@ def corpora_list():
 def corpora_delete(corpus_name, force=True):
     url = f"{BASE}/{corpus_name}"
     params = {"force": str(force).lower()}
-    r = requests.delete(url, headers=HEADERS, params=params)
-    r.raise_for_status()
+    _delete(url, params)
+    invalidate_party_doc_map(corpus_name)
+    invalidate_corpus(corpus_name)
+
+def corpora_find(display_name, corpus_id=None):
+    """Name of an existing corpus with that id or display name, else None (read-only)."""
+    for c in corpora_list():
+        if (corpus_id and c["name"] == f"corpora/{corpus_id}") or c.get("displayName") == display_name:
+            return c["name"]
+    return None
 
 def corpora_create(display_name, corpus_id=None):
     body = {"displayName": display_name}
@@ -17,15 +45,15 @@ def corpora_create(display_name, corpus_id=None):
         body["name"] = f"corpora/{corpus_id}"
     r = _post(f"{BASE}/corpora", body)
     if r.status_code == 409:  # already exists
-        for c in corpora_list():
-            if (corpus_id and c["name"] == f"corpora/{corpus_id}") or c.get("displayName") == display_name:
-                return c["name"]
-        raise RuntimeError("Corpus exists but not found via list()")
+        name = corpora_find(display_name, corpus_id)
+        if name is None:
+            raise RuntimeError("Corpus exists but not found via list()")
+        return name
     return r.json()["name"]
 
 def documents_list(
         corpus_name, 
-        BASE_API = "https://generativelanguage.googleapis.com/v1beta", 
+        BASE_API = BASE, 
         page_size=20
         ):
     url = f"{BASE_API}/corpora/{corpus_name}/documents"
@@ -45,15 +73,122 @@ def documents_create(corpus_name, display_name, custom_metadata=None):
     body = {"displayName": display_name}
     if custom_metadata:
         body["customMetadata"] = custom_metadata
-    return _post(f"{BASE}/{corpus_name}/documents", body).json()["name"]
+    name = _post(f"{BASE}/{corpus_name}/documents", body).json()["name"]
+    invalidate_party_doc_map(corpus_name)
+    return name
+
+def _load_party_doc_map(corpus_name: str):
+    docs = documents_list(_corpus_key(corpus_name))
+    by_norm = { _norm(d["displayName"]): d["name"] for d in docs }
+    party_map = { _norm(d["displayName"]): d["displayName"] for d in docs }
+    return by_norm, party_map
+
+def _fresh(entry) -> bool:
+    return entry is not None and (PARTY_DOC_MAP_TTL <= 0 or time.monotonic() - entry[0] < PARTY_DOC_MAP_TTL)
+
+def _corpus_lock(key: str) -> threading.Lock:
+    with _party_doc_maps_lock:
+        return _party_doc_map_locks.setdefault(key, threading.Lock())
+
+def _list_into_cache(key: str):
+    with stage("doc_listing"):
+        by_norm, party_map = _load_party_doc_map(key)
+    _party_doc_maps[key] = (time.monotonic(), by_norm, party_map)
+    return by_norm, party_map
+
+def _refresh_in_background(key: str):
+    with _party_doc_maps_lock:
+        if key in _party_doc_map_refreshing:
+            return
+        _party_doc_map_refreshing.add(key)
+
+    def _run():
+        try:
+            with _corpus_lock(key):
+                _list_into_cache(key)
+        except Exception as e:
+            print(f"Refreshing the party→document map of {key} failed, keeping the old one: {e}", flush=True)
+        finally:
+            with _party_doc_maps_lock:
+                _party_doc_map_refreshing.discard(key)
+    threading.Thread(target=_run, name=f"party-doc-map-{key}", daemon=True).start()
+
+def cached_party_doc_map(corpus_name: str):
+    """(by_norm, party_map) from the cache, else None; never lists. An expired map is still returned
+    while a background thread lists the documents again."""
+    key = _corpus_key(corpus_name)
+    entry = _party_doc_maps.get(key)
+    if entry is None:
+        return None
+    PARTY_DOC_MAP_STATS["hits"] += 1
+    if not _fresh(entry):
+        PARTY_DOC_MAP_STATS["refreshes"] += 1
+        _refresh_in_background(key)
+    return entry[1], entry[2]
+
+def party_doc_map(corpus_name: str, *, refresh: bool = False):
+    """
+    Returns (by_norm, party_map) for the corpus, i.e. _norm(displayName) -> document name
+    and _norm(displayName) -> displayName. The documents are only listed on the first call,
+    on refresh=True or after invalidate_party_doc_map(); after PARTY_DOC_MAP_TTL seconds the
+    old map is served while it is listed again in the background.
+    """
+    if not refresh:
+        maps = cached_party_doc_map(corpus_name)
+        if maps is not None:
+            return maps
+    key = _corpus_key(corpus_name)
+    waiting_since = time.monotonic()
+    # One listing per corpus at a time: concurrent first requests wait for it instead of racing,
+    # requests for other corpora are not blocked
+    with _corpus_lock(key):
+        entry = _party_doc_maps.get(key)
+        if entry is not None and (not refresh or entry[0] >= waiting_since):
+            PARTY_DOC_MAP_STATS["hits"] += 1  # listed by the request we waited for
+            return entry[1], entry[2]
+        PARTY_DOC_MAP_STATS["misses"] += 1
+        if entry is not None:
+            PARTY_DOC_MAP_STATS["refreshes"] += 1
+        return _list_into_cache(key)
+
+def invalidate_party_doc_map(corpus_name: str | None = None):
+    """Drops the cached map for one corpus (or all corpora); the next lookup lists again."""
+    with _party_doc_maps_lock:
+        if corpus_name is None:
+            _party_doc_maps.clear()
+        else:
+            _party_doc_maps.pop(_corpus_key(corpus_name), None)
+        PARTY_DOC_MAP_STATS["invalidations"] += 1
 
 def ensure_document(corpus_name, display_name, custom_metadata=None):
-    for d in documents_list(corpus_name):
+    for d in documents_list(_corpus_key(corpus_name)):
         if d.get("displayName") == display_name:
             return d["name"]
     return documents_create(corpus_name, display_name, custom_metadata)
 
-def _mk_payload(items):
+def chunks_list(document_name, page_size=100):
+    url = f"{BASE}/{document_name}/chunks"
+    out, token = [], None
+    while True:
+        params = {"pageSize": page_size}
+        if token:
+            params["pageToken"] = token
+        data = _get(url, params).json()
+        out.extend(data.get("chunks", []))
+        token = data.get("nextPageToken")
+        if not token:
+            break
+    return out
+
+def chunks_batch_delete(document_name, chunk_names):
+    url = f"{BASE}/{document_name}/chunks:batchDelete"
+    for i in range(0, len(chunk_names), BATCH_SIZE):
+        _post_with_retry(url, {"requests": [{"name": n} for n in chunk_names[i:i+BATCH_SIZE]]})
+
+def nfc(s: str) -> str:
+    return unicodedata.normalize("NFC", s)
+
+def _mk_payload(document_name, items):
         return {"requests": [{
             "parent": document_name,
             "chunk": {
@@ -62,101 +197,358 @@ def _mk_payload(items):
             }
         } for it in items]}
 
-def chunks_batch_create(document_name, chunk_items, *, diagnose_tokens=False):
+# Chunks the API rejects are written here (one JSON line each) instead of aborting the build
+QUARANTINE_FILE = os.getenv("CHUNK_QUARANTINE_FILE", "quarantine.jsonl")
+_quarantine_lock = threading.Lock()
+
+def _control_chars(s):
+    # tab=9, lf=10, cr=13 are fine; others under 32 are suspicious
+    return [c for c in s if ord(c) < 9 or (11 <= ord(c) <= 12) or (14 <= ord(c) <= 31)]
+
+def _rejection(document_name, index, item, resp, diagnose_tokens=False):
+    s = item["stringValue"]
+    entry = {
+        "document": document_name, "index": index,
+        "status": resp.status_code if resp is not None else None,
+        "reason": resp.text[:800] if resp is not None else None,
+        "chars": len(s) if isinstance(s, str) else None,
+        "stringValue": s, "customMetadata": item.get("customMetadata", []),
+    }
+    if not isinstance(s, str):
+        entry["hint"] = "not a string"
+    elif s.strip() == "":
+        entry["hint"] = "empty/whitespace-only chunk"
+    elif _control_chars(s):
+        entry["hint"] = f"control chars {[hex(ord(c)) for c in _control_chars(s)[:5]]}"
+    if diagnose_tokens and isinstance(s, str):
+        # optional token count (costs one API call, only for the rejected chunk)
+        try:
+            entry["tokens"] = count_tokens(s)
+        except Exception as ce:
+            entry["tokens"] = f"countTokens failed: {ce}"
+    return entry
+
+def quarantine_chunks(rejected, path=None):
+    """Appends rejected chunk entries (see chunks_batch_create) to the JSONL report."""
+    if not rejected:
+        return
+    with _quarantine_lock, Path(path or QUARANTINE_FILE).open("a", encoding="utf-8") as f:
+        for entry in rejected:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def _content_error(resp) -> bool:
+    """True if the API rejected the chunks themselves (400 INVALID_ARGUMENT), not the whole request."""
+    if resp is None or resp.status_code != 400:
+        return False
+    try:
+        status = resp.json().get("error", {}).get("status")
+    except ValueError:
+        return True  # 400 without a JSON body: still about the payload
+    return status in (None, "INVALID_ARGUMENT")
+
+def _bisect_upload(url, document_name, items, offset, rejected, diagnose_tokens):
+    try:
+        _post_with_retry(url, _mk_payload(document_name, items))
+        return
+    except requests.HTTPError as e:
+        resp = e.response
+        # 429/5xx survived all retries, or 401/403/404 (key, permission, deleted corpus/document):
+        # the same for every chunk, so splitting the batch would only repeat the error - abort
+        if not _content_error(resp):
+            raise
+        if len(items) == 1:
+            print(f"  ❌ item {offset} REJECTED (HTTP {resp.status_code})")
+            rejected.append(_rejection(document_name, offset, items[0], resp, diagnose_tokens))
+            return
+    # Content error somewhere in here: split in halves, upload what is good, recurse into the rest
+    mid = len(items) // 2
+    _bisect_upload(url, document_name, items[:mid], offset, rejected, diagnose_tokens)
+    _bisect_upload(url, document_name, items[mid:], offset + mid, rejected, diagnose_tokens)
+
+def chunks_batch_create(document_name, chunk_items, *, diagnose_tokens=False, quarantine=None):
+    """
+    Uploads chunk_items in batches of BATCH_SIZE. A batch rejected with a 400 is bisected, so the
+    good chunks still get uploaded and each bad one is found in O(log n) extra calls.
+    Rejected chunks are appended to the `quarantine` JSONL report and returned; without a
+    quarantine path the first rejection is raised once the rest of the batch is uploaded.
+    """
     url = f"{BASE}/{document_name}/chunks:batchCreate"
+    rejected = []
 
     for i in range(0, len(chunk_items), BATCH_SIZE):
         batch = chunk_items[i:i+BATCH_SIZE]
+        found = len(rejected)
         try:
-            _post(url, _mk_payload(batch))
+            _bisect_upload(url, document_name, batch, i, rejected, diagnose_tokens)
         except requests.HTTPError as e:
-            resp = e.response
-            print(f"⚠️ batchCreate failed (HTTP {resp.status_code}) for batch {i}-{i+len(batch)-1}")
-            try:
-                print("Server says:", resp.text[:800])
-            except Exception:
-                pass
-
-            # Fallback: find the bad item(s)
-            print("→ Diagnosing items in this batch individually ...")
-            for j, it in enumerate(batch, start=i):
-                s = it["stringValue"]
-                if not isinstance(s, str):
-                    print(f"  ❌ item {j}: not a string")
-                    continue
-                if s.strip() == "":
-                    print(f"  ❌ item {j}: empty/whitespace-only chunk")
-                    continue
-                bad_chars = [c for c in s if ord(c) < 9 or (11 <= ord(c) <= 12) or (14 <= ord(c) <= 31)]
-                # (tab=9, lf=10, cr=13 are fine; others under 32 are suspicious)
-                if bad_chars:
-                    print(f"  ⚠️ item {j}: contains control chars {[hex(ord(c)) for c in bad_chars[:5]]} (showing up to 5)")
-
-                # optional token count (costs API calls)
-                tok = None
-                if diagnose_tokens:
-                    try:
-                        tok = count_tokens(s)  # uses gemini-1.5-flash:countTokens
-                    except Exception as ce:
-                        tok = f"countTokens failed: {ce}"
-
-                # Try uploading this single chunk to confirm failure
-                try:
-                    _post(url, _mk_payload([it]))
-                except requests.HTTPError as e2:
-                    print(f"  ❌ item {j} REJECTED")
-                    print(f"     chars={len(s)} tokens={tok}")
-                    print("     head:", s[:120].replace("\n"," ⏎ "))
-                    print("     tail:", s[-120:].replace("\n"," ⏎ "))
-                else:
-                    print(f"  ✅ item {j} OK (chars={len(s)} tokens={tok})")
-
-            # Stop here so you can fix the offending chunk(s) upstream
+            print(f"⚠️ batchCreate failed (HTTP {e.response.status_code if e.response is not None else '?'}) "
+                  f"for batch {i}-{i+len(batch)-1}")
             raise
+        if len(rejected) > found:
+            print(f"⚠️ batch {i}-{i+len(batch)-1}: {len(rejected) - found} chunk(s) rejected, "
+                  f"{len(batch) - len(rejected) + found} uploaded")
+
+    if quarantine:
+        quarantine_chunks(rejected, quarantine)
+    elif rejected:
+        first = rejected[0]
+        raise ValueError(f"{len(rejected)} chunk(s) rejected for {document_name}, "
+                         f"first (item {first['index']}): {first['reason']}")
+    return rejected
+
+def iter_records(jsonl_file):
+    """Reads the JSONL lazily, one NFC-normalised record (party, section, text) at a time."""
+    with Path(jsonl_file).open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            # NFC everywhere (text + metadata)
+            yield {
+                "party":   nfc(rec["party"]),
+                "section": nfc(rec.get("section", "")),
+                "text":    nfc(rec["text"]),  # content unchanged except normalization
+            }
+
+def record_hash(rec: dict) -> str:
+    """Content hash of a (NFC-normalised) record; stored as chunk metadata `hash` for incremental sync."""
+    blob = "\x1f".join((rec["party"], rec["section"], rec["text"]))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+def _chunk_item(rec: dict) -> dict:
+    # one JSON record => one Chunk
+    return {
+        "stringValue": rec["text"],
+        "customMetadata": [
+            {"key": "party",   "stringValue": rec["party"]},
+            {"key": "section", "stringValue": rec["section"]},
+            {"key": "city",    "stringValue": CITY},
+            {"key": "year",    "stringValue": YEAR},
+            {"key": "hash",    "stringValue": record_hash(rec)},
+        ]
+    }
+
+def _party_document(corpus_name, party, doc_by_party):
+    if party not in doc_by_party:
+        doc_by_party[party] = ensure_document(
+            corpus_name,
+            display_name=party,
+            custom_metadata=[
+                {"key": "party", "stringValue": party},
+                {"key": "city",  "stringValue": CITY},
+                {"key": "year",  "stringValue": YEAR},
+            ],
+        )
+    return doc_by_party[party]
+
+
+def _preflight_first(jsonl_file, validate):
+    """Runs the whole file through the local pre-flight before anything is created remotely and
+    raises if records would be skipped or rejected, so a bad input never leaves a half-built corpus."""
+    if not validate:
+        return
+    from preflight import FATAL, preflight
+    r = preflight(jsonl_file)
+    fatal = {kind: n for kind, n in r["issues"].items() if kind in FATAL}
+    if fatal:
+        examples = [f"line {e['line']}: {e['kind']} {e['detail']}".strip() for e in r["examples"] if e["kind"] in fatal]
+        raise ValueError(f"Pre-flight failed for {jsonl_file}, nothing uploaded "
+                         f"({', '.join(f'{k} {n}' for k, n in sorted(fatal.items()))}): {'; '.join(examples[:5])}")
+    print(f"Pre-flight: {r['records']} records → {r['chunks']} chunks, max ~{r['tokens']['max']} tokens")
+
+def _records(jsonl_file, validate):
+    """(records, pre-flight report or None) for the build/sync loops."""
+    if not validate:
+        return iter_records(jsonl_file), None
+    from preflight import PreflightReport, iter_clean_records
+    report = PreflightReport()
+    return iter_clean_records(jsonl_file, report=report), report
+
+def _print_preflight(report):
+    if report is not None and (report.skipped or report.split or report.issues):
+        issues = ", ".join(f"{kind} {n}" for kind, n in sorted(report.issues.items()))
+        print(f"Pre-flight: {report.skipped} record(s) skipped, {report.split} split ({issues})")
+
+class _UploadPipeline:
+    """
+    Uploads batches on a bounded thread pool while the caller keeps reading records.
+    At most 2 * max_workers batches are queued, so memory stays flat for any file size.
+    """
+
+    def __init__(self, max_workers: int, upload, report_every: float = 5.0):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(2 * max_workers)
+        self._upload = upload
+        self._lock = threading.Lock()
+        self._futures = []
+        self.errors = []
+        self.chunks_done = self.batches_done = self.rejected = 0
+        self._started = time.monotonic()
+        self._last_report = self._started
+        self._report_every = report_every
 
-def build_lokalomat_corpus(jsonl_file):
+    def submit(self, document_name: str, batch: list):
+        self._slots.acquire()  # backpressure: wait while too many batches are queued
+        fut = self._pool.submit(self._upload, document_name, batch)
+        fut.add_done_callback(lambda f, n=len(batch), d=document_name: self._done(f, n, d))
+        self._futures.append(fut)
+
+    def _done(self, fut, n, document_name):
+        self._slots.release()
+        with self._lock:
+            if fut.exception() is not None:
+                self.errors.append((document_name, fut.exception()))
+                return
+            rejected = len(fut.result() or ())
+            self.rejected += rejected
+            self.chunks_done += n - rejected
+            self.batches_done += 1
+            now = time.monotonic()
+            if now - self._last_report >= self._report_every:
+                self._last_report = now
+                print(f"  ↑ {self.chunks_done} chunks in {self.batches_done} batches "
+                      f"({self.throughput():.1f} chunks/s)", flush=True)
+
+    def throughput(self) -> float:
+        return self.chunks_done / max(time.monotonic() - self._started, 1e-9)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        return time.monotonic() - self._started
+
+def build_lokalomat_corpus(jsonl_file, *, max_workers: int | None = None, batch_size: int | None = None,
+                           quarantine: str | None = None, validate: bool = True):
+    """
+    Streams the JSONL into the corpus: records are read lazily, grouped into per-party batches as
+    they arrive and uploaded concurrently (bounded by max_workers, default INGEST_MAX_WORKERS).
+    429/5xx responses are retried with jittered backoff; progress and chunks/s are printed.
+    Chunks the API rejects go to the quarantine report (default QUARANTINE_FILE), the build goes on.
+    With validate=True the whole file passes the local pre-flight before the corpus is created
+    (invalid or over-long records abort the build) and records are cleaned/split while uploading.
+    """
     _check_key()
+    _preflight_first(jsonl_file, validate)
 
     corpus_name = corpora_create(CORPUS_DISPLAY_NAME, CORPUS_ID)
     print("Using corpus:", corpus_name)
 
+    batch_size = min(batch_size or BATCH_SIZE, 100)
     doc_by_party = {}
-    pending = defaultdict(list)
-
-    with jsonl_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            rec = json.loads(line)
-
-            # NFC everywhere (text + metadata)
-            party   = nfc(rec["party"])
-            section = nfc(rec.get("section", ""))
-            text    = nfc(rec["text"])  # content unchanged except normalization
-
-            if party not in doc_by_party:
-                doc_by_party[party] = ensure_document(
-                    corpus_name,
-                    display_name=party,
-                    custom_metadata=[
-                        {"key": "party", "stringValue": party},
-                        {"key": "city",  "stringValue": CITY},
-                        {"key": "year",  "stringValue": YEAR},
-                    ],
-                )
-
-            # one JSON record => one Chunk
-            pending[doc_by_party[party]].append({
-                "stringValue": text,
-                "customMetadata": [
-                    {"key": "party",   "stringValue": party},
-                    {"key": "section", "stringValue": section},
-                    {"key": "city",    "stringValue": CITY},
-                    {"key": "year",    "stringValue": YEAR},
-                ]
-            })
-
-    for doc_name, items in pending.items():
-        print(f"Uploading {len(items)} chunks → {doc_name}")
-        chunks_batch_create(doc_name, items)
+    buffers = defaultdict(list)
+    quarantine = quarantine or QUARANTINE_FILE
+    upload = lambda doc_name, items: chunks_batch_create(doc_name, items, quarantine=quarantine)
+    pipeline = _UploadPipeline(max_workers or INGEST_MAX_WORKERS, upload)
+    records, checked = _records(jsonl_file, validate)
+    try:
+        for rec in records:
+            doc_name = _party_document(corpus_name, rec["party"], doc_by_party)
+            buffers[doc_name].append(_chunk_item(rec))
+            if len(buffers[doc_name]) >= batch_size:
+                pipeline.submit(doc_name, buffers.pop(doc_name))
+        for doc_name, items in buffers.items():
+            pipeline.submit(doc_name, items)
+    finally:
+        elapsed = pipeline.close()
 
+    print(f"Uploaded {pipeline.chunks_done} chunks in {pipeline.batches_done} batches "
+          f"in {elapsed:.1f}s ({pipeline.throughput():.1f} chunks/s)")
+    invalidate_corpus(corpus_name)  # cached hits refer to the previous contents
+    _print_preflight(checked)
+    if pipeline.rejected:
+        print(f"⚠️ {pipeline.rejected} chunk(s) rejected, see {quarantine}")
+    if pipeline.errors:
+        doc_name, err = pipeline.errors[0]
+        print(f"⚠️ {len(pipeline.errors)} batch(es) failed, first for {doc_name}: {err}")
+        raise err
     print("Done; corpus is ready.")
     return corpus_name
+
+def _remote_chunks_by_hash(corpus_name):
+    """{party: {hash: [chunk names]}} plus {party: document name} for what is in the corpus now."""
+    remote, doc_by_party = {}, {}
+    for d in documents_list(_corpus_key(corpus_name)):
+        party = nfc(d.get("displayName", ""))
+        doc_by_party[party] = d["name"]
+        by_hash = remote.setdefault(party, {})
+        for c in chunks_list(d["name"]):
+            # chunks uploaded before hashes were stored have none: they count as stale
+            h = _meta_get(c.get("customMetadata"), "hash", None) or f"nohash:{c['name']}"
+            by_hash.setdefault(h, []).append(c["name"])
+    return remote, doc_by_party
+
+def sync_lokalomat_corpus(jsonl_file, *, dry_run: bool = False, delete_stale: bool = True,
+                          max_workers: int | None = None, batch_size: int | None = None,
+                          quarantine: str | None = None, validate: bool = True):
+    """
+    Incremental alternative to a full rebuild: uploads only records whose content hash is not in
+    the corpus yet and deletes chunks whose hash no longer occurs in the JSONL. With dry_run=True
+    nothing is changed: an existing corpus is only looked up, without one every record "would add". Returns a per-party diff report {party: {"unchanged", "added", "stale"}}.
+    Rejected chunks are quarantined and records validated (up front) as in build_lokalomat_corpus;
+    quarantined chunks are retried by the next sync.
+    """
+    _check_key()
+    _preflight_first(jsonl_file, validate)
+
+    if dry_run:
+        corpus_name = corpora_find(CORPUS_DISPLAY_NAME, CORPUS_ID)
+        print("Syncing corpus:", (corpus_name or "(not created yet)") + " (dry run)")
+    else:
+        corpus_name = corpora_create(CORPUS_DISPLAY_NAME, CORPUS_ID)
+        print("Syncing corpus:", corpus_name)
+    remote, doc_by_party = _remote_chunks_by_hash(corpus_name) if corpus_name else ({}, {})
+    report = defaultdict(lambda: {"unchanged": 0, "added": 0, "stale": 0})
+
+    batch_size = min(batch_size or BATCH_SIZE, 100)
+    buffers = defaultdict(list)
+    seen = defaultdict(set)
+    quarantine = quarantine or QUARANTINE_FILE
+    upload = lambda doc_name, items: chunks_batch_create(doc_name, items, quarantine=quarantine)
+    pipeline = None if dry_run else _UploadPipeline(max_workers or INGEST_MAX_WORKERS, upload)
+    records, checked = _records(jsonl_file, validate)
+    try:
+        for rec in records:
+            party, h = rec["party"], record_hash(rec)
+            if h in seen[party]:
+                continue  # duplicate record in the file: one chunk is enough
+            seen[party].add(h)
+            if h in remote.get(party, {}):
+                report[party]["unchanged"] += 1
+                continue
+            report[party]["added"] += 1
+            if dry_run:
+                continue
+            doc_name = _party_document(corpus_name, party, doc_by_party)
+            buffers[doc_name].append(_chunk_item(rec))
+            if len(buffers[doc_name]) >= batch_size:
+                pipeline.submit(doc_name, buffers.pop(doc_name))
+        if pipeline is not None:
+            for doc_name, items in buffers.items():
+                pipeline.submit(doc_name, items)
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+    _print_preflight(checked)
+    if pipeline is not None and pipeline.rejected:
+        print(f"⚠️ {pipeline.rejected} chunk(s) rejected, see {quarantine}")
+    if pipeline is not None and pipeline.errors:
+        doc_name, err = pipeline.errors[0]
+        print(f"⚠️ {len(pipeline.errors)} batch(es) failed, first for {doc_name}: {err}")
+        raise err
+
+    for party, by_hash in remote.items():
+        # every chunk whose hash is gone from the file, plus extra copies of kept hashes
+        stale = [n for h, names in by_hash.items() for n in (names if h not in seen[party] else names[1:])]
+        report[party]["stale"] += len(stale)
+        if stale and delete_stale and not dry_run:
+            chunks_batch_delete(doc_by_party[party], stale)
+
+    added = sum(r["added"] for r in report.values())
+    stale = sum(r["stale"] for r in report.values())
+    for party, r in sorted(report.items()):
+        print(f"  {party}: +{r['added']} -{r['stale']} ={r['unchanged']}")
+    deleted = stale if delete_stale else 0
+    print(f"{'Would add' if dry_run else 'Added'} {added}, {'would delete' if dry_run else 'deleted'} "
+          f"{deleted} chunk(s); {stale} stale.")
+    if not dry_run and (added or deleted):
+        invalidate_corpus(corpus_name)
+    return dict(report)
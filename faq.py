@@ -0,0 +1,274 @@
+"""
+Offline FAQ runner: answers a list of known questions for all parties ahead of time (retrieval +
+summary, like POST /) and writes them to a compact store that the web app loads at startup
+(FAQ_STORE) and serves without any API call for the same normalized question.
+
+    python faq.py questions.txt --out faq_store.json.gz --concurrency 4
+    python faq.py questions.txt --entry bochum-2025      # corpus/parties/store from registry.py
+
+questions.txt has one question per line (# comments allowed) or is JSONL with a "question" field.
+Finished questions are appended to a checkpoint (<out>.partial.jsonl); after an interruption or when
+the quota runs out, the same command resumes where it stopped.
+"""
+import argparse, gzip, json, os, re, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+if __name__ == "__main__":
+    # CLI only, before the settings here and in utils/ratelimit/registry are read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from utils import normalize_question, estimate_tokens, submit_in_context, _corpus_key
+from registry import DEFAULT_PARTIES
+
+FAQ_STORE = os.getenv("FAQ_STORE")  # store loaded by the web app, e.g. faq_store.json.gz
+FAQ_CONCURRENCY = int(os.getenv("FAQ_CONCURRENCY", "4"))  # questions in flight (each queries all parties)
+# Stop after this many failed questions in a row: the quota is most likely used up
+FAQ_MAX_FAILURES = int(os.getenv("FAQ_MAX_FAILURES", "5"))
+# USD per million tokens for the cost estimate (gemini-2.0-flash list prices)
+FAQ_PRICE_INPUT_PER_M = float(os.getenv("FAQ_PRICE_INPUT_PER_M", "0.10"))
+FAQ_PRICE_OUTPUT_PER_M = float(os.getenv("FAQ_PRICE_OUTPUT_PER_M", "0.40"))
+STORE_VERSION = 1
+
+
+
+def faq_key(question: str) -> str:
+    # Case and punctuation do not matter: "Was tun gegen hohe Mieten?" == "was tun gegen hohe mieten"
+    return re.sub(r"[^\w]+", " ", normalize_question(question).lower()).strip()
+
+def _store_source(corpus_name: str) -> str:
+    # Same scope as the answer caches: remote corpus, or the build of the local index
+    from retrieval import _source
+    return _corpus_key(_source(corpus_name))
+
+def _open(path: str, mode: str, gz: bool | None = None):
+    gz = path.endswith(".gz") if gz is None else gz
+    return gzip.open(path, mode + "t", encoding="utf-8") if gz else open(path, mode, encoding="utf-8")
+
+
+#### Serving ----
+_stores = {}  # corpus source -> {"questions": {faq_key: {"question": ..., "answers": {party: answer}}}, ...}
+_load_attempted = set()  # corpora whose store was loaded (warm-up) or tried by the first lookup
+
+def load_store(path: str | None = None, corpus_name: str | None = None) -> int:
+    """Loads the store for the web app; returns the number of questions (0 if it does not match the corpus)."""
+    corpus_name = corpus_name or os.getenv("CORPUS_NAME")
+    _load_attempted.add(corpus_name)
+    path = path or FAQ_STORE
+    if not path:
+        return 0
+    with _open(path, "r") as f:
+        store = json.load(f)
+    if store.get("version") != STORE_VERSION:
+        raise ValueError(f"{path}: unknown store version {store.get('version')}")
+    if corpus_name and store.get("corpus") != _store_source(corpus_name):
+        # Answers from another corpus (or an older local index build) would be stale
+        print(f"FAQ store {path} is for {store.get('corpus')}, not {_store_source(corpus_name)}: ignored", flush=True)
+        return 0
+    store["path"] = path
+    _stores[store["corpus"]] = store
+    return len(store["questions"])
+
+def lookup(question: str, parties: list[str], k_retrieve: int | None = None, max_quotes: int | None = None,
+           corpus_name: str | None = None, path: str | None = None):
+    """Precomputed answers (copies, in the order of `parties`) if the corpus' store has every party, else None."""
+    corpus_name = corpus_name or os.getenv("CORPUS_NAME")
+    path = path or FAQ_STORE
+    if corpus_name not in _load_attempted and path:
+        try:
+            load_store(path, corpus_name=corpus_name)
+        except Exception as e:
+            print(f"Loading FAQ store {path} failed: {e}", flush=True)
+    store = _stores.get(_store_source(corpus_name)) if corpus_name else next(iter(_stores.values()), None)
+    if store is None:
+        return None
+    if (k_retrieve is not None and k_retrieve != store.get("k_retrieve")) or \
+            (max_quotes is not None and max_quotes != store.get("max_quotes")):
+        return None
+    entry = store["questions"].get(faq_key(question))
+    if entry is None or any(p not in entry["answers"] for p in parties):
+        return None
+    return [{**entry["answers"][p], "faq": True} for p in parties]
+
+def store_stats() -> dict:
+    if not _stores:
+        return {"loaded": False}
+    return {"loaded": True, "stores": [
+        {"corpus": c, "path": s.get("path"), "questions": len(s["questions"]), "created": s.get("created")}
+        for c, s in _stores.items()]}
+
+
+#### Batch run ----
+def read_questions(path: str) -> list[str]:
+    out, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            q = json.loads(line)["question"] if line.startswith("{") else line
+            if faq_key(q) not in seen:  # duplicates would only cost quota
+                seen.add(faq_key(q))
+                out.append(normalize_question(q))
+    return out
+
+def _read_checkpoint(path: str) -> dict:
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line of an interrupted run: the question is simply redone
+            done[rec["key"]] = rec
+    return done
+
+def answer_question(corpus_name: str, question: str, parties: list[str], k_retrieve: int, max_quotes: int) -> dict:
+    """All parties' answers incl. summaries; "complete" is False if any party failed (retried on resume)."""
+    from retrieval import answer_per_party_strict
+    from rag import summarize_from_quotes, prompt_tokens
+    t0 = time.perf_counter()
+    answers = answer_per_party_strict(corpus_name, question, parties, k_retrieve=k_retrieve, max_quotes=max_quotes)
+    tokens_in = tokens_out = 0
+
+    def _summarize(a):
+        try:
+            a["summary"] = summarize_from_quotes(question, a["quotes"])
+        except Exception as e:
+            a["summary_status"] = "error"
+            a["summary_error"] = str(e)
+
+    # Parties in parallel, like POST /; the generate limiter bounds the calls of all questions together
+    to_sum = [a for a in answers if a.get("status") == "ok" and a.get("quotes")]
+    if to_sum:
+        with ThreadPoolExecutor(max_workers=len(to_sum)) as pool:
+            for fut in [submit_in_context(pool, _summarize, a) for a in to_sum]:
+                fut.result()
+    for a in to_sum:
+        if a.get("summary"):
+            tokens_in += prompt_tokens(question, a["quotes"])
+            tokens_out += estimate_tokens(a["summary"])
+    complete = all(a.get("status") == "no_info" or (a.get("status") == "ok" and a.get("summary")) for a in answers)
+    return {
+        "key": faq_key(question), "question": question, "answers": dict(zip(parties, answers)),
+        "complete": complete, "seconds": round(time.perf_counter() - t0, 3),
+        "tokens_in": tokens_in, "tokens_out": tokens_out,
+    }
+
+def write_store(records, out: str, corpus_name: str, k_retrieve: int, max_quotes: int) -> int:
+    store = {
+        "version": STORE_VERSION, "corpus": _store_source(corpus_name), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "k_retrieve": k_retrieve, "max_quotes": max_quotes,
+        "questions": {r["key"]: {"question": r["question"], "answers": r["answers"]} for r in records},
+    }
+    tmp = out + ".tmp"
+    with _open(tmp, "w", gz=out.endswith(".gz")) as f:
+        json.dump(store, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, out)  # the web app never sees a half-written store
+    return len(store["questions"])
+
+def run(questions_file: str, out: str, corpus_name: str, parties: list[str], *, concurrency: int = FAQ_CONCURRENCY,
+        k_retrieve: int = 5, max_quotes: int = 5, max_failures: int = FAQ_MAX_FAILURES) -> dict:
+    import ratelimit
+    from semantic_cache import QUESTION_INDEX
+    QUESTION_INDEX.threshold = 1.0  # every FAQ question gets its own retrieval, not a neighbour's hits
+
+    checkpoint = out + ".partial.jsonl"
+    questions = read_questions(questions_file)
+    done = _read_checkpoint(checkpoint)
+    todo = [q for q in questions if faq_key(q) not in done]
+    print(f"{len(questions)} Fragen, {len(questions) - len(todo)} bereits im Checkpoint, {len(todo)} offen", flush=True)
+
+    calls_before = {k: (v["started"], v["throttled"]) for k, v in ratelimit.stats().items()}
+    stats = {"answered": 0, "failed": 0, "tokens_in": 0, "tokens_out": 0, "stopped": False}
+    failures_in_row = 0
+    t0 = time.perf_counter()
+    with open(checkpoint, "a", encoding="utf-8") as ckpt, ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futs = {submit_in_context(pool, answer_question, corpus_name, q, parties, k_retrieve, max_quotes): q
+                for q in todo}
+        for fut in as_completed(futs):
+            try:
+                rec = fut.result()
+            except Exception as e:
+                rec = {"question": futs[fut], "complete": False, "error": f"{type(e).__name__}: {e}"}
+            if rec["complete"]:
+                ckpt.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                ckpt.flush()
+                done[rec["key"]] = rec
+                stats["answered"] += 1
+                stats["tokens_in"] += rec["tokens_in"]
+                stats["tokens_out"] += rec["tokens_out"]
+                failures_in_row = 0
+            else:
+                stats["failed"] += 1
+                failures_in_row += 1
+                print(f"  unvollständig: {rec['question']} {rec.get('error', '')}", flush=True)
+            n = stats["answered"] + stats["failed"]
+            if n % 10 == 0 or n == len(todo):
+                print(f"  {n}/{len(todo)} ({stats['answered']} ok, {n / (time.perf_counter() - t0):.2f} Fragen/s)",
+                      flush=True)
+            if max_failures and failures_in_row >= max_failures:
+                stats["stopped"] = True
+                for f in futs:
+                    f.cancel()
+                print(f"Abbruch nach {failures_in_row} fehlgeschlagenen Fragen in Folge (Quota?). "
+                      "Derselbe Befehl setzt später fort.", flush=True)
+                break
+    elapsed = time.perf_counter() - t0
+
+    stored = write_store([done[faq_key(q)] for q in questions if faq_key(q) in done], out,
+                         corpus_name, k_retrieve, max_quotes)
+    if stored == len(questions):
+        os.remove(checkpoint)  # complete: the store has everything
+    calls = {k: {"calls": v["started"] - calls_before[k][0], "throttled": v["throttled"] - calls_before[k][1]}
+             for k, v in ratelimit.stats().items()}
+    cost = stats["tokens_in"] / 1e6 * FAQ_PRICE_INPUT_PER_M + stats["tokens_out"] / 1e6 * FAQ_PRICE_OUTPUT_PER_M
+    return {**stats, "questions": len(questions), "stored": stored, "seconds": round(elapsed, 1),
+            "questions_per_s": round(stats["answered"] / elapsed, 3) if elapsed else None,
+            "upstream": calls, "cost_usd": round(cost, 4)}
+
+def _print_summary(s: dict, parties: list[str]):
+    print(f"\nFertig in {s['seconds']:.1f}s: {s['answered']} Fragen beantwortet, {s['failed']} unvollständig, "
+          f"{s['stored']}/{s['questions']} im Store" + (" (abgebrochen)" if s["stopped"] else ""))
+    if s["questions_per_s"]:
+        print(f"Durchsatz: {s['questions_per_s']:.2f} Fragen/s = {s['questions_per_s'] * len(parties) * 60:.0f} Parteiantworten/min")
+    for cls, c in s["upstream"].items():
+        if c["calls"] or c["throttled"]:
+            print(f"API-Calls {cls}: {c['calls']} ({c['throttled']} × 429)")
+    print(f"Tokens (geschätzt): {s['tokens_in']} Eingabe, {s['tokens_out']} Ausgabe ≈ ${s['cost_usd']:.4f}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("questions", help="text file (one question per line) or JSONL with a 'question' field")
+    ap.add_argument("--entry", help="key in the corpus registry: its corpus, parties and faq_store are the defaults")
+    ap.add_argument("--out")
+    ap.add_argument("--corpus")
+    ap.add_argument("--parties", help="comma-separated")
+    ap.add_argument("--concurrency", type=int, default=FAQ_CONCURRENCY)
+    ap.add_argument("--k-retrieve", type=int, default=5, help="must match the web app (5) to be served")
+    ap.add_argument("--max-quotes", type=int, default=5)
+    ap.add_argument("--max-failures", type=int, default=FAQ_MAX_FAILURES, help="0 = never stop early")
+    args = ap.parse_args()
+    if args.entry:
+        from registry import REGISTRY, UnknownCorpus
+        try:
+            entry = REGISTRY.resolve(args.entry)
+        except UnknownCorpus:
+            sys.exit(f"'{args.entry}' ist nicht in der Korpus-Registry")
+        args.corpus = args.corpus or entry.corpus
+        args.parties = args.parties or ",".join(entry.parties)
+        args.out = args.out or entry.faq_store
+        entry.activate()  # the corpus' cache partition and upstream queue, also in the worker threads
+    args.corpus = args.corpus or os.getenv("CORPUS_NAME")
+    args.out = args.out or FAQ_STORE or "faq_store.json.gz"
+    if not args.corpus:
+        sys.exit("CORPUS_NAME, --corpus oder --entry angeben")
+    parties = [p.strip() for p in (args.parties or ",".join(DEFAULT_PARTIES)).split(",") if p.strip()]
+    s = run(args.questions, args.out, args.corpus, parties, concurrency=args.concurrency,
+            k_retrieve=args.k_retrieve, max_quotes=args.max_quotes, max_failures=args.max_failures)
+    _print_summary(s, parties)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Local retrieval backend (RETRIEVAL_BACKEND=local): BM25 over the same records the remote corpus is
+built from, optionally blended with a dense matrix. Answers corpora_query-style calls with hits in
+the API's `relevantChunks` shape, so retrieval.build_party_answer_from_hits works unchanged.
+
+    python local_index.py programme.jsonl --out local_index
+
+The index is a directory of .npy files that are memory-mapped on load (startup does not read them).
+"""
+import argparse, hashlib, importlib, json, os, re, threading, time
+from collections import Counter, defaultdict
+from pathlib import Path
+import numpy as np
+from utils import _norm
+from semantic_cache import _fold, embed_question
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_DENSE_WEIGHT = float(os.getenv("LOCAL_DENSE_WEIGHT", "0.3"))  # share of the dense score, if any
+# "module:function" embedding a query string with the same model as the index' --embeddings;
+# without it an index with external embeddings is searched with BM25 only
+LOCAL_QUERY_EMBEDDER = os.getenv("LOCAL_QUERY_EMBEDDER")
+BM25_K1, BM25_B = 1.2, 0.75
+
+# German function words; topic words (incl. "Stadt", "Partei") stay searchable
+_STOPWORDS = {_fold(w) for w in """
+der die das den dem des ein eine einen einem einer eines und oder aber doch sondern denn
+zu zum zur für in im ins am an auf aus mit bei von vom nach vor durch um über unter gegen ohne bis
+als auch noch nur schon sehr so wie wo was wer wann warum ob dass daß wenn weil damit
+ist sind war waren wird werden wurde wurden sein seine seiner ihr ihre ihren ihrem es sich sie er wir uns unser unsere
+hat haben hatte kann können soll sollen will wollen muss müssen nicht kein keine keinen mehr alle allen
+dies diese dieser dieses diesen dort hier man
+""".split()}
+_SUFFIXES = ("ern", "en", "er", "es", "e", "n", "s")
+
+def _stem(w: str) -> str:
+    # Light suffix stripping: "Wohnungen" / "Wohnung", "Radwege" / "Radweg" share a term
+    for suf in _SUFFIXES:
+        if len(w) - len(suf) >= 4 and w.endswith(suf):
+            return w[:-len(suf)]
+    return w
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(w) for w in re.findall(r"\w+", _fold(text)) if w not in _STOPWORDS and not w.isdigit()]
+
+
+def build_local_index(jsonl_file, out_dir=None, *, dense: bool = True, embeddings=None) -> dict:
+    """
+    Builds the index from the corpus JSONL (validated/split like build_lokalomat_corpus, so the
+    chunks are the same). Dense part: `embeddings` (n x d, one row per chunk in file order) if
+    supplied, else hashed n-gram vectors of semantic_cache.embed_question when dense=True.
+    """
+    from corpus import _chunk_item, record_hash
+    from preflight import iter_clean_records
+
+    out = Path(out_dir or LOCAL_INDEX_DIR)
+    out.mkdir(parents=True, exist_ok=True)
+    t0 = time.monotonic()
+
+    postings = defaultdict(list)  # term -> [(doc, tf)]
+    doc_len, party_ids, metadata, text_offsets, vectors = [], [], [], [0], []
+    parties, version = {}, hashlib.sha256()
+    with (out / "texts.bin").open("wb") as texts:
+        for doc, rec in enumerate(iter_clean_records(jsonl_file)):
+            terms = Counter(tokenize(rec["section"] + "\n" + rec["text"]))
+            for term, tf in terms.items():
+                postings[term].append((doc, tf))
+            doc_len.append(sum(terms.values()))
+            party_ids.append(parties.setdefault(rec["party"], len(parties)))
+            metadata.append(_chunk_item(rec)["customMetadata"])
+            blob = rec["text"].encode("utf-8")
+            texts.write(blob)
+            text_offsets.append(text_offsets[-1] + len(blob))
+            version.update(record_hash(rec).encode())
+            if dense and embeddings is None:
+                vectors.append(embed_question(rec["text"]))
+
+    n = len(doc_len)
+    dl = np.asarray(doc_len, dtype=np.float32)
+    avgdl = float(dl.mean()) if n else 0.0
+    vocab = {term: i for i, term in enumerate(sorted(postings))}
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    docs = np.empty(sum(len(p) for p in postings.values()), dtype=np.int32)
+    impact = np.empty(len(docs), dtype=np.float32)
+    pos = 0
+    for term, i in vocab.items():
+        plist = postings[term]
+        d = np.fromiter((p[0] for p in plist), dtype=np.int32, count=len(plist))
+        tf = np.fromiter((p[1] for p in plist), dtype=np.float32, count=len(plist))
+        idf = np.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        # BM25 contribution of this term per document, precomputed: a query only sums slices
+        impact[pos:pos + len(plist)] = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl[d] / avgdl))
+        docs[pos:pos + len(plist)] = d
+        pos += len(plist)
+        offsets[i + 1] = pos
+
+    np.save(out / "offsets.npy", offsets)
+    np.save(out / "postings_doc.npy", docs)
+    np.save(out / "postings_impact.npy", impact)
+    np.save(out / "party_ids.npy", np.asarray(party_ids, dtype=np.int32))
+    np.save(out / "text_offsets.npy", np.asarray(text_offsets, dtype=np.int64))
+    dense_kind = None
+    if embeddings is not None:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.shape[0] != n:
+            raise ValueError(f"embeddings has {matrix.shape[0]} rows, index has {n} chunks")
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        np.save(out / "dense.npy", matrix)
+        dense_kind = "external"
+    elif dense and vectors:
+        np.save(out / "dense.npy", np.stack(vectors))  # rows are L2-normalised already
+        dense_kind = "ngram"
+    (out / "vocab.json").write_text(json.dumps(vocab, ensure_ascii=False), encoding="utf-8")
+    (out / "metadata.json").write_text(json.dumps(metadata, ensure_ascii=False), encoding="utf-8")
+    meta = {"version": version.hexdigest()[:16], "chunks": n, "terms": len(vocab), "avgdl": round(avgdl, 2),
+            "parties": list(parties), "dense": dense_kind, "built_at": time.time()}
+    (out / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    meta["elapsed_s"] = round(time.monotonic() - t0, 2)
+    return meta
+
+
+def _query_embedder(dense_kind: str | None):
+    if dense_kind == "ngram":
+        return embed_question
+    if dense_kind != "external":
+        return None
+    # Query vectors for external embeddings must come from the same model as the matrix
+    if not LOCAL_QUERY_EMBEDDER:
+        print("Local index has external embeddings but LOCAL_QUERY_EMBEDDER is not set: BM25 only", flush=True)
+        return None
+    module, _, name = LOCAL_QUERY_EMBEDDER.partition(":")
+    if not name:
+        raise ValueError(f"LOCAL_QUERY_EMBEDDER={LOCAL_QUERY_EMBEDDER!r}: expected 'module:function'")
+    return getattr(importlib.import_module(module), name)
+
+
+class LocalIndex:
+    """A built index directory, memory-mapped. query() mirrors the remote :query call."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or LOCAL_INDEX_DIR)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.version = self.meta["version"]
+        self.vocab = json.loads((self.path / "vocab.json").read_text(encoding="utf-8"))
+        self.metadata = json.loads((self.path / "metadata.json").read_text(encoding="utf-8"))
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.offsets, self.docs, self.impact = load("offsets.npy"), load("postings_doc.npy"), load("postings_impact.npy")
+        self.party_ids, self.text_offsets = load("party_ids.npy"), load("text_offsets.npy")
+        self.texts = np.memmap(self.path / "texts.bin", dtype=np.uint8, mode="r") if self.meta["chunks"] else b""
+        self.dense = load("dense.npy") if self.meta.get("dense") else None
+        self.embed_query = _query_embedder(self.meta.get("dense"))
+        self.parties = self.meta["parties"]
+        self._party_by_norm = {_norm(p): i for i, p in enumerate(self.parties)}
+
+    def party_doc_map(self):
+        """Same shape as corpus.party_doc_map: ({norm: pseudo document path}, {norm: display name})."""
+        return ({n: f"local/documents/{n}" for n in self._party_by_norm},
+                {n: self.parties[i] for n, i in self._party_by_norm.items()})
+
+    def text(self, i: int) -> str:
+        return bytes(self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]).decode("utf-8")
+
+    def _bm25(self, question: str) -> np.ndarray:
+        scores = np.zeros(self.meta["chunks"], dtype=np.float32)
+        for term in set(tokenize(question)):
+            t = self.vocab.get(term)
+            if t is not None:
+                lo, hi = self.offsets[t], self.offsets[t + 1]
+                scores[self.docs[lo:hi]] += self.impact[lo:hi]  # a document occurs once per term
+        return scores
+
+    def query(self, question: str, results_count: int = 10, parties=None) -> list:
+        """Top hits as `relevantChunks`; `parties` (display names, any spelling) restricts the search."""
+        if not self.meta["chunks"]:
+            return []
+        scores = self._bm25(question)
+        top = scores.max()
+        if top > 0:
+            scores /= top  # best BM25 hit scores 1.0, like the API's 0..1 relevance
+        if self.dense is not None and self.embed_query is not None and LOCAL_DENSE_WEIGHT > 0:
+            q = np.asarray(self.embed_query(question), dtype=np.float32)
+            scores = (1 - LOCAL_DENSE_WEIGHT) * scores + LOCAL_DENSE_WEIGHT * (self.dense @ q)
+        if parties is not None:
+            allowed = [self._party_by_norm[_norm(p)] for p in parties if _norm(p) in self._party_by_norm]
+            scores = np.where(np.isin(self.party_ids, allowed), scores, -np.inf)
+        k = min(results_count, len(scores))
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [{
+            "chunk": {"name": f"local/chunks/{i}", "data": {"stringValue": self.text(i)},
+                      "customMetadata": self.metadata[i]},
+            "chunkRelevanceScore": float(scores[i]),
+        } for i in idx if scores[i] > 0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index(path=None) -> LocalIndex:
+    """The process-wide index (loaded once; LOCAL_INDEX_DIR unless a path is given)."""
+    global _index
+    if _index is None or (path is not None and Path(path) != _index.path):
+        with _index_lock:
+            if _index is None or (path is not None and Path(path) != _index.path):
+                _index = LocalIndex(path)
+    return _index
+
+def loaded_index() -> LocalIndex | None:
+    """The process-wide index if it is already loaded (no disk access), else None."""
+    return _index
+
+def corpora_query(corpus_name: str, query: str, results_count: int = 10, metadata_filters=None) -> list:
+    """Local stand-in for retrieval.corpora_query: a party's pseudo document path or the corpus
+    with a `party` metadata filter (see retrieval._party_filter)."""
+    index = get_index()
+    parties = None
+    if "/documents/" in corpus_name:
+        parties = [corpus_name.rsplit("/documents/", 1)[1]]
+    for f in metadata_filters or []:
+        if f.get("key", "").endswith(".party"):
+            parties = [c["stringValue"] for c in f.get("conditions", [])]
+    return index.query(query, results_count, parties)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("jsonl_file")
+    ap.add_argument("--out", default=LOCAL_INDEX_DIR)
+    ap.add_argument("--no-dense", action="store_true", help="BM25 only, no hashed n-gram matrix")
+    ap.add_argument("--embeddings", help=".npy with one embedding row per chunk (instead of n-gram vectors); "
+                                         "serve it with LOCAL_QUERY_EMBEDDER=module:function for the queries")
+    args = ap.parse_args()
+    emb = np.load(args.embeddings) if args.embeddings else None
+    meta = build_local_index(args.jsonl_file, args.out, dense=not args.no_dense, embeddings=emb)
+    print(f"{meta['chunks']} chunks, {meta['terms']} terms, {len(meta['parties'])} parties, "
+          f"dense={meta['dense']} → {args.out} in {meta['elapsed_s']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import bisect, contextvars, json, os, re, sys, threading, time
+from contextlib import contextmanager
+
+# Request instrumentation: per-stage/per-party timers, upstream calls (count, status, latency,
+# bytes) and cache hits. Exposed as Server-Timing header, one JSON log line per request (Cloud Run
+# picks up `severity`/`message`) and Prometheus text at /metrics. METRICS_ENABLED=0 turns all of it
+# into no-ops.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no", "off")
+METRICS_LOG = os.getenv("METRICS_LOG", "0") not in ("0", "false", "no", "off")  # JSON line per request
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets=_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        label_values = tuple(map(str, label_values))  # statuses are ints or "error": keep them sortable
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def expose(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for values, s in sorted(series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values))
+            sep = "," if labels else ""
+            cumulative = 0
+            for le, n in zip(self.buckets, s):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            out.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {s[-1]}')
+            out.append(f"{self.name}_sum{{{labels}}} {s[-2]:.6f}")
+            out.append(f"{self.name}_count{{{labels}}} {s[-1]}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        label_values = tuple(map(str, label_values))
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, n in sorted(values.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            out.append(f"{self.name}{{{labels}}} {n:g}")
+        return out
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram("kommunalomat_request_seconds", "HTTP request latency", ("path", "status"))
+STAGE_SECONDS = Histogram("kommunalomat_stage_seconds", "Time per processing stage", ("stage",))
+UPSTREAM_SECONDS = Histogram("kommunalomat_upstream_seconds", "Gemini API call latency", ("call", "status"))
+UPSTREAM_BYTES = Counter("kommunalomat_upstream_bytes_total", "Request/response bytes of Gemini API calls",
+                         ("call", "direction"))
+CACHE_LOOKUPS = Counter("kommunalomat_cache_lookups_total", "Answer cache lookups", ("cache", "result"))
+PROMPT_TOKENS = Counter("kommunalomat_prompt_context_tokens_total",
+                        "Estimated tokens of the summary context: full passages vs. sent after dedup/trimming", ("kind",))
+_REGISTRY = (REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_BYTES, CACHE_LOOKUPS, PROMPT_TOKENS)
+
+
+class RequestMetrics:
+    """What happened while serving one request; shared by all tasks/threads spawned for it."""
+
+    def __init__(self, method: str, path: str):
+        self.method, self.path, self.status = method, path, None
+        self.started = time.perf_counter()
+        self.stages = {}    # stage -> seconds (summed when a stage runs several times)
+        self.parties = {}   # party -> {stage: seconds}
+        self.upstream = {}  # "call status" -> [count, seconds, bytes out, bytes in]
+        self.cache = {}     # "cache:hit|miss" -> count
+        self.prompt = [0, 0]  # estimated context tokens: full passages, sent
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float, party: str | None = None):
+        with self._lock:
+            target = self.stages if party is None else self.parties.setdefault(party, {})
+            target[name] = target.get(name, 0.0) + seconds
+
+    def add_upstream(self, call: str, status, seconds: float, sent: int, received: int):
+        with self._lock:
+            entry = self.upstream.setdefault(f"{call} {status}", [0, 0.0, 0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += sent
+            entry[3] += received
+
+    def add_cache(self, cache: str, hit: bool):
+        key = f"{cache}:{'hit' if hit else 'miss'}"
+        with self._lock:
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def add_prompt(self, full: int, sent: int):
+        with self._lock:
+            self.prompt[0] += full
+            self.prompt[1] += sent
+
+    def server_timing(self) -> str:
+        with self._lock:
+            parts = [f"{_token(k)};dur={v * 1000:.1f}" for k, v in self.stages.items()]
+            for party, stages in self.parties.items():
+                parts += [f"{_token(k)}-{_token(party)};dur={v * 1000:.1f}" for k, v in stages.items()]
+            calls = sum(e[0] for e in self.upstream.values())
+            if calls:
+                secs = sum(e[1] for e in self.upstream.values())
+                parts.append(f'upstream;desc="{calls} calls";dur={secs * 1000:.1f}')
+            hits = sum(n for k, n in self.cache.items() if k.endswith(":hit"))
+            if self.cache:
+                parts.append(f'cache;desc="{hits}/{sum(self.cache.values())} hits"')
+            if self.prompt[0]:
+                parts.append(f'prompt;desc="{self.prompt[1]}/{self.prompt[0]} context tokens"')
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_log(self) -> dict:
+        total = time.perf_counter() - self.started
+        with self._lock:
+            return {
+                "severity": "INFO" if (self.status or 500) < 500 else "ERROR",
+                "message": f"{self.method} {self.path} {self.status} {total * 1000:.0f}ms",
+                "httpRequest": {"requestMethod": self.method, "requestUrl": self.path,
+                                "status": self.status, "latency": f"{total:.3f}s"},
+                "stages_ms": {k: round(v * 1000, 1) for k, v in self.stages.items()},
+                "parties_ms": {p: {k: round(v * 1000, 1) for k, v in s.items()} for p, s in self.parties.items()},
+                "upstream": {k: {"count": e[0], "ms": round(e[1] * 1000, 1), "bytes_out": e[2], "bytes_in": e[3]}
+                             for k, e in self.upstream.items()},
+                "cache": dict(self.cache),
+                "prompt_context_tokens": {"full": self.prompt[0], "sent": self.prompt[1]},
+            }
+
+def _token(s: str) -> str:
+    # Server-Timing metric names are HTTP tokens: no spaces, no umlauts
+    return re.sub(r"[^A-Za-z0-9_-]", "_", s)
+
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+def current() -> RequestMetrics | None:
+    return _current.get()
+
+def start_request(method: str, path: str) -> RequestMetrics | None:
+    """Starts collecting for the current context (asyncio tasks/to_thread calls made from it inherit it)."""
+    if not METRICS_ENABLED:
+        return None
+    m = RequestMetrics(method, path)
+    _current.set(m)
+    return m
+
+def finish_request(m: RequestMetrics | None, route: str | None = None):
+    if m is None:
+        return
+    REQUEST_SECONDS.observe(time.perf_counter() - m.started, route or m.path, m.status)
+    if METRICS_LOG:
+        print(json.dumps(m.as_log(), ensure_ascii=False), file=sys.stdout, flush=True)
+
+@contextmanager
+def stage(name: str, party: str | None = None):
+    """Times a block as a stage of the current request (and in the stage histogram)."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, name)
+        m = _current.get()
+        if m is not None:
+            m.add_stage(name, dt, party)
+
+def _call_name(url: str) -> str:
+    # ".../models/x:generateContent" -> "generateContent", ".../corpora/c/documents" -> "documents"
+    last = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+    if ":" in last:
+        return last.rsplit(":", 1)[1]
+    return last if last in ("corpora", "documents", "chunks") else "resource"
+
+def record_upstream(url: str, status, seconds: float, sent: int = 0, received: int = 0):
+    if not METRICS_ENABLED:
+        return
+    call = _call_name(url)
+    UPSTREAM_SECONDS.observe(seconds, call, status)
+    UPSTREAM_BYTES.inc(call, "out", amount=sent)
+    UPSTREAM_BYTES.inc(call, "in", amount=received)
+    m = _current.get()
+    if m is not None:
+        m.add_upstream(call, status, seconds, sent, received)
+
+def record_cache(cache: str, hit: bool):
+    if not METRICS_ENABLED:
+        return
+    CACHE_LOOKUPS.inc(cache, "hit" if hit else "miss")
+    m = _current.get()
+    if m is not None:
+        m.add_cache(cache, hit)
+
+def record_prompt(full: int, sent: int):
+    """Estimated context tokens of one generate call before and after context.build_context."""
+    if not METRICS_ENABLED:
+        return
+    PROMPT_TOKENS.inc("full", amount=full)
+    PROMPT_TOKENS.inc("sent", amount=sent)
+    m = _current.get()
+    if m is not None:
+        m.add_prompt(full, sent)
+
+def expose() -> str:
+    """Prometheus text exposition format of all metrics."""
+    return "\n".join(line for metric in _REGISTRY for line in metric.expose()) + "\n"
@@ -0,0 +1,198 @@
+"""
+Local pre-flight check of a corpus JSONL before anything is uploaded: validates every record,
+estimates token counts offline and splits over-long chunks along paragraph boundaries.
+
+    python preflight.py programme.jsonl --out programme.clean.jsonl --check-tokens 20
+
+Records are streamed, so large files stay cheap. countTokens is only called with --check-tokens
+(a random sample, to see whether utils.estimate_tokens needs a TOKEN_ESTIMATE_SCALE).
+"""
+import argparse, json, os, random, re, sys, time
+from collections import Counter
+from pathlib import Path
+
+if __name__ == "__main__":
+    # CLI only (before the settings below are read): importing the module leaves the environment alone
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import utils
+from corpus import nfc, _control_chars
+from utils import estimate_tokens, count_tokens
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "2000"))  # API limit per chunk is 2043 tokens
+PREFLIGHT_EXAMPLES = 20  # issues kept verbatim in the report, the rest is only counted
+
+# Problems that make a record unusable (it is skipped); everything else is fixed or only reported
+ERRORS = {"invalid_json", "missing_party", "empty_text"}
+# A corpus build/sync is not started if the file has any of these (corpus.build_lokalomat_corpus)
+FATAL = ERRORS | {"too_long"}
+
+# Split levels for over-long texts: paragraphs, then sentences, then words
+_SEPARATORS = [(re.compile(r"\n\s*\n"), "\n\n"), (re.compile(r"(?<=[.!?])\s+"), " "), (re.compile(r"\s+"), " ")]
+
+def split_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS, _level: int = 0) -> list[str]:
+    """Greedily packs paragraphs into pieces of <= max_tokens (estimated); only a paragraph that
+    is too long on its own is cut at sentence and, if need be, word boundaries."""
+    if _level == len(_SEPARATORS) or estimate_tokens(text) <= max_tokens:
+        return [text]
+    pattern, sep = _SEPARATORS[_level]
+    out, cur, cur_tokens = [], "", 0
+    for piece in pattern.split(text.strip()):
+        if not piece.strip():
+            continue
+        tokens = estimate_tokens(piece)
+        if cur and cur_tokens + 1 + tokens <= max_tokens:
+            cur, cur_tokens = cur + sep + piece, cur_tokens + 1 + tokens
+            continue
+        if cur:
+            out.append(cur)
+        if tokens <= max_tokens:
+            cur, cur_tokens = piece, tokens
+        else:
+            out.extend(split_text(piece, max_tokens, _level + 1))
+            cur, cur_tokens = "", 0
+    if cur:
+        out.append(cur)
+    return out
+
+
+class PreflightReport:
+    def __init__(self):
+        self.records = self.chunks = self.skipped = self.split = 0
+        self.tokens_total = self.tokens_max = 0
+        self.issues = Counter()
+        self.examples = []
+        self._started = time.monotonic()
+
+    def issue(self, line: int, kind: str, detail: str = "", party: str | None = None):
+        self.issues[kind] += 1
+        if len(self.examples) < PREFLIGHT_EXAMPLES:
+            self.examples.append({"line": line, "party": party, "kind": kind, "detail": detail})
+
+    @property
+    def errors(self) -> int:
+        return sum(n for kind, n in self.issues.items() if kind in ERRORS)
+
+    def as_dict(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "records": self.records, "chunks": self.chunks, "skipped": self.skipped, "split": self.split,
+            "errors": self.errors, "issues": dict(self.issues), "examples": self.examples,
+            "tokens": {"total": self.tokens_total, "max": self.tokens_max,
+                       "mean": round(self.tokens_total / self.chunks, 1) if self.chunks else None},
+            "elapsed_s": round(elapsed, 2), "records_per_s": round(self.records / max(elapsed, 1e-9), 1),
+        }
+
+
+def iter_clean_records(jsonl_file, *, max_tokens: int = CHUNK_MAX_TOKENS, report: PreflightReport | None = None):
+    """
+    Streams the JSONL like corpus.iter_records, but validated: broken records (invalid JSON,
+    no party, empty text) are skipped, control characters stripped and over-long texts split
+    into several records of the same party/section. Problems are collected in `report`.
+    """
+    report = report if report is not None else PreflightReport()
+    with Path(jsonl_file).open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            report.records += 1
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                report.issue(line_no, "invalid_json", str(e))
+                report.skipped += 1
+                continue
+            party = nfc(str(raw.get("party") or "")).strip()
+            section = nfc(str(raw.get("section") or "")).strip()
+            text = raw.get("text")
+            text = nfc(text) if isinstance(text, str) else ""
+            if not party:
+                report.issue(line_no, "missing_party")
+            if not text.strip():
+                report.issue(line_no, "empty_text", party=party or None)
+            if not party or not text.strip():
+                report.skipped += 1
+                continue
+            if not section:
+                report.issue(line_no, "missing_section", party=party)
+            bad = _control_chars(text)
+            if bad:
+                report.issue(line_no, "control_chars", str(sorted({hex(ord(c)) for c in bad})[:5]), party)
+                bad = set(bad)
+                text = "".join(c for c in text if c not in bad)
+            pieces = split_text(text, max_tokens)
+            if len(pieces) > 1:
+                report.split += 1
+                report.issue(line_no, "split", f"~{estimate_tokens(text)} tokens → {len(pieces)} chunks", party)
+            for piece in pieces:
+                tokens = estimate_tokens(piece)
+                if tokens > max_tokens:  # a single "word" longer than the limit
+                    report.issue(line_no, "too_long", f"~{tokens} tokens", party)
+                report.chunks += 1
+                report.tokens_total += tokens
+                report.tokens_max = max(report.tokens_max, tokens)
+                yield {"party": party, "section": section, "text": piece}
+
+def check_estimator(texts, sample: int = 20) -> dict:
+    """Compares estimate_tokens with countTokens on a random sample of texts (one API call each)."""
+    picked = random.sample(list(texts), min(sample, len(texts)))
+    ratios = []
+    for t in picked:
+        ratios.append(count_tokens(t) / estimate_tokens(t))
+    if not ratios:
+        return {"sample": 0}
+    mean = sum(ratios) / len(ratios)
+    return {"sample": len(ratios), "mean_ratio": round(mean, 3),
+            "max_rel_error": round(max(abs(r - 1) for r in ratios), 3),
+            "suggested_scale": round(mean * utils.TOKEN_ESTIMATE_SCALE, 3)}
+
+def preflight(jsonl_file, *, out=None, max_tokens: int = CHUNK_MAX_TOKENS, check_tokens: int = 0) -> dict:
+    """
+    Runs the whole file through iter_clean_records (writing the cleaned records to `out` if given)
+    and returns the report. With check_tokens > 0 that many chunks, drawn by reservoir sampling
+    while streaming, are checked against countTokens.
+    """
+    report = PreflightReport()
+    reservoir = []
+    sink = Path(out).open("w", encoding="utf-8") if out else None
+    try:
+        for i, rec in enumerate(iter_clean_records(jsonl_file, max_tokens=max_tokens, report=report)):
+            if sink is not None:
+                sink.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            if check_tokens:
+                if len(reservoir) < check_tokens:
+                    reservoir.append(rec["text"])
+                elif (j := random.randrange(i + 1)) < check_tokens:
+                    reservoir[j] = rec["text"]
+    finally:
+        if sink is not None:
+            sink.close()
+    result = report.as_dict()
+    if check_tokens:
+        result["estimator"] = check_estimator(reservoir, check_tokens)
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("jsonl_file")
+    ap.add_argument("--out", help="write the cleaned/split records here")
+    ap.add_argument("--max-tokens", type=int, default=CHUNK_MAX_TOKENS)
+    ap.add_argument("--check-tokens", type=int, default=0, metavar="N",
+                    help="compare the offline estimate with countTokens on N sampled chunks")
+    args = ap.parse_args()
+
+    r = preflight(args.jsonl_file, out=args.out, max_tokens=args.max_tokens, check_tokens=args.check_tokens)
+    print(f"{r['records']} records → {r['chunks']} chunks ({r['split']} split, {r['skipped']} skipped) "
+          f"in {r['elapsed_s']}s ({r['records_per_s']} records/s)")
+    print(f"tokens (estimated): total {r['tokens']['total']}, max {r['tokens']['max']}, mean {r['tokens']['mean']}")
+    for kind, n in sorted(r["issues"].items()):
+        print(f"  {'❌' if kind in ERRORS else '⚠️'} {kind}: {n}")
+    for ex in r["examples"]:
+        print(f"     line {ex['line']} {ex['party'] or ''} {ex['kind']} {ex['detail']}")
+    if "estimator" in r:
+        print("countTokens check:", json.dumps(r["estimator"]))
+    sys.exit(1 if r["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,148 @@
-import requests, json
+import asyncio, json, os
 from typing import List, Dict, Any
-from utils import get_api_key, get_headers, get_gen_model
+from cache import SUMMARY_CACHE, SUMMARY_FLIGHTS, SUMMARY_FLIGHTS_ASYNC, FlightAborted, summary_key
+from utils import get_gen_model, _post, _apost, _astream_sse, _norm, estimate_tokens, BASE
+from context import build_context
+from metrics import record_prompt
 
-GEN_API_KEY = get_api_key()
+# GEN_MODEL is read per call (not at import), so importing this module never fails on missing env
+def _gen_url() -> str:
+    return f"{BASE}/{get_gen_model()}:generateContent"
 
-GEN_MODEL = get_gen_model()
+def _gen_stream_url() -> str:
+    return f"{BASE}/{get_gen_model()}:streamGenerateContent?alt=sse"
 
-GEN_URL   = f"https://generativelanguage.googleapis.com/v1beta/{GEN_MODEL}:generateContent"
+# "per_party": one generateContent call per party; "batched": all parties of a question in one call
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "per_party")
+# Estimated input tokens per batched call; more parties than fit are split into several calls
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.getenv("SUMMARY_BATCH_TOKEN_BUDGET", "8000"))
 
-HEADERS = get_headers()
+INSTRUCTIONS = (
+    "Deine Aufgabe ist es, die Position der Partei zur gestellten Frage anhand der Passagen im 'context' zusammenzufassen."
+    "Gib im ersten Satz zunächst ein Kurzfazit: Beantworte dabei, wie das Parteiprogramm die gestellte Frage beantwortet."
+    "Fasse die Passagen darin sehr knapp im Sinne der Frage zusammen."
+    "Nehme dabei schon Bezug auf die Inhalte der Passagen. Beschränke dich auf die Punkte, die der Partei am wichtigsten zu sein scheinen."
+    "Wenn nach bestimmten Orten oder Stadtteilen gefragt wird, schränke ein, wenn diese Orte nicht explizit erwähnt werden"
+    "Das Kurzfazit sollte einem der folgenden 4 Muster folgen: Die Partei fordert [...], Die Partei gibt an [...], Die Partei möchte [...] oder Die Partei hat in ihrem Programm keine explizite Position zu [...]."
+    "Fasse dann die konkreten, zur Frage passenden politischen Positionen und Forderungen innerhalb der jeweiligen Passagen der Reihe nach zusammen."
+    "Ordne die Passagen dabei nach Relevanz, sodass relevantere Passagen zuerst behandelt werden."
+    "Die Zusammenfassungen sollen aus maximal 3 kurzen Sätzen bestehen. Sie dürfen keine Bullet Points oder ähnliches enthalten."
+    "Vermeide aufzählende Sprachmuster. Verlagere lange Nebensätze lieber in einen eigenen Satz."
+    "Wenn du eine Passage zusammenfasst, ordne sie explizit der jeweiligen Passagen zu. Folge dabei immer dem Muster 'Passage #:'. Verwende nie Klammern um die Passagen-Nummer."
+    "Verwende in der Zusammenfassung immer den Titel der Section. Nutze Formulierungen wie 'Im Abschnitt <i>'Section'</i> des Parteiprogramms steht, dass ...' oder 'Die Passage <i>'Section'</i> erwähnt ...'."
+    "Falls 2 Passagen denselben Section-Titel haben, behandlte sie zusammen und nicht einzeln."
+    "Eine Kennzeichnung wie [1 & 4] bedeutet, dass Passage 4 inhaltlich schon in Passage 1 enthalten ist. Nenne sie dann gemeinsam als 'Passagen 1 & 4'."
+    "Falls die Inhalte einer Passage keine direkte Relevanz zur gestellten Frage haben, ignoriere sie und fasse sie nicht zusammen."
+    "Wenn die Relevanz der Passage zur Frage unklar ist, fasse die Passage bestmöglich im Sinne der Frage zusammen. Betone jedoch am Ende der Zusammenfassung explizit: <i>'Die Relevanz der Passage zur Frage ist nicht eindeutig.'</i>"
+    "Falls, nachdem du die relevanten Passagen zusammengefasst, eine oder mehrere irrelevante Passagen übrig bleiben, füge nur an: 'Die restlichen Passagen befassen sich nicht mit der gestellten Frage.'" 
+    "Füge dann keinesfalls hinzu, womit sich diese irrelevante Passage befasst!"
+    "Nutze immer Anführungszeichen und die Kursiv-Tags um die Titel der Sections."
+    "Vermeide insbesondere im Kurzfazit verschachtelte Sätze. Halte die Sätze kurz und prägnant."
+    "Falls keine der Passagen zur Frage passt, schreibe als Kurzfazit: 'Die Partei bezieht keine explizite Position zur gestellten Frage.'" 
+    "Erwähne in diesem Fall keine Passagen und fasse keine der Passagen zusammen."
+    "Ziehe niemals Schlussfolgerungen zu Parteipositionen aus dem Fehlen thematisch relevanter Passagen."
+    "Nenne niemals Inhalte, die nicht in den Passagen stehen!"
+    "Formatiere die Antwort in HTML: <p>…dein Kurzfazit…</p> <p><strong>Passagen 1 & 3 &ndash; aus <i>'Section'</i>:</strong></p> <p>…Text…</p> <p><strong>Passage 2 &ndash; aus <i>'Section'</i>:</strong></p> <p>…Text…</p>"
+)
+
+# The instructions go into systemInstruction: a fixed prefix of every call (Gemini's implicit
+# caching picks it up); only question and context are built per call.
+def _build_prompt(question: str, quotes: List[Dict[str, Any]]) -> tuple[str, dict]:
+    ctx, stats = build_context(quotes)
+    return f"Frage: {question}\n\nZitate:\n{ctx}\n\nAntwort:", stats
+
+def _summary_body(question: str, quotes: List[Dict[str, Any]]) -> dict:
+    prompt, stats = _build_prompt(question, quotes)
+    record_prompt(stats["tokens_full"], stats["tokens"])
+    return _gen_body(prompt, INSTRUCTIONS)
+
+def prompt_tokens(question: str, quotes: List[Dict[str, Any]]) -> int:
+    """Estimated input tokens of one summary call, system instructions included."""
+    return estimate_tokens(INSTRUCTIONS) + estimate_tokens(_build_prompt(question, quotes)[0])
+
+BATCH_INSTRUCTIONS = (
+    "Du erhältst die Passagen mehrerer Parteien, jeweils unter '### Partei: <Name>'."
+    " Erstelle für jede Partei eine eigene Zusammenfassung nach den folgenden Regeln."
+    " Verwende für jede Partei nur ihre eigenen Passagen und deren Nummerierung."
+    " Antworte ausschließlich mit einem JSON-Array der Form"
+    ' [{"party": "<Name wie angegeben>", "summary": "<HTML-Zusammenfassung>"}], ein Eintrag pro Partei.\n\n'
+)
+
+_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"party": {"type": "STRING"}, "summary": {"type": "STRING"}},
+        "required": ["party", "summary"],
+    },
+}
+
+def _party_block(party: str, quotes: List[Dict[str, Any]]) -> tuple[str, dict]:
+    ctx, stats = build_context(quotes)
+    return f"### Partei: {party}\n{ctx}", stats
+
+def _build_batch_prompt(question: str, items: List[tuple]) -> str:
+    blocks = []
+    for party, quotes in items:
+        block, stats = _party_block(party, quotes)
+        record_prompt(stats["tokens_full"], stats["tokens"])
+        blocks.append(block)
+    return f"Frage: {question}\n\n" + "\n\n".join(blocks) + "\n\nAntwort (JSON):"
+
+def _split_batches(question: str, items: List[tuple], token_budget: int) -> List[List[tuple]]:
+    """Greedy packing of (party, quotes) items so that each prompt stays within token_budget."""
+    fixed = estimate_tokens(BATCH_INSTRUCTIONS + INSTRUCTIONS + question)
+    batches, current, used = [], [], fixed
+    for item in items:
+        cost = estimate_tokens(_party_block(*item)[0])
+        if current and used + cost > token_budget:
+            batches.append(current)
+            current, used = [], fixed
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _parse_batch(text: str, parties: List[str]) -> Dict[str, str]:
+    """Maps the requested party labels to their summaries; parties missing from the JSON are left out."""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(data, dict):
+        data = [{"party": k, "summary": v} for k, v in data.items()]
+    by_norm = {}
+    for entry in data if isinstance(data, list) else []:
+        if isinstance(entry, dict) and isinstance(entry.get("summary"), str) and entry["summary"].strip():
+            by_norm[_norm(str(entry.get("party", "")))] = entry["summary"].strip()
+    return {p: by_norm[_norm(p)] for p in parties if _norm(p) in by_norm}
+
+def _batch_body(prompt: str) -> dict:
+    body = _gen_body(prompt, BATCH_INSTRUCTIONS + INSTRUCTIONS)
+    body["generationConfig"].update({"responseMimeType": "application/json", "responseSchema": _BATCH_SCHEMA})
+    return body
+
+def _gen_body(prompt: str, system: str | None = None) -> dict:
+    body = {
+        "contents":[
+            {"role":"user","parts":[{"text":prompt}]}
+            ],
+        "generationConfig": {
+            "temperature": 0.1,         # default = 1.0
+            # "maxOutputTokens": 300    # optional: cap the output length
+        }
+    }
+    if system:
+        body["systemInstruction"] = {"parts": [{"text": system}]}
+    return body
+
+def _candidates_text(r: dict) -> str:
+    text = ""
+    for c in r.get("candidates", []):
+        for p in c.get("content", {}).get("parts", []):
+            if "text" in p: text += p["text"]
+    return text
 
 def summarize_from_quotes(
         question: str, 
@@ -16,61 +150,163 @@ def summarize_from_quotes(
         ) -> str | None:
     if not quotes:
         return None
+    key = summary_key(question, quotes)
+    cached = SUMMARY_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    def _generate():
+        r = _post(_gen_url(), _summary_body(question, quotes)).json()
+        summary = _candidates_text(r).strip() or None
+        if summary:
+            SUMMARY_CACHE.set(key, summary)
+        return summary
+    return SUMMARY_FLIGHTS.do(key, _generate)
+
+async def summarize_from_quotes_async(
+        question: str,
+        quotes: List[Dict[str, Any]]
+        ) -> str | None:
+    """Async variant of summarize_from_quotes (shared httpx client, no thread per call)."""
+    if not quotes:
+        return None
+    key = summary_key(question, quotes)
+    cached = SUMMARY_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    async def _generate():
+        r = (await _apost(_gen_url(), _summary_body(question, quotes))).json()
+        summary = _candidates_text(r).strip() or None
+        if summary:
+            SUMMARY_CACHE.set(key, summary)
+        return summary
+    return await SUMMARY_FLIGHTS_ASYNC.do(key, _generate)
+
+async def stream_summary_from_quotes_async(
+        question: str,
+        quotes: List[Dict[str, Any]]
+        ):
+    """Yields the summary text in pieces as Gemini generates it (streamGenerateContent)."""
+    if not quotes:
+        return
+    key = summary_key(question, quotes)
+    cached = SUMMARY_CACHE.get(key)
+    if cached is not None:
+        yield cached
+        return
 
-    # Build LLM context: include section next to each passage
-    ctx_lines = []
-    for i, q in enumerate(quotes, 1):
-        sec = (q.get("section") or "").strip()
-        if sec:
-            ctx_lines.append(f"[{i}] (Section: {sec})\n{q['quote']}")
+    # Same summary already being generated (streamed or not): wait for it and send it in one piece
+    pending = SUMMARY_FLIGHTS_ASYNC.pending(key)
+    if pending is not None:
+        try:
+            summary = await asyncio.shield(pending)
+        except FlightAborted:
+            summary = None
         else:
-            ctx_lines.append(f"[{i}]\n{q['quote']}")
-    context = "\n\n".join(ctx_lines)
-    prompt = (
-        "Deine Aufgabe ist es, die Position der Partei zur gestellten Frage anhand der Passagen im 'context' zusammenzufassen."
-        "Gib im ersten Satz zunächst ein Kurzfazit: Beantworte dabei, wie das Parteiprogramm die gestellte Frage beantwortet."
-        "Fasse die Passagen darin sehr knapp im Sinne der Frage zusammen."
-        "Nehme dabei schon Bezug auf die Inhalte der Passagen. Beschränke dich auf die Punkte, die der Partei am wichtigsten zu sein scheinen."
-        "Wenn nach bestimmten Orten oder Stadtteilen gefragt wird, schränke ein, wenn diese Orte nicht explizit erwähnt werden"
-        "Das Kurzfazit sollte einem der folgenden 4 Muster folgen: Die Partei fordert [...], Die Partei gibt an [...], Die Partei möchte [...] oder Die Partei hat in ihrem Programm keine explizite Position zu [...]."
-        "Fasse dann die konkreten, zur Frage passenden politischen Positionen und Forderungen innerhalb der jeweiligen Passagen der Reihe nach zusammen."
-        "Ordne die Passagen dabei nach Relevanz, sodass relevantere Passagen zuerst behandelt werden."
-        "Die Zusammenfassungen sollen aus maximal 3 kurzen Sätzen bestehen. Sie dürfen keine Bullet Points oder ähnliches enthalten."
-        "Vermeide aufzählende Sprachmuster. Verlagere lange Nebensätze lieber in einen eigenen Satz."
-        "Wenn du eine Passage zusammenfasst, ordne sie explizit der jeweiligen Passagen zu. Folge dabei immer dem Muster 'Passage #:'. Verwende nie Klammern um die Passagen-Nummer."
-        "Verwende in der Zusammenfassung immer den Titel der Section. Nutze Formulierungen wie 'Im Abschnitt <i>'Section'</i> des Parteiprogramms steht, dass ...' oder 'Die Passage <i>'Section'</i> erwähnt ...'."
-        "Falls 2 Passagen denselben Section-Titel haben, behandlte sie zusammen und nicht einzeln."
-        "Falls die Inhalte einer Passage keine direkte Relevanz zur gestellten Frage haben, ignoriere sie und fasse sie nicht zusammen."
-        "Wenn die Relevanz der Passage zur Frage unklar ist, fasse die Passage bestmöglich im Sinne der Frage zusammen. Betone jedoch am Ende der Zusammenfassung explizit: <i>'Die Relevanz der Passage zur Frage ist nicht eindeutig.'</i>"
-        "Falls, nachdem du die relevanten Passagen zusammengefasst, eine oder mehrere irrelevante Passagen übrig bleiben, füge nur an: 'Die restlichen Passagen befassen sich nicht mit der gestellten Frage.'" 
-        "Füge dann keinesfalls hinzu, womit sich diese irrelevante Passage befasst!"
-        "Nutze immer Anführungszeichen und die Kursiv-Tags um die Titel der Sections."
-        "Vermeide insbesondere im Kurzfazit verschachtelte Sätze. Halte die Sätze kurz und prägnant."
-        "Falls keine der Passagen zur Frage passt, schreibe als Kurzfazit: 'Die Partei bezieht keine explizite Position zur gestellten Frage.'" 
-        "Erwähne in diesem Fall keine Passagen und fasse keine der Passagen zusammen."
-        "Ziehe niemals Schlussfolgerungen zu Parteipositionen aus dem Fehlen thematisch relevanter Passagen."
-        "Nenne niemals Inhalte, die nicht in den Passagen stehen!"
-        "Formatiere die Antwort in HTML: <p>…dein Kurzfazit…</p> <p><strong>Passagen 1 & 3 &ndash; aus <i>'Section'</i>:</strong></p> <p>…Text…</p> <p><strong>Passage 2 &ndash; aus <i>'Section'</i>:</strong></p> <p>…Text…</p>"
-        f"\n\nFrage: {question}\n\nZitate:\n{context}\n\nAntwort:"
-    )
-    r = requests.post(
-        GEN_URL,
-        headers=HEADERS,
-        data=json.dumps({
-            "contents":[
-                {"role":"user","parts":[{"text":prompt}]}
-                ],
-            "generationConfig": {
-                "temperature": 0.1,         # default = 1.0
-                # "maxOutputTokens": 300    # optional: cap the output length
-        }
-      })
-    ).json()
-    text = ""
-    for c in r.get("candidates", []):
-        for p in c.get("content", {}).get("parts", []):
-            if "text" in p: text += p["text"]
-    return text.strip() or None
+            if summary:
+                yield summary
+            return
+
+    flight = SUMMARY_FLIGHTS_ASYNC.claim(key)
+    parts, summary, error, completed = [], None, None, False
+    try:
+        async for r in _astream_sse(_gen_stream_url(), _summary_body(question, quotes)):
+            text = _candidates_text(r)
+            if text:
+                parts.append(text)
+                yield text
+        summary = "".join(parts).strip() or None
+        if summary:
+            SUMMARY_CACHE.set(key, summary)
+        completed = True
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Runs on success, error and on client disconnect (generator closed before the end)
+        if error is None and not completed:
+            error = FlightAborted()
+        SUMMARY_FLIGHTS_ASYNC.resolve(key, flight, summary, error)
+
+def _pending_batch_items(question: str, answers: List[dict]):
+    """(party, quotes) of answers that still need a summary; cached ones are filled in directly."""
+    items = []
+    for a in answers:
+        if a.get("status") != "ok" or not a.get("quotes") or a.get("summary"):
+            continue
+        cached = SUMMARY_CACHE.get(summary_key(question, a["quotes"]))
+        if cached is not None:
+            a["summary"] = cached
+        else:
+            items.append((a["party"], a["quotes"]))
+    return items
+
+def _apply_batch(question: str, answers: List[dict], batch: List[tuple], summaries: Dict[str, str]) -> List[dict]:
+    """Stores parsed summaries; returns the answers of the batch that must fall back to single calls."""
+    by_party = {a["party"]: a for a in answers}
+    missing = []
+    for party, quotes in batch:
+        summary = summaries.get(party)
+        if summary:
+            by_party[party]["summary"] = summary
+            SUMMARY_CACHE.set(summary_key(question, quotes), summary)
+        else:
+            missing.append(by_party[party])
+    return missing
+
+def summarize_answers_batched(
+        question: str,
+        answers: List[dict],
+        *,
+        token_budget: int | None = None
+        ) -> List[dict]:
+    """
+    Fills a["summary"] for every answer with status "ok" using one generateContent call per batch of
+    parties (JSON output keyed by party). Parties missing from an unparsable or incomplete response
+    fall back to summarize_from_quotes; failures set summary_status/summary_error like submit_question.
+    """
+    items = _pending_batch_items(question, answers)
+    for batch in _split_batches(question, items, token_budget or SUMMARY_BATCH_TOKEN_BUDGET):
+        try:
+            r = _post(_gen_url(), _batch_body(_build_batch_prompt(question, batch))).json()
+            summaries = _parse_batch(_candidates_text(r), [p for p, _ in batch])
+        except Exception:
+            summaries = {}
+        for a in _apply_batch(question, answers, batch, summaries):
+            try:
+                a["summary"] = summarize_from_quotes(question, a["quotes"])
+            except Exception as e:
+                a["summary_status"] = "error"
+                a["summary_error"] = str(e)
+    return answers
+
+async def summarize_answers_batched_async(
+        question: str,
+        answers: List[dict],
+        *,
+        token_budget: int | None = None
+        ) -> List[dict]:
+    """Async variant of summarize_answers_batched; batches (and fallbacks) run concurrently."""
+    items = _pending_batch_items(question, answers)
+
+    async def _fallback(a: dict):
+        try:
+            a["summary"] = await summarize_from_quotes_async(question, a["quotes"])
+        except Exception as e:
+            a["summary_status"] = "error"
+            a["summary_error"] = str(e)
+
+    async def _batch(batch: List[tuple]):
+        try:
+            r = (await _apost(_gen_url(), _batch_body(_build_batch_prompt(question, batch)))).json()
+            summaries = _parse_batch(_candidates_text(r), [p for p, _ in batch])
+        except Exception:
+            summaries = {}
+        await asyncio.gather(*(_fallback(a) for a in _apply_batch(question, answers, batch, summaries)))
+
+    await asyncio.gather(*(_batch(b) for b in _split_batches(question, items, token_budget or SUMMARY_BATCH_TOKEN_BUDGET)))
+    return answers
 
 def print_party_answers_with_summary(answers: List[dict], question: str):
     for a in answers:
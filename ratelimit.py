@@ -0,0 +1,285 @@
+import asyncio, contextvars, os, random, threading, time
+from collections import deque
+
+# Process-wide limits per upstream endpoint class, shared by every request/thread/task:
+# a token bucket caps the request rate, an adaptive concurrency limit (AIMD) grows while calls
+# are fast and halves on 429s, and Retry-After pauses the whole class. Callers queue (FIFO)
+# until they may send or their deadline passes - they are not sent just to fail with a 429.
+# Each corpus of the registry (registry.py) queues separately: a free slot goes to the waiting
+# corpus with the fewest calls in flight, so one city's spike cannot stall the others. The
+# partition comes from the request context (use_partition), like the cache partition.
+# Waiters sleep until a slot may have become theirs (a release, a start or a waiter leaving wakes
+# the head of each queue) or until the token bucket/Retry-After pause allows the next call.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") not in ("0", "false", "no", "off")
+RATE_LIMIT_QUEUE_TIMEOUT = float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT", "30"))  # default max wait, seconds
+RATE_LIMIT_LATENCY_TOLERANCE = float(os.getenv("RATE_LIMIT_LATENCY_TOLERANCE", "3"))  # × best latency
+
+
+_partition = contextvars.ContextVar("rate_limit_partition", default=None)
+
+def use_partition(name: str | None):
+    """Queues upstream calls of the current request context under partition `name` (a corpus)."""
+    _partition.set(name)
+
+
+class RateLimitTimeout(TimeoutError):
+    """The call could not be started before its deadline (queue too long or upstream asked us to wait)."""
+
+
+def _env(cls: str, key: str, default: str) -> float:
+    return float(os.getenv(f"RATE_LIMIT_{cls.upper()}_{key}", default))
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, rps: float, burst: float, max_concurrency: int, min_concurrency: int = 1):
+        self.name = name
+        self.rps, self.burst = rps, burst
+        self.max_concurrency, self.min_concurrency = max_concurrency, min_concurrency
+        self.limit = float(max_concurrency)
+        self.tokens = burst
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._refilled = time.monotonic()
+        self._queues = {}  # partition -> waiting tickets, FIFO
+        self._in_flight_by = {}  # partition -> calls in flight
+        self._served_at = {}  # partition -> `started` when it last got a slot (round robin on ties)
+        self._wakers = {}  # ticket -> callable waking its waiter
+        self._next_ticket = 0
+        self._best_latency = None
+        self._last_decrease = 0.0
+        self._throttle_streak = 0
+        self._latencies = deque(maxlen=200)  # recent successful call latencies (for hedging)
+        self._lock = threading.Lock()
+        self.started = self.throttled = self.timeouts = 0
+        self.hedged = self.hedge_wins = 0
+
+    # -- acquiring -------------------------------------------------------------------------------
+    def _enqueue(self, part, waker) -> int:
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queues.setdefault(part, deque()).append(ticket)
+            self._wakers[ticket] = waker
+            return ticket
+
+    def _leave(self, ticket: int, part):
+        with self._lock:
+            self._wakers.pop(ticket, None)
+            queue = self._queues.get(part)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[part]
+                self._wake_heads()
+
+    def _wake_heads(self):
+        # Only the head of a queue can be next; called with the lock held whenever that may have changed
+        for queue in self._queues.values():
+            waker = self._wakers.get(queue[0])
+            if waker is not None:
+                waker()
+
+    def _my_turn(self, ticket: int, part) -> bool:
+        # Head of its own queue, and no other waiting corpus with fewer calls in flight
+        # (ties: the one served longest ago, then the older ticket)
+        queue = self._queues[part]
+        if queue[0] != ticket:
+            return False
+        def rank(p, head):
+            return self._in_flight_by.get(p, 0), self._served_at.get(p, -1), head
+        mine = rank(part, ticket)
+        return all(other == part or rank(other, q[0]) > mine for other, q in self._queues.items())
+
+    def _try(self, ticket: int, part, deadline: float) -> float | None:
+        """0 when the slot was taken, else seconds to wait (None: until woken); raises if the
+        deadline cannot be met."""
+        now = time.monotonic()
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rps)
+            self._refilled = now
+            if now < self.blocked_until:
+                wait = self.blocked_until - now
+                if now + wait > deadline:  # Retry-After beyond our deadline: fail now, not later
+                    raise RateLimitTimeout(f"{self.name}: upstream asked to wait {wait:.1f}s")
+                return wait
+            if self.in_flight >= int(self.limit) or not self._my_turn(ticket, part):
+                return None
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rps
+            self.tokens -= 1
+            self.in_flight += 1
+            self._in_flight_by[part] = self._in_flight_by.get(part, 0) + 1
+            self._served_at[part] = self.started
+            self.started += 1
+            queue = self._queues[part]
+            queue.popleft()
+            if not queue:
+                del self._queues[part]
+            del self._wakers[ticket]
+            self._wake_heads()  # the next in line may fit too
+            return 0.0
+
+    def _timeout(self, ticket: int, part):
+        self._leave(ticket, part)
+        with self._lock:
+            self.timeouts += 1
+        raise RateLimitTimeout(f"{self.name}: no upstream slot within the deadline")
+
+    def acquire(self, deadline: float | None = None):
+        """Blocks (thread) until a slot is free; deadline is a time.monotonic() value."""
+        if not RATE_LIMIT_ENABLED:
+            return
+        deadline = deadline if deadline is not None else time.monotonic() + RATE_LIMIT_QUEUE_TIMEOUT
+        part = _partition.get()
+        woken = threading.Event()
+        ticket = self._enqueue(part, woken.set)
+        while True:
+            woken.clear()
+            try:
+                wait = self._try(ticket, part, deadline)
+            except RateLimitTimeout:
+                self._timeout(ticket, part)
+            if wait == 0:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._timeout(ticket, part)
+            woken.wait(remaining if wait is None else min(wait, remaining))
+
+    async def acquire_async(self, deadline: float | None = None):
+        if not RATE_LIMIT_ENABLED:
+            return
+        deadline = deadline if deadline is not None else time.monotonic() + RATE_LIMIT_QUEUE_TIMEOUT
+        part = _partition.get()
+        loop, woken = asyncio.get_running_loop(), asyncio.Event()
+
+        def wake():  # may run on another thread or loop
+            try:
+                loop.call_soon_threadsafe(woken.set)
+            except RuntimeError:
+                pass  # loop closed: the waiter is gone
+
+        ticket = self._enqueue(part, wake)
+        try:
+            while True:
+                woken.clear()
+                try:
+                    wait = self._try(ticket, part, deadline)
+                except RateLimitTimeout:
+                    self._timeout(ticket, part)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeout(ticket, part)
+                try:
+                    await asyncio.wait_for(woken.wait(), remaining if wait is None else min(wait, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self._leave(ticket, part)
+            raise
+
+    # -- feedback ----------------------------------------------------------------------------------
+    def release(self, status, latency: float | None = None, retry_after: str | None = None):
+        """Frees the slot and adapts: 429 → halve the limit and pause; fast success → +1/limit."""
+        if not RATE_LIMIT_ENABLED:
+            return
+        now = time.monotonic()
+        part = _partition.get()  # released in the context that acquired
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            n = self._in_flight_by.get(part, 0) - 1
+            if n > 0:
+                self._in_flight_by[part] = n
+            else:
+                self._in_flight_by.pop(part, None)
+            self._wake_heads()  # a slot is free (or a pause begins: the heads then sleep until it ends)
+            if status == 429:
+                self.throttled += 1
+                self._throttle_streak += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self.tokens = 0.0
+                pause = _parse_retry_after(retry_after)
+                if pause is None:
+                    pause = random.uniform(0.5, 1.0) * min(30.0, 2 ** (self._throttle_streak - 1))
+                self.blocked_until = max(self.blocked_until, now + pause)
+                return
+            if not isinstance(status, int) or status >= 500:
+                return  # errors say nothing about how much load upstream takes
+            self._throttle_streak = 0
+            if latency is not None:
+                self._latencies.append(latency)
+                best = self._best_latency
+                # slowly forget the best latency, so a permanently slower upstream becomes the new normal
+                self._best_latency = latency if best is None else min(latency, best * 1.01)
+                if best is not None and latency > RATE_LIMIT_LATENCY_TOLERANCE * best:
+                    if now - self._last_decrease > 1.0:  # at most one decrease per second
+                        self._last_decrease = now
+                        self.limit = max(self.min_concurrency, self.limit * 0.9)
+                    return
+            self.limit = min(self.max_concurrency, self.limit + 1 / max(self.limit, 1))
+
+    def latency_percentile(self, p: float, min_samples: int = 20) -> float | None:
+        """p-th percentile of recent latencies, None while there are fewer than min_samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    def count_hedge(self, won: bool = False):
+        """Counts a duplicate call sent by utils._apost_hedged, or (won=True) one whose response was used."""
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedged += 1
+
+    def has_capacity(self) -> bool:
+        """True if a call could start right now without queueing (used before sending a hedge)."""
+        with self._lock:
+            now = time.monotonic()
+            tokens = self.tokens + (now - self._refilled) * self.rps
+            return not self._queues and self.in_flight < int(self.limit) and now >= self.blocked_until and tokens >= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            parts = set(self._queues) | set(self._in_flight_by)
+            by_partition = {part or "default": {"in_flight": self._in_flight_by.get(part, 0),
+                                                "queued": len(self._queues.get(part, ()))} for part in parts}
+            return {
+                "limit": round(self.limit, 2), "max_concurrency": self.max_concurrency, "in_flight": self.in_flight,
+                "queued": sum(len(q) for q in self._queues.values()), "rps": self.rps, "started": self.started,
+                "throttled": self.throttled, "timeouts": self.timeouts,
+                "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                "blocked_for_s": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                **({"partitions": by_partition} if parts - {None} else {}),
+            }
+
+def _parse_retry_after(value) -> float | None:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None  # HTTP-date form: treat like a missing header
+
+
+LIMITERS = {
+    cls: AdaptiveLimiter(cls, _env(cls, "RPS", rps), _env(cls, "BURST", burst), int(_env(cls, "CONCURRENCY", conc)))
+    for cls, rps, burst, conc in (
+        ("query", "20", "40", "32"),      # :query (retrieval)
+        ("generate", "10", "20", "16"),   # generateContent / streamGenerateContent / countTokens
+        ("admin", "5", "10", "8"),        # corpora, documents, chunks (listing, ingestion)
+    )
+}
+
+def limiter_for(url: str) -> AdaptiveLimiter:
+    path = url.split("?", 1)[0]
+    if path.endswith(":query"):
+        return LIMITERS["query"]
+    if "/models/" in path or path.rsplit("/", 1)[-1].startswith("models"):
+        return LIMITERS["generate"]
+    return LIMITERS["admin"]
+
+def stats() -> dict:
+    return {name: lim.stats() for name, lim in LIMITERS.items()}
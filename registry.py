@@ -0,0 +1,212 @@
+"""
+Corpus registry: one deployment serves several municipalities/elections. Each entry of the
+registry file (CORPUS_REGISTRY, JSON) maps a key to its corpus, party list, logos and FAQ store:
+
+    {
+      "default": "dortmund-2025",
+      "corpora": {
+        "dortmund-2025": {"corpus": "corpora/...", "city": "Dortmund", "year": "2025",
+                          "hosts": ["dortmund.example.de"], "parties": ["SPD", "CDU", ...]},
+        "bochum-2025":   {"corpus": "corpora/...", "city": "Bochum", "year": "2025",
+                          "logo_dir": "logos/bochum", "logos": {"UWG": "uwg"},
+                          "faq_store": "faq_bochum.json.gz", "cache_size": 512, "max_requests": 16}
+      }
+    }
+
+The file is re-read when it changes (checked at most every CORPUS_REGISTRY_RELOAD seconds), so
+adding a city needs no redeploy; a broken file keeps the previous registry. Without a file the
+registry has a single entry from CORPUS_NAME, i.e. the app behaves as before.
+"""
+import asyncio, json, os, threading, time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from assets import LogoIndex, STATIC_DIR
+
+CORPUS_REGISTRY = os.getenv("CORPUS_REGISTRY", "corpora.json")
+CORPUS_REGISTRY_RELOAD = float(os.getenv("CORPUS_REGISTRY_RELOAD", "10"))  # seconds; <= 0: loaded once
+# Requests per corpus in flight at once; more wait up to the request budget, then get a 503
+CORPUS_MAX_REQUESTS = int(os.getenv("CORPUS_MAX_REQUESTS", "32"))
+
+# Liste der verfügbaren Parteien (alle werden vorausgewählt)
+DEFAULT_PARTIES = ["SPD", "CDU", "Grüne", "Linke", "AfD", "FDP", "Die PARTEI"]
+
+LOGO_SLUG = {
+    "AfD": "afd",
+    "CDU": "cdu",
+    "Die Partei": "diepartei",
+    "FDP": "fdp",
+    "Grüne": "gruene",
+    "Linke": "linke",
+    "SPD": "spd",
+}
+
+
+class UnknownCorpus(KeyError):
+    pass
+
+class CorpusBusy(Exception):
+    pass
+
+
+class _Limiter:
+    """Bounded admission for one corpus; survives registry reloads as long as the limit is the same."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._sem = asyncio.Semaphore(limit)
+        self.in_flight = self.admitted = self.rejected = 0
+
+    async def acquire(self, timeout: float | None) -> bool:
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._sem.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "admitted": self.admitted, "rejected": self.rejected}
+
+
+class CorpusEntry:
+    def __init__(self, key: str, cfg: dict, previous: "CorpusEntry | None" = None):
+        self.key = key
+        self.corpus = cfg["corpus"]
+        self.city, self.year = cfg.get("city"), str(cfg.get("year") or "") or None
+        self.title = cfg.get("title") or " ".join(x for x in ("Kommunal-O-Mat", self.city, self.year) if x)
+        self.hosts = [h.lower() for h in cfg.get("hosts", [])]
+        self.parties = list(cfg.get("parties") or DEFAULT_PARTIES)
+        self.faq_store = cfg.get("faq_store")
+        self.cache_size = int(cfg.get("cache_size") or 0) or None  # None: ANSWER_CACHE_SIZE
+        max_requests = int(cfg.get("max_requests") or CORPUS_MAX_REQUESTS)
+        self.logo_dir = cfg.get("logo_dir", "logos").strip("/")
+        self.logo_slugs = {**LOGO_SLUG, **cfg.get("logos", {})}
+        if previous is not None and previous.limiter.limit == max_requests:
+            self.limiter = previous.limiter  # keeps counting requests that are in flight
+        else:
+            self.limiter = _Limiter(max_requests)
+        if previous is not None and (previous.logo_dir, previous.logo_slugs) == (self.logo_dir, self.logo_slugs):
+            self.logos = previous.logos
+        else:
+            self.logos = LogoIndex(self.logo_slugs.values(), STATIC_DIR / self.logo_dir)
+
+    def activate(self):
+        """Routes the current request context to this corpus' answer caches, question index and
+        upstream queues (cache.py, semantic_cache.py, ratelimit.py)."""
+        import cache, ratelimit, semantic_cache
+        cache.use_partition(self.key, self.cache_size)
+        ratelimit.use_partition(self.key)
+        semantic_cache.QUESTION_INDEX.set_city(self.key, self.city)
+
+    def logo(self, party: str) -> tuple[str, str] | None:
+        """(path below /static, content hash) of the party's logo."""
+        logo = self.logos.get(self.logo_slugs.get(party))
+        return None if logo is None else (f"{self.logo_dir}/{logo[0]}", logo[1])
+
+    @asynccontextmanager
+    async def admit(self, timeout: float | None):
+        if not await self.limiter.acquire(timeout):
+            raise CorpusBusy(self.key)
+        try:
+            yield self
+        finally:
+            self.limiter.release()
+
+    def info(self) -> dict:
+        return {"key": self.key, "title": self.title, "city": self.city, "year": self.year}
+
+    def stats(self) -> dict:
+        return {**self.info(), "corpus": self.corpus, "parties": len(self.parties),
+                "faq_store": self.faq_store, "cache_size": self.cache_size, "requests": self.limiter.stats()}
+
+
+class Registry:
+    def __init__(self, path: str | None = CORPUS_REGISTRY, reload_interval: float = CORPUS_REGISTRY_RELOAD):
+        self.path, self.reload_interval = path, reload_interval
+        self._lock = threading.Lock()
+        self.entries, self.default, self.hosts = {}, None, {}
+        self._mtime, self._checked, self.loaded_at, self.error = None, 0.0, None, None
+
+    def _read(self) -> dict:
+        if self.path and Path(self.path).is_file():
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        corpus = os.getenv("CORPUS_NAME")
+        if not corpus:
+            raise ValueError(f"Keine Korpus-Registry ({self.path}) und kein CORPUS_NAME gesetzt")
+        return {"default": "default", "corpora": {"default": {"corpus": corpus, "title": "Kommunal-O-Mat"}}}
+
+    def _mtime_now(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def load(self) -> int:
+        """(Re)reads the registry; raises on a broken file and then keeps the previous one."""
+        with self._lock:
+            mtime = self._mtime_now()
+            try:
+                cfg = self._read()
+                corpora = cfg["corpora"]
+                if not corpora:
+                    raise ValueError("'corpora' ist leer")
+                entries = {k: CorpusEntry(k, c, self.entries.get(k)) for k, c in corpora.items()}
+                default = cfg.get("default") or next(iter(entries))
+                if default not in entries:
+                    raise ValueError(f"default '{default}' ist kein Eintrag")
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self._mtime, self._checked = mtime, time.monotonic()  # retried once the file changes again
+                raise
+            self.entries, self.default, self.error = entries, default, None
+            self.hosts = {h: e for e in entries.values() for h in e.hosts}
+            self._mtime, self._checked, self.loaded_at = mtime, time.monotonic(), time.time()
+        print(f"Korpus-Registry: {len(entries)} Einträge ({', '.join(entries)})", flush=True)
+        return len(entries)
+
+    def _maybe_reload(self):
+        if self.loaded_at is not None and (self.reload_interval <= 0
+                                          or time.monotonic() - self._checked < self.reload_interval):
+            return
+        self._checked = time.monotonic()
+        if self.loaded_at is not None and self._mtime_now() == self._mtime:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Korpus-Registry {self.path} nicht geladen: {e}", flush=True)
+            if not self.entries:
+                raise
+
+    def resolve(self, key: str | None = None, host: str | None = None) -> CorpusEntry:
+        """Entry for a request: explicit key (form field/query `corpus`), else the Host header, else the default."""
+        self._maybe_reload()
+        entries = self.entries
+        if key:
+            if key not in entries:
+                raise UnknownCorpus(key)
+            return entries[key]
+        if host:
+            entry = self.hosts.get(host.split(":")[0].lower())
+            if entry is not None:
+                return entry
+        return entries[self.default]
+
+    def all(self) -> list[CorpusEntry]:
+        self._maybe_reload()
+        return list(self.entries.values())
+
+    def stats(self) -> dict:
+        return {"path": self.path if self.path and Path(self.path).is_file() else None,
+                "loaded_at": self.loaded_at, "default": self.default, "error": self.error,
+                "corpora": {k: e.stats() for k, e in self.entries.items()}}
+
+
+REGISTRY = Registry()
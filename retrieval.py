@@ -1,6 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import List, Dict, Any
-from utils import _norm, _meta_get, _post, normalize_question
-from corpus import documents_list
+import asyncio, math, os, time
+from utils import _norm, _meta_get, _post, _apost, _corpus_key, normalize_question, submit_in_context, BASE
+from corpus import party_doc_map, cached_party_doc_map
+from cache import HITS_CACHE, RETRIEVAL_FLIGHTS, RETRIEVAL_FLIGHTS_ASYNC, hits_key
+from semantic_cache import QUESTION_INDEX
+from metrics import stage, record_cache
+import budget
+
+# Defaults for the concurrent retrieval mode of answer_per_party_strict
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+RETRIEVAL_PARTY_TIMEOUT = float(os.getenv("RETRIEVAL_PARTY_TIMEOUT", "20"))  # seconds per party
+
+# "per_document": one query per party document; "grouped": one corpus query filtered on the
+# chunks' `party` metadata, over-fetched and split per party locally (see retrieve_grouped_hits)
+RETRIEVAL_STRATEGY = os.getenv("RETRIEVAL_STRATEGY", "per_document")
+RETRIEVAL_OVERFETCH = int(os.getenv("RETRIEVAL_OVERFETCH", "3"))  # results requested per party and k
+_MAX_RESULTS_COUNT = 100  # API limit for resultsCount
+
+# "remote": Gemini semantic retriever; "local": BM25 index built from the same JSONL (local_index.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "remote")
+
+def _local() -> bool:
+    return RETRIEVAL_BACKEND == "local"
+
+def _source(corpus_name: str) -> str:
+    # Cache/scope key: hits of the local index depend on its build, not on the remote corpus
+    if _local():
+        import local_index
+        return f"local-{local_index.get_index().version}"
+    return corpus_name
 
 def _validate_question(q: str, min_len: int = 5, max_len: int = 200) -> str | None:
     if len(q) < min_len:
@@ -10,26 +39,160 @@ def _validate_question(q: str, min_len: int = 5, max_len: int = 200) -> str | No
     return None
     
 def corpora_query(corpus_name, query, results_count=10, metadata_filters=None):
+    if _local():
+        import local_index
+        return local_index.corpora_query(corpus_name, query, results_count, metadata_filters)
     body = {"query": query, "resultsCount": results_count}
     if metadata_filters:
         body["metadataFilters"] = metadata_filters
-    return _post(f"https://generativelanguage.googleapis.com/v1beta/{corpus_name}:query", body).json()["relevantChunks"]
+    return _post(f"{BASE}/{corpus_name}:query", body).json()["relevantChunks"]
+
+async def corpora_query_async(corpus_name, query, results_count=10, metadata_filters=None):
+    if _local():
+        import local_index  # a few ms of NumPy: not worth a thread
+        return local_index.corpora_query(corpus_name, query, results_count, metadata_filters)
+    body = {"query": query, "resultsCount": results_count}
+    if metadata_filters:
+        body["metadataFilters"] = metadata_filters
+    return (await _apost(f"{BASE}/{corpus_name}:query", body)).json()["relevantChunks"]
 
 def map_party_to_doc(corpus_name: str):
-    docs = documents_list(corpus_name)
-    by_norm = { _norm(d["displayName"]): d["name"] for d in docs }
-    party_map = { _norm(d["displayName"]): d["displayName"] for d in docs }
-    return by_norm, party_map
+    # Served from the process-wide cache in corpus.party_doc_map (no listing per request)
+    if _local():
+        import local_index
+        return local_index.get_index().party_doc_map()
+    return party_doc_map(corpus_name)
+
+async def map_party_to_doc_async(corpus_name: str):
+    # Warm cache (or loaded local index): answered inline. Only a listing/index load needs a thread,
+    # so the default thread pool is not used up by lookups that never block.
+    if _local():
+        import local_index
+        index = local_index.loaded_index()
+        maps = index.party_doc_map() if index is not None else None
+    else:
+        maps = cached_party_doc_map(corpus_name)
+    if maps is None:
+        maps = await asyncio.to_thread(map_party_to_doc, corpus_name)
+    return maps
 
 def retrieve_party_hits(corpus_name: str, party_name: str, question: str, k: int = 2):
     docs_map, party_map = map_party_to_doc(corpus_name)
     party_path = docs_map.get(_norm(party_name))
     if not party_path:
         return [], party_name  # unknown party label
-    # Use corpora_query instead of documents_query
-    hits = corpora_query(party_path, question, results_count=k)
+    key = hits_key(_source(corpus_name), question, party_name, k)
+    hits = HITS_CACHE.get(key)
+    if hits is None:
+        def _fetch():
+            # Use corpora_query instead of documents_query
+            hits = corpora_query(party_path, question, results_count=k)
+            HITS_CACHE.set(key, hits)
+            return hits
+        # Identical questions arriving meanwhile wait for this query instead of sending their own
+        hits = RETRIEVAL_FLIGHTS.do(key, _fetch)
     return hits, party_map[_norm(party_name)]
 
+async def retrieve_party_hits_async(corpus_name: str, party_name: str, question: str, k: int = 2):
+    docs_map, party_map = await map_party_to_doc_async(corpus_name)
+    party_path = docs_map.get(_norm(party_name))
+    if not party_path:
+        return [], party_name
+    key = hits_key(_source(corpus_name), question, party_name, k)
+    hits = HITS_CACHE.get(key)
+    if hits is None:
+        async def _fetch():
+            hits = await corpora_query_async(party_path, question, results_count=k)
+            HITS_CACHE.set(key, hits)
+            return hits
+        hits = await RETRIEVAL_FLIGHTS_ASYNC.do(key, _fetch)
+    return hits, party_map[_norm(party_name)]
+
+def _party_filter(party_values: List[str]) -> list:
+    # Conditions inside one filter are OR-ed: chunks of any of these parties
+    return [{
+        "key": "chunk.custom_metadata.party",
+        "conditions": [{"stringValue": v, "operation": "EQUAL"} for v in party_values],
+    }]
+
+def _plan_grouped(corpus_name: str, party_names: List[str], question: str, k: int, maps=None):
+    """Splits parties into finished (unknown label or cached hits) and ones still to query."""
+    docs_map, party_map = maps or map_party_to_doc(corpus_name)
+    doc_party = {doc: n for n, doc in docs_map.items()}  # for hits without `party` metadata
+    out, todo = {}, []
+    for p in party_names:
+        n = _norm(p)
+        if n not in docs_map:
+            out[p] = ([], p)  # unknown party label
+            continue
+        cached = HITS_CACHE.get(hits_key(_source(corpus_name), question, p, k))
+        if cached is not None:
+            out[p] = (cached, party_map[n])
+        else:
+            todo.append(p)
+    return out, todo, party_map, doc_party
+
+def _grouped_request(todo: List[str], party_map: dict, k: int, overfetch: int):
+    results_count = min(_MAX_RESULTS_COUNT, k * len(todo) * overfetch)
+    return results_count, _party_filter([party_map[_norm(p)] for p in todo])
+
+def _hit_party(hit: dict, doc_party: dict) -> str:
+    # The chunk's `party` metadata, else the party whose document the chunk belongs to
+    chunk = hit.get("chunk") or {}
+    party = _meta_get(chunk.get("customMetadata"), "party", "")
+    if party:
+        return _norm(party)
+    return doc_party.get((chunk.get("name") or "").split("/chunks/", 1)[0], "")
+
+def _split_grouped(corpus_name, question, k, hits, todo, party_map, doc_party, results_count, last_round, out):
+    """Assigns hits to parties; returns the parties that still lack k hits and deserve another round."""
+    grouped = {}
+    for h in hits:  # hits come sorted by relevance, so the first k per party are its top k
+        grouped.setdefault(_hit_party(h, doc_party), []).append(h)
+    # Fewer hits than requested means the filter was exhausted: nobody has more chunks to find
+    exhausted = len(hits) < results_count
+    starved = []
+    for p in todo:
+        got = grouped.get(_norm(p), [])[:k]
+        if len(got) < k and not (exhausted or last_round):
+            starved.append(p)
+            continue
+        HITS_CACHE.set(hits_key(_source(corpus_name), question, p, k), got)
+        out[p] = (got, party_map[_norm(p)])
+    return starved
+
+def retrieve_grouped_hits(corpus_name: str, party_names: List[str], question: str, k: int = 2,
+                          *, overfetch: int | None = None, max_rounds: int = 2):
+    """
+    Top-k hits for several parties from one corpus-wide query restricted to their `party` metadata.
+    Parties crowded out of the over-fetched result get one follow-up query (max_rounds).
+    Returns {party_name: (hits, party_display)}; hits share the cache with retrieve_party_hits.
+    """
+    out, todo, party_map, doc_party = _plan_grouped(corpus_name, party_names, question, k)
+    corpus_path = f"corpora/{_corpus_key(corpus_name)}"
+    for rnd in range(max_rounds):
+        if not todo:
+            break
+        results_count, filters = _grouped_request(todo, party_map, k, overfetch or RETRIEVAL_OVERFETCH)
+        hits = corpora_query(corpus_path, question, results_count=results_count, metadata_filters=filters)
+        todo = _split_grouped(corpus_name, question, k, hits, todo, party_map, doc_party, results_count,
+                              rnd == max_rounds - 1, out)
+    return out
+
+async def retrieve_grouped_hits_async(corpus_name: str, party_names: List[str], question: str, k: int = 2,
+                                      *, overfetch: int | None = None, max_rounds: int = 2):
+    maps = await map_party_to_doc_async(corpus_name)
+    out, todo, party_map, doc_party = _plan_grouped(corpus_name, party_names, question, k, maps)
+    corpus_path = f"corpora/{_corpus_key(corpus_name)}"
+    for rnd in range(max_rounds):
+        if not todo:
+            break
+        results_count, filters = _grouped_request(todo, party_map, k, overfetch or RETRIEVAL_OVERFETCH)
+        hits = await corpora_query_async(corpus_path, question, results_count=results_count, metadata_filters=filters)
+        todo = _split_grouped(corpus_name, question, k, hits, todo, party_map, doc_party, results_count,
+                              rnd == max_rounds - 1, out)
+    return out
+
 #### Build grounded answers ----
 def build_party_answer_from_hits(
     hits: list, 
@@ -88,34 +251,207 @@ def answer_per_party_strict(
     *,
     max_question_len: int = 200,     # <- neues weiches Limit
     min_question_len: int = 5,       # <- optionales Unterlimit
-    truncate_long: bool = False      # <- alternativ: hart kürzen statt ablehnen
+    truncate_long: bool = False,     # <- alternativ: hart kürzen statt ablehnen
+    concurrent: bool = True,         # <- Parteien parallel abfragen
+    max_workers: int | None = None,  # <- Obergrenze paralleler Abfragen (Default: RETRIEVAL_MAX_WORKERS)
+    party_timeout: float | None = None,  # <- Sekunden pro Partei (Default: RETRIEVAL_PARTY_TIMEOUT)
+    strategy: str | None = None      # <- "per_document" | "grouped" (Default: RETRIEVAL_STRATEGY)
 ) -> List[Dict[str, Any]]:
 
     results: List[Dict[str, Any]] = []
+    q_norm, invalid = _prepare_question(question, parties, min_question_len, max_question_len, truncate_long)
+    if invalid is not None:
+        return invalid
+
+    # A near-duplicate of a recently answered question reuses that question's cached hits
+    scope = _semantic_scope(corpus_name, k_retrieve, max_quotes)
+    match = QUESTION_INDEX.lookup(q_norm, scope)
+    record_cache("similar_question", match is not None)
+    q_retrieve = match[0] if match else q_norm
+
+    def _one(p: str) -> Dict[str, Any]:
+        if p == "Die PARTEI":
+            p = "Die Partei"
+        with stage("retrieval", party=p):
+            hits, party_map = retrieve_party_hits(corpus_name, p, q_retrieve, k=k_retrieve)
+        return build_party_answer_from_hits(hits, q_retrieve, party_map, max_quotes=max_quotes)
+
+    if (strategy or RETRIEVAL_STRATEGY) == "grouped":
+        names = ["Die Partei" if p == "Die PARTEI" else p for p in parties]
+        try:
+            with stage("retrieval_grouped"):
+                grouped = retrieve_grouped_hits(corpus_name, names, q_retrieve, k=k_retrieve)
+        except Exception:
+            pass  # e.g. the party filter was rejected: one query per document below
+        else:
+            results = [build_party_answer_from_hits(grouped[n][0], q_retrieve, grouped[n][1], max_quotes=max_quotes)
+                       for n in names]
+            _note_question(results, q_norm, match, scope)
+            return results
+
+    if not concurrent or len(parties) <= 1:
+        results = [_one(p) for p in parties]
+        _note_question(results, q_norm, match, scope)
+        return results
+
+    # Concurrent mode: one worker per party (bounded), results in the order of `parties`
+    workers = max(1, min(len(parties), max_workers or RETRIEVAL_MAX_WORKERS))
+    timeout = RETRIEVAL_PARTY_TIMEOUT if party_timeout is None else party_timeout
+    # Parties beyond `workers` queue up, so every "wave" of workers gets the full per-party timeout
+    deadline = time.monotonic() + timeout * math.ceil(len(parties) / workers)
+    deadline = min(deadline, budget.deadline() or deadline)  # never past the request's budget
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futs = [submit_in_context(pool, _one, p) for p in parties]
+        for p, fut in zip(parties, futs):
+            try:
+                results.append(fut.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeout:
+                fut.cancel()
+                results.append(_party_failure(p, "timeout", _TIMEOUT_MSG))
+            except Exception as e:
+                results.append(_party_failure(p, "error", _ERROR_MSG.format(type(e).__name__)))
+    finally:
+        # Do not block the request on stuck upstream calls
+        pool.shutdown(wait=False, cancel_futures=True)
+    _note_question(results, q_norm, match, scope)
+    return results
+
+def _semantic_scope(corpus_name: str, k_retrieve: int, max_quotes: int):
+    # Only questions answered against the same corpus with the same retrieval settings are reusable
+    return (_corpus_key(_source(corpus_name)), k_retrieve, max_quotes)
+
+def _note_question(results: List[Dict[str, Any]], q_norm: str, match, scope):
+    """Marks answers reused from a similar question, or indexes q_norm once its hits are cached."""
+    if match:
+        for r in results:
+            r["matched_question"], r["match_score"] = match[0], round(match[1], 3)
+    elif results and all(r.get("status") in ("ok", "no_info") for r in results):
+        QUESTION_INDEX.add(q_norm, scope)
+
+def _prepare_question(question, parties, min_question_len, max_question_len, truncate_long):
+    """Returns (q_norm, None) or (q_norm, invalid_input results for every party)."""
     q_norm = normalize_question(question)
     err = _validate_question(q_norm, min_question_len, max_question_len)
 
     if err and not truncate_long:
         # Für jede Partei ein konsistentes Ergebnisobjekt zurückgeben
-        for p in parties:
-            results.append({
-                "party": p,
-                "status": "invalid_input",
-                "message": err,
-                "quotes": [],
-                "summary": None,
-            })
-        return results
+        return q_norm, [{
+            "party": p,
+            "status": "invalid_input",
+            "message": err,
+            "quotes": [],
+            "summary": None,
+        } for p in parties]
 
     if err and truncate_long:
         # Hartes Kürzen, wenn gewünscht
         q_norm = q_norm[:max_question_len].rstrip()
+    return q_norm, None
 
-    for p in parties:
-        if p == "Die PARTEI":
-            p = "Die Partei"
-        hits, party_map = retrieve_party_hits(corpus_name, p, q_norm, k=k_retrieve)
-        results.append(
-            build_party_answer_from_hits(hits, q_norm, party_map, max_quotes=max_quotes)
-        )
+_TIMEOUT_MSG = "Die Suche im Programm der Partei hat zu lange gedauert. Bitte versuche es später erneut."
+_ERROR_MSG = "Bei der Suche im Programm der Partei ist ein Fehler aufgetreten ({})."
+
+def _party_failure(party: str, status: str, message: str) -> Dict[str, Any]:
+    # Same shape as the invalid_input entries so callers/templates can treat them alike
+    return {
+        "party": "Die Partei" if party == "Die PARTEI" else party,
+        "status": status,
+        "message": message,
+        "quotes": [],
+        "summary": None,
+    }
+
+async def answer_per_party_strict_async(
+    corpus_name: str,
+    question: str,
+    parties: List[str],
+    k_retrieve: int = 3,
+    max_quotes: int = 3,
+    **kwargs
+) -> List[Dict[str, Any]]:
+    """Async variant of answer_per_party_strict: one asyncio task per party, same result shape and order."""
+    results: List[Dict[str, Any] | None] = [None] * len(parties)
+    async for i, res in iter_party_answers_async(corpus_name, question, parties, k_retrieve, max_quotes, **kwargs):
+        results[i] = res
     return results
+
+async def iter_party_answers_async(
+    corpus_name: str,
+    question: str,
+    parties: List[str],
+    k_retrieve: int = 3,
+    max_quotes: int = 3,
+    *,
+    max_question_len: int = 200,
+    min_question_len: int = 5,
+    truncate_long: bool = False,
+    max_workers: int | None = None,
+    party_timeout: float | None = None,
+    strategy: str | None = None
+):
+    """Yields (index into parties, answer) as soon as each party's retrieval finishes."""
+    q_norm, invalid = _prepare_question(question, parties, min_question_len, max_question_len, truncate_long)
+    if invalid is not None:
+        for i, res in enumerate(invalid):
+            yield i, res
+        return
+
+    scope = _semantic_scope(corpus_name, k_retrieve, max_quotes)
+    match = QUESTION_INDEX.lookup(q_norm, scope)
+    record_cache("similar_question", match is not None)
+    q_retrieve = match[0] if match else q_norm
+
+    sem = asyncio.Semaphore(max(1, max_workers or RETRIEVAL_MAX_WORKERS))
+    timeout = RETRIEVAL_PARTY_TIMEOUT if party_timeout is None else party_timeout
+
+    async def _one(i: int, p: str):
+        name = "Die Partei" if p == "Die PARTEI" else p
+        async with sem:
+            # Timeout starts once the party holds a slot, like a worker thread picking it up;
+            # it never reaches past the request's deadline budget
+            try:
+                with stage("retrieval", party=name):
+                    hits, party_map = await asyncio.wait_for(
+                        retrieve_party_hits_async(corpus_name, name, q_retrieve, k=k_retrieve), budget.cap(timeout))
+            except asyncio.TimeoutError:
+                return i, _party_failure(p, "timeout", _TIMEOUT_MSG)
+            except Exception as e:
+                return i, _party_failure(p, "error", _ERROR_MSG.format(type(e).__name__))
+        return i, build_party_answer_from_hits(hits, q_retrieve, party_map, max_quotes=max_quotes)
+
+    if (strategy or RETRIEVAL_STRATEGY) == "grouped":
+        # One round trip for all parties, so they all arrive together
+        names = ["Die Partei" if p == "Die PARTEI" else p for p in parties]
+        try:
+            with stage("retrieval_grouped"):
+                grouped = await asyncio.wait_for(
+                    retrieve_grouped_hits_async(corpus_name, names, q_retrieve, k=k_retrieve), budget.cap(timeout))
+        except asyncio.TimeoutError:
+            results = [_party_failure(p, "timeout", _TIMEOUT_MSG) for p in parties]
+        except Exception:
+            results = None  # e.g. the party filter was rejected: one query per document below
+        else:
+            results = [build_party_answer_from_hits(grouped[n][0], q_retrieve, grouped[n][1], max_quotes=max_quotes)
+                       for n in names]
+        if results is not None:
+            _note_question(results, q_norm, match, scope)
+            for i, res in enumerate(results):
+                yield i, res
+            return
+
+    tasks = [asyncio.create_task(_one(i, p)) for i, p in enumerate(parties)]
+    done = []
+    try:
+        for fut in asyncio.as_completed(tasks):
+            i, res = await fut
+            if match:
+                _note_question([res], q_norm, match, scope)  # annotate before the caller sees it
+            done.append(res)
+            yield i, res
+        if not match:
+            _note_question(done, q_norm, None, scope)
+    finally:
+        # Consumer went away (e.g. client disconnected from a stream): stop the remaining queries
+        for t in tasks:
+            t.cancel()
@@ -0,0 +1,199 @@
+import os, re, threading, time, unicodedata, zlib
+from collections import deque
+import numpy as np
+from utils import normalize_question
+from cache import current_partition
+
+# Near-duplicate question matching in front of the exact caches (cache.py): a new question that is
+# similar enough to a recently answered one is answered with that question's cached hits/summaries.
+# Questions are embedded offline as hashed word + character n-gram vectors (no API call).
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))  # cosine; >= 1 disables matching
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))              # recent questions kept
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "2048"))                # hashed feature dimensions
+# The corpus' own city carries no topic either ("Radwege in Dortmund?" ≈ "Radwege?"); registry
+# entries with a `city` set theirs (set_city), other cities stay features
+SEMANTIC_CACHE_CITY = os.getenv("CORPUS_CITY", "Dortmund")
+
+def _fold(s: str) -> str:
+    # lower-case, ß → ss, strip accents/umlauts: "ÖPNV" and "OPNV" become the same token
+    s = unicodedata.normalize("NFKD", s.lower().replace("ß", "ss"))
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+# Words that carry no topic: without them "Was plant die Partei für Radwege?" ≈ "Radwege?"
+_STOPWORDS = {_fold(w) for w in """
+was wie wo wer wen wem wann warum weshalb wieso welche welcher welches welchen
+soll sollen sollte sollten will wollen möchte möchten plant planen plan kann können
+die der das den dem des ein eine einen einem einer zu zum zur in im ins am an auf aus mit für
+und oder über unter bei von vom nach vor durch um als auch noch
+getan werden wird wurde sagt sagen steht stehen denkt halten hält tun macht machen
+partei parteien programm stadt es sich sie ihr ihre ihren man gibt geben
+""".split()}
+
+# Negators and opposites: they stay in the features, and two questions only match if they contain
+# the same ones, so "gegen X" never answers "X" and "weniger X" never "mehr X"
+_POLARITY = {_fold(w) for w in """
+gegen nicht nie niemals kein keine keinen keinem keiner keines ohne weniger mehr
+""".split()}
+
+def _words(question: str, ignore=frozenset()) -> list[str]:
+    return [w for w in re.findall(r"\w+", _fold(normalize_question(question)))
+            if w not in _STOPWORDS and w not in ignore]
+
+def _city_words(city: str | None) -> frozenset:
+    return frozenset(re.findall(r"\w+", _fold(city))) if city else frozenset()
+
+def polarity(question: str) -> frozenset:
+    return frozenset(w for w in _words(question) if w in _POLARITY)
+
+def _features(question: str, ignore=frozenset()):
+    for w in _words(question, ignore):
+        yield "w:" + w, 2.0
+        padded = f" {w} "
+        for n in (3, 4):
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n], 1.0
+
+def embed_question(question: str, dim: int = SEMANTIC_CACHE_DIM, ignore=frozenset()) -> np.ndarray:
+    """L2-normalised hashed n-gram vector (crc32, so it is stable across processes); `ignore`: folded
+    words left out, e.g. the corpus' city."""
+    v = np.zeros(dim, dtype=np.float32)
+    for feat, weight in _features(question, ignore):
+        v[zlib.crc32(feat.encode("utf-8")) % dim] += weight
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class QuestionIndex:
+    """Bounded ring buffer of recently answered questions with cosine-similarity lookup."""
+
+    def __init__(self, size: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 dim: int = SEMANTIC_CACHE_DIM, city: str | None = SEMANTIC_CACHE_CITY):
+        self.size = size
+        self.threshold = threshold
+        self.dim = dim
+        self.city = city
+        self._ignore = _city_words(city)
+        self._matrix = np.zeros((size, dim), dtype=np.float32)
+        self._entries = [None] * size  # (question, scope, polarity) per row
+        self._next = 0
+        self._lock = threading.Lock()
+        self.lookups = self.matches = 0
+        self.recent_matches = deque(maxlen=50)
+
+    def lookup(self, question: str, scope=None):
+        """Returns (matched_question, score) for the most similar indexed question in `scope`, or None."""
+        if self.threshold >= 1 or not self.size:
+            return None
+        q_norm = normalize_question(question)
+        v = embed_question(q_norm, self.dim, self._ignore)
+        if not v.any():
+            return None
+        pol = polarity(q_norm)
+        with self._lock:
+            self.lookups += 1
+            scores = self._matrix @ v
+            for i in np.argsort(scores)[::-1]:
+                score = float(scores[i])
+                if score < self.threshold:
+                    return None
+                entry = self._entries[i]
+                if entry is None or entry[1] != scope or entry[2] != pol:
+                    continue
+                if entry[0] == q_norm:
+                    return None  # exact repeat: the exact caches handle it
+                self.matches += 1
+                self.recent_matches.append({"question": q_norm, "matched": entry[0],
+                                            "score": round(score, 3), "at": time.time()})
+                return entry[0], score
+        return None
+
+    def add(self, question: str, scope=None):
+        q_norm = normalize_question(question)
+        v = embed_question(q_norm, self.dim, self._ignore)
+        if not v.any():
+            return
+        entry = (q_norm, scope, polarity(q_norm))
+        with self._lock:
+            if entry in self._entries:
+                return
+            self._matrix[self._next] = v
+            self._entries[self._next] = entry
+            self._next = (self._next + 1) % self.size
+
+    def clear(self):
+        with self._lock:
+            self._matrix[:] = 0
+            self._entries = [None] * self.size
+            self._next = 0
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold, "size": self.size,
+                "entries": sum(e is not None for e in self._entries),
+                "lookups": self.lookups, "matches": self.matches,
+                "recent_matches": list(self.recent_matches)[-10:],
+            }
+
+
+class PartitionedQuestionIndex:
+    """One QuestionIndex per corpus of the registry, picked from the request context like the
+    answer-cache partition: questions of one city never match (or evict) those of another."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._threshold = kwargs.pop("threshold", SEMANTIC_CACHE_THRESHOLD)
+        self._indexes = {}  # partition -> QuestionIndex
+        self._cities = {}  # partition -> city (default: SEMANTIC_CACHE_CITY)
+        self._lock = threading.Lock()
+
+    def set_city(self, partition, city: str | None):
+        """The partition's corpus is about `city`; its name is then no feature of that partition's questions."""
+        city = city or SEMANTIC_CACHE_CITY
+        with self._lock:
+            self._cities[partition] = city
+            idx = self._indexes.get(partition)
+            if idx is not None and idx.city != city:
+                del self._indexes[partition]  # embedded with the old city: start over
+
+    def index(self, partition=None) -> QuestionIndex:
+        with self._lock:
+            idx = self._indexes.get(partition)
+            if idx is None:
+                idx = self._indexes[partition] = QuestionIndex(
+                    threshold=self._threshold, city=self._cities.get(partition, SEMANTIC_CACHE_CITY), **self._kwargs)
+            return idx
+
+    @property
+    def threshold(self) -> float:
+        return self._threshold
+
+    @threshold.setter
+    def threshold(self, value: float):
+        with self._lock:
+            self._threshold = value
+            for idx in self._indexes.values():
+                idx.threshold = value
+
+    def lookup(self, question: str, scope=None):
+        return self.index(current_partition()).lookup(question, scope)
+
+    def add(self, question: str, scope=None):
+        self.index(current_partition()).add(question, scope)
+
+    def clear(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for idx in indexes:
+            idx.clear()
+
+    def report(self) -> dict:
+        with self._lock:
+            indexes = dict(self._indexes)
+        if list(indexes) in ([], [None]):  # single corpus: as before
+            return self.index(None).report()
+        return {"threshold": self._threshold,
+                "partitions": {part or "default": idx.report() for part, idx in indexes.items()}}
+
+
+QUESTION_INDEX = PartitionedQuestionIndex()
@@ -1,149 +1,311 @@
 from dotenv import load_dotenv
 load_dotenv()
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Form, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from typing import List
 # from retrieval import answer_per_party_strict
 # from rag import summarize_from_quotes
-from pathlib import Path
-import os, sys
+import asyncio, json, os, sys
 import uvicorn
 
 
 # Damit der Import der Funktionen aus dem Hauptverzeichnis klappt:
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(BASE_DIR)
+import budget, faq, metrics, warmup
+from assets import CachedStaticFiles, STATIC_DIR
+from registry import REGISTRY, CorpusBusy, UnknownCorpus
 
 app = FastAPI()
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
 
-# Liste der verfügbaren Parteien (alle werden vorausgewählt)
-ALL_PARTIES = ["SPD", "CDU", "Grüne", "Linke", "AfD", "FDP", "Die PARTEI"]
+# Korpus, Parteien und Logos kommen pro Request aus der Korpus-Registry (registry.py, CORPUS_REGISTRY);
+# ohne Registry-Datei gibt es einen Eintrag aus CORPUS_NAME.
+BUSY_MESSAGE = "Gerade stellen sehr viele Menschen Fragen. Bitte versuche es in ein paar Sekunden noch einmal."
 
-# Konfiguration des Corpus-Pfads/Names (ggf. anpassen oder über Umgebungsvariable setzen)
-CORPUS_NAME = os.getenv("CORPUS_NAME")
+_warmup_task = None
+
+@app.on_event("startup")
+async def start_warmup():
+    """Startet das Aufwärmen (Imports, Verbindungen, Partei→Dokument-Cache) im Hintergrund; /__ready meldet das Ende."""
+    global _warmup_task
+    _warmup_task = asyncio.create_task(warmup.run(REGISTRY, template=lambda: templates.get_template("index.html").name))
+
+@app.get("/__boot")
+def boot_info():
+    """Umgebung und Dauer jedes Start-Schritts."""
+    return warmup.report()
+
+@app.get("/__ready")
+def readiness():
+    """200 erst nach dem Aufwärmen (für die Startup-Probe), sonst 503."""
+    from fastapi.responses import JSONResponse
+    r = warmup.report()
+    return JSONResponse({"ready": r["ready"], "warming_up": r["warming_up"]}, status_code=200 if r["ready"] else 503)
+
+def _entry(request: Request, corpus: str | None = None):
+    """Registry-Eintrag des Requests: Feld/Query `corpus`, sonst Host-Header, sonst der Standard."""
+    try:
+        return REGISTRY.resolve(corpus or request.query_params.get("corpus"), request.headers.get("host"))
+    except UnknownCorpus:
+        raise HTTPException(status_code=404, detail=f"Unbekannter Korpus: {corpus or request.query_params.get('corpus')}")
+
+def _page(request: Request, entry, status_code: int = 200, **context):
+    return templates.TemplateResponse("index.html", {
+        "request": request,
+        "corpus_key": entry.key,
+        "title": entry.title,
+        "corpora": [e.info() for e in REGISTRY.all()],
+        "parties": entry.parties,
+        **context,
+    }, status_code=status_code)
 
 @app.get("/", response_class=HTMLResponse)
 def form_page(request: Request):
     """Zeigt das Formular für die Fragen-Eingabe an (GET /)."""
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "parties": ALL_PARTIES,
-        "selected_parties": ALL_PARTIES,  # alle Checkboxen standardmäßig angehakt
-        "question": ""   # keine vorbefüllte Frage
-    })
+    entry = _entry(request)
+    return _page(request, entry,
+                 selected_parties=entry.parties,  # alle Checkboxen standardmäßig angehakt
+                 question="")   # keine vorbefüllte Frage
+
+@app.get("/__cache")
+def cache_info():
+    """Trefferquoten der Antwort-Caches und des Partei→Dokument-Caches, Zustand der Rate-Limiter."""
+    from cache import cache_stats
+    from corpus import PARTY_DOC_MAP_STATS
+    from semantic_cache import QUESTION_INDEX
+    from ratelimit import stats as rate_limit_stats
+    return {**cache_stats(), "party_doc_map": PARTY_DOC_MAP_STATS, "similar_questions": QUESTION_INDEX.report(),
+            "faq": faq.store_stats(), "rate_limits": rate_limit_stats(), "registry": REGISTRY.stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus-Metriken (Latenzen pro Request/Stufe/Upstream-Call, Cache-Treffer)."""
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(metrics.expose(), media_type="text/plain; version=0.0.4")
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    m = metrics.start_request(request.method, request.url.path)
+    if m is None:
+        return await call_next(request)
+    response = await call_next(request)
+    m.status = response.status_code
+    route = getattr(request.scope.get("route"), "path", None)
+    response.headers["Server-Timing"] = m.server_timing()  # stages finished before the body is sent
+    body = response.body_iterator
+
+    async def _finish_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.finish_request(m, route)
+    response.body_iterator = _finish_after_body()
+    return response
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    try:
+        from utils import close_async_client
+        await close_async_client()
+    except Exception:
+        pass
 
 @app.post("/", response_class=HTMLResponse)
-def submit_question(
+async def submit_question(
     request: Request, 
     question: str = Form(...), 
-    parties: List[str] = Form(...)
+    parties: List[str] = Form(...),
+    corpus: str | None = Form(None)
 ):
     """Verarbeitet die Formular-Eingabe und zeigt die Ergebnisse an (POST /)."""
-    # 1) Parallel retrieval (already inside answer_per_party_strict)
-    from retrieval import answer_per_party_strict
-    from rag import summarize_from_quotes
+    entry = _entry(request, corpus)
+    entry.activate()  # eigene Antwort-Caches, Fragen-Index und Upstream-Warteschlangen pro Korpus
+    budget.start()  # REQUEST_DEADLINE: waiting for a slot, retrieval and summaries must fit into it
+    try:
+        async with entry.admit(budget.remaining()):
+            return await _answer_page(request, entry, question, parties)
+    except CorpusBusy:
+        return _page(request, entry, status_code=503, selected_parties=parties, question=question,
+                     notice=BUSY_MESSAGE)
 
-    answers = answer_per_party_strict(CORPUS_NAME, question, parties, k_retrieve=5, max_quotes=5)
+async def _answer_page(request: Request, entry, question: str, parties: List[str]):
+    # 1) Parallel retrieval (one asyncio task per party inside answer_per_party_strict_async)
+    from retrieval import answer_per_party_strict_async
+    from rag import summarize_from_quotes_async, summarize_answers_batched_async, SUMMARY_MODE
 
-    # 2) Parallel summarization per party (only for status == "ok" with quotes)
-    idxs_to_sum = [i for i,a in enumerate(answers) if a.get("status") == "ok" and a.get("quotes")]
-    if idxs_to_sum:
-        # Be kind to quotas/rate limits
-        max_workers = min(len(idxs_to_sum), 8)
+    # Questions answered ahead of time by faq.py come straight from the store, summaries included
+    answers = faq.lookup(question, parties, k_retrieve=5, max_quotes=5, corpus_name=entry.corpus, path=entry.faq_store)
+    metrics.record_cache("faq", answers is not None)
+    if answers is None:
+        with metrics.stage("retrieval_total"):
+            answers = await answer_per_party_strict_async(entry.corpus, question, parties, k_retrieve=5, max_quotes=5)
 
-        def _summarize(i: int):
+    # 2) Parallel summarization per party (only for status == "ok" with quotes)
+    idxs_to_sum = [i for i,a in enumerate(answers) if a.get("status") == "ok" and a.get("quotes") and not a.get("summary")]
+    tasks = []
+    if idxs_to_sum and SUMMARY_MODE == "batched":
+        # One LLM call for all parties (split by token budget, per-party fallback inside)
+        q_sum = next((a["matched_question"] for a in answers if a.get("matched_question")), question)
+        tasks.append(asyncio.create_task(summarize_answers_batched_async(q_sum, answers),
+                                         context=budget.unbounded_context()))
+    elif idxs_to_sum:
+        # Quotas/rate limits are handled process-wide by the generate limiter (ratelimit.py)
+        async def _summarize(i: int):
             a = answers[i]
             try:
-                # If your summarize_from_quotes supports a max_tokens param, add it here for speed:
-                # s = summarize_from_quotes(question, a["quotes"], max_tokens=240)
-                s = summarize_from_quotes(question, a["quotes"])
-                return (i, s, None)
+                # Answers reused from a similar question are summarised for that question (cache hit)
+                with metrics.stage("summary", party=a.get("party")):
+                    a["summary"] = await summarize_from_quotes_async(a.get("matched_question") or question, a["quotes"])
             except Exception as e:
-                return (i, None, str(e))
-
-        with ThreadPoolExecutor(max_workers=max_workers) as pool:
-            futs = [pool.submit(_summarize, i) for i in idxs_to_sum]
-            for fut in as_completed(futs):
-                i, s, err = fut.result()
-                if err:
-                    answers[i]["summary_status"] = "error"
-                    answers[i]["summary_error"] = err
-                else:
-                    answers[i]["summary"] = s
+                a["summary_status"] = "error"
+                a["summary_error"] = str(e)
+
+        tasks = [asyncio.create_task(_summarize(i), context=budget.unbounded_context()) for i in idxs_to_sum]
+
+    if tasks:
+        # Wait only as long as the budget allows; late summaries are shown as pending and keep
+        # running in the background, so they land in the summary cache for the next request
+        # (the tasks run without the request's deadline, else their queueing would time out with it)
+        with metrics.stage("summaries"):
+            _, late = await asyncio.wait(tasks, timeout=budget.remaining())
+        for t in late:
+            _background.add(t)
+            t.add_done_callback(_background.discard)
+        if late:
+            for i in idxs_to_sum:
+                if not answers[i].get("summary") and not answers[i].get("summary_status"):
+                    answers[i]["summary_status"] = "pending"
 
     for a in answers:
-        party = a.get("party") or ""
-        slug  = LOGO_SLUG.get(party)
-        fname = _find_logo_filename(slug) if slug else None
-        if fname:
-            a["logo_url"] = request.url_for("static", path=f"logos/{fname}")
-            a["logo_is_pdf"] = fname.lower().endswith(".pdf")
-        else:
-            a["logo_url"] = None
-            a["logo_is_pdf"] = False
+        _attach_logo(request, entry, a)
 
     party_logo_urls = {}
-    for p in ALL_PARTIES:
-        slug = LOGO_SLUG.get(p)
-        fname = _find_logo_filename(slug) if slug else None
-        url = request.url_for("static", path=f"logos/{fname}") if fname else None
-        party_logo_urls[p] = url if url and not fname.lower().endswith(".pdf") else None
+    for p in entry.parties:
+        url, is_pdf = _logo_url(request, entry, p)
+        party_logo_urls[p] = url if not is_pdf else None
 
     # 3) Render
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "parties": ALL_PARTIES,
-        "selected_parties": parties,
-        "question": question,
-        "answers": answers,
-        "party_logo_urls": party_logo_urls,
-    })
+    with metrics.stage("render"):
+        return _page(request, entry,
+                     selected_parties=parties,
+                     question=question,
+                     answers=answers,
+                     party_logo_urls=party_logo_urls)
+
+def _logo_url(request: Request, entry, party: str):
+    """(versionierte URL, ist PDF) aus der Logo-Tabelle des Registry-Eintrags, ohne Dateisystemzugriff."""
+    logo = entry.logo(party)
+    if logo is None:
+        return None, False
+    path, digest = logo
+    return f"{request.url_for('static', path=path)}?v={digest}", path.lower().endswith(".pdf")
+
+def _attach_logo(request: Request, entry, a: dict):
+    a["logo_url"], a["logo_is_pdf"] = _logo_url(request, entry, a.get("party") or "")
+
+_background = set()  # summaries still running after their request's deadline (strong refs)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+class _AdmittedStream(StreamingResponse):
+    """StreamingResponse that frees the corpus slot when the response is over, also if the client
+    went away before the body started (then the body generator's finally never runs)."""
+
+    def __init__(self, content, release, **kw):
+        super().__init__(content, **kw)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+@app.post("/stream")
+async def stream_question(
+    request: Request,
+    question: str = Form(...),
+    parties: List[str] = Form(...),
+    corpus: str | None = Form(None)
+):
+    """
+    Wie POST /, aber als Server-Sent Events: jede Partei wird gesendet, sobald ihre Passagen
+    vorliegen ("party"), danach die Zusammenfassung stückweise ("token") und ihr Abschluss ("summary").
+    Scheitert die Suche, kommt "error" (die Seite fällt dann auf POST / zurück); am Ende immer "done".
+    """
+    from fastapi.responses import JSONResponse
+    from retrieval import iter_party_answers_async
+    from rag import stream_summary_from_quotes_async
+
+    entry = _entry(request, corpus)
+    entry.activate()
+    budget.start()  # REQUEST_DEADLINE as for POST /: queueing, retrieval and summaries must fit into it
+    # The slot is held until the response is over (_AdmittedStream); 503 makes the page fall back to POST /
+    if not await entry.limiter.acquire(budget.remaining()):
+        return JSONResponse({"detail": BUSY_MESSAGE}, status_code=503)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _summarize(i: int, q: str, quotes: list, party: str):
+        try:
+            with metrics.stage("summary", party=party):
+                async for piece in stream_summary_from_quotes_async(q, quotes):
+                    await queue.put(_sse("token", {"index": i, "text": piece}))
+            await queue.put(_sse("summary", {"index": i, "status": "ok"}))
+        except Exception as e:
+            await queue.put(_sse("summary", {"index": i, "status": "error", "error": str(e)}))
+
+    async def _produce():
+        summaries = []
+        try:
+            precomputed = faq.lookup(question, parties, k_retrieve=5, max_quotes=5,
+                                     corpus_name=entry.corpus, path=entry.faq_store)
+            metrics.record_cache("faq", precomputed is not None)
+            if precomputed is not None:
+                for i, a in enumerate(precomputed):
+                    _attach_logo(request, entry, a)
+                    await queue.put(_sse("party", {"index": i, **a}))
+                    if a.get("summary"):
+                        await queue.put(_sse("token", {"index": i, "text": a["summary"]}))
+                        await queue.put(_sse("summary", {"index": i, "status": "ok"}))
+                return
+            async for i, a in iter_party_answers_async(entry.corpus, question, parties, k_retrieve=5, max_quotes=5):
+                _attach_logo(request, entry, a)
+                await queue.put(_sse("party", {"index": i, **a}))
+                if a.get("status") == "ok" and a.get("quotes"):
+                    summaries.append(asyncio.create_task(
+                        _summarize(i, a.get("matched_question") or question, a["quotes"], a.get("party"))))
+            await asyncio.gather(*summaries)
+        except Exception as e:
+            await queue.put(_sse("error", {"error": str(e)}))
+        finally:
+            for t in summaries:
+                t.cancel()
+            await queue.put(None)
+
+    async def _events():
+        producer = asyncio.create_task(_produce())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            yield _sse("done", {})
+        finally:
+            producer.cancel()
+
+    try:
+        return _AdmittedStream(_events(), entry.limiter.release, media_type="text/event-stream",
+                               headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except BaseException:
+        entry.limiter.release()
+        raise
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8080"))
     uvicorn.run("serve.main:app", host="0.0.0.0", port=port, workers=1)
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-LOGO_SLUG = {
-    "AfD": "afd",
-    "CDU": "cdu",
-    "Die Partei": "diepartei",
-    "FDP": "fdp",
-    "Grüne": "gruene",
-    "Linke": "linke",
-    "SPD": "spd",
-}
-_IMG_EXTS = [".svg", ".png", ".webp", ".jpg", ".jpeg", ".gif"]
-_ALL_EXTS = _IMG_EXTS + [".pdf"]
-
-def _find_logo_filename(slug: str) -> str | None:
-    base = Path("static/logos")
-    if not slug: 
-        return None
-    # 1) exact slug + preferred extensions
-    for ext in _ALL_EXTS:
-        p = base / f"{slug}{ext}"
-        if p.exists():
-            return p.name
-    # 2) fuzzy: any file containing slug (case-insensitive)
-    slug_flat = slug.replace("-", "").lower()
-    cand = []
-    for p in base.glob("*"):
-        if p.is_file():
-            stem_flat = p.stem.replace("-", "").lower()
-            if slug_flat in stem_flat:
-                cand.append(p)
-    if not cand:
-        return None
-    # prefer image extensions over pdf
-    def _rank(p): 
-        ext = p.suffix.lower()
-        return (_ALL_EXTS.index(ext) if ext in _ALL_EXTS else 999, len(p.name))
-    cand.sort(key=_rank)
-    return cand[0].name
+# Long-lived Cache-Control for ?v=<hash> URLs, content-hash ETags (assets.py)
+app.mount("/static", CachedStaticFiles(directory=str(STATIC_DIR)), name="static")
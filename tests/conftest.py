@@ -0,0 +1,11 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# No real API calls in the tests: everything that would reach Gemini is faked per test
+os.environ.setdefault("GENAI_API_KEY", "test")
+os.environ.setdefault("GEN_MODEL", "models/test")
+os.environ.setdefault("CORPUS_NAME", "corpora/test")
+os.environ.setdefault("CORPUS_REGISTRY", os.path.join(ROOT, "tests", "no-registry.json"))
+os.environ.setdefault("WARMUP_ENABLED", "0")
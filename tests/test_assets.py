@@ -0,0 +1,72 @@
+import hashlib, os, time
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+import assets
+
+
+@pytest.fixture
+def static(tmp_path):
+    logos = tmp_path / "logos"
+    logos.mkdir()
+    (logos / "spd.png").write_bytes(b"\x89PNG spd")
+    (logos / "spd.svg").write_bytes(b"<svg>spd</svg>")
+    (logos / "die-gruenen-logo.jpg").write_bytes(b"jpg gruene")
+    (logos / "afd.pdf").write_bytes(b"%PDF afd")
+    app = Starlette(routes=[Mount("/static", assets.CachedStaticFiles(directory=str(tmp_path)), name="static")])
+    return tmp_path, TestClient(app)
+
+
+def test_logo_index_prefers_vector_images_and_matches_fuzzy(static):
+    root, _ = static
+    index = assets.LogoIndex(["spd", "gruene", "afd", "volt"], root / "logos", reload_interval=0)
+    assert index.get("spd") == ("spd.svg", hashlib.sha256(b"<svg>spd</svg>").hexdigest()[:12])
+    assert index.get("gruene")[0] == "die-gruenen-logo.jpg"
+    assert index.get("afd")[0] == "afd.pdf"
+    assert index.get("volt") is None and index.get(None) is None
+
+
+def test_logo_index_hot_reload(static):
+    root, _ = static
+    index = assets.LogoIndex(["volt"], root / "logos", reload_interval=0.01)
+    assert index.get("volt") is None
+    (root / "logos" / "volt.webp").write_bytes(b"webp")
+    time.sleep(0.02)
+    assert index.get("volt")[0] == "volt.webp"
+
+
+def test_etag_is_the_content_hash(static):
+    root, client = static
+    r = client.get("/static/logos/spd.png")
+    digest = assets.file_hash(root / "logos" / "spd.png")
+    assert r.status_code == 200 and r.content == b"\x89PNG spd"
+    assert digest == hashlib.sha256(r.content).hexdigest()[:12]
+    assert r.headers["etag"] == f'"{digest}"'
+    assert r.headers["cache-control"] == f"public, max-age={assets.STATIC_MAX_AGE}"
+
+
+def test_if_none_match_gives_304(static):
+    _, client = static
+    etag = client.get("/static/logos/spd.png").headers["etag"]
+    r = client.get("/static/logos/spd.png", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b""
+    assert client.get("/static/logos/spd.png", headers={"If-None-Match": '"veraltet"'}).status_code == 200
+
+
+def test_versioned_url_is_immutable(static):
+    root, client = static
+    digest = assets.file_hash(root / "logos" / "spd.png")
+    assert client.get(f"/static/logos/spd.png?v={digest}").headers["cache-control"] == \
+        "public, max-age=31536000, immutable"
+    assert client.get("/static/logos/spd.png?v=alt").headers["cache-control"] == "no-cache"
+
+
+def test_hash_follows_content_changes(static):
+    root, _ = static
+    path = root / "logos" / "spd.png"
+    before = assets.file_hash(path)
+    path.write_bytes(b"\x89PNG neu und laenger")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert assets.file_hash(path) != before
@@ -0,0 +1,59 @@
+import threading, time
+import cache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    c = cache.TTLCache(maxsize=2, ttl=0)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # "b" is now the oldest
+    c.set("c", 3)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    c = cache.TTLCache(maxsize=10, ttl=60)
+    c.set("q", "antwort")
+    now[0] += 59
+    assert c.get("q") == "antwort"
+    now[0] += 2
+    assert c.get("q") is None and len(c) == 0
+
+
+def test_sqlite_cache_drops_expired_rows(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    path = str(tmp_path / "cache.sqlite")
+    disk = cache.SqliteCache(path, ttl=60)
+    disk.set("a", {"x": 1})
+    disk.set("b", [2])
+    rows = lambda c: sorted(k for (k,) in c._conn.execute("SELECT key FROM cache"))
+    now[0] += 61
+    assert disk.get("a") is None and rows(disk) == ["b"]  # deleted on read
+    disk.set("c", "frisch")
+    assert rows(cache.SqliteCache(path, ttl=60)) == ["c"]  # purged when the next worker opens the file
+
+
+def test_single_flight_runs_identical_calls_once():
+    flight, calls, started = cache.SingleFlight(), [], threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "ergebnis"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader, *followers]:
+        t.join()
+    assert calls == [1] and results == ["ergebnis"] * 4
+    assert flight.stats() == {"calls": 1, "shared": 3, "in_flight": 0}
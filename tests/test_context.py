@@ -0,0 +1,44 @@
+import context
+
+
+def test_overlapping_passages_are_merged_and_keep_their_numbers():
+    shared = "Wir wollen den ÖPNV deutlich ausbauen und günstiger machen."
+    quotes = [
+        {"section": "Verkehr", "quote": f"{shared} Radwege werden sicherer."},
+        {"section": "Verkehr", "quote": shared},
+        {"section": "Wohnen", "quote": "Mehr geförderte Wohnungen für Familien bauen."},
+    ]
+    text, stats = context.build_context(quotes, token_budget=0)
+    assert text.count(shared) == 1
+    assert "[1 & 2] (Section: Verkehr)" in text and "[3] (Section: Wohnen)" in text
+    assert stats["merged"] == 1 and stats["trimmed_sentences"] == 0
+
+
+def test_budget_trims_lowest_ranked_passage_first():
+    quotes = [{"section": f"S{i}", "quote": f"Satz eins zu Thema {i} mit etwas Text. Satz zwei zu Thema {i} mit mehr Text."}
+              for i in range(1, 6)]
+    full, _ = context.build_context(quotes, token_budget=0)
+    text, stats = context.build_context(quotes, token_budget=40)
+    assert stats["trimmed_sentences"] > 0 and stats["tokens"] < stats["tokens_full"]
+    assert "Satz eins zu Thema 1" in text and "Thema 5" not in text
+    assert len(text) < len(full)
+
+
+def test_reference_is_expanded_when_its_target_was_trimmed():
+    shared = "Wir wollen den ÖPNV deutlich ausbauen und günstiger machen."
+    quotes = [
+        {"section": "Verkehr", "quote": f"Radwege werden sicherer. {shared}"},
+        {"section": "Klima", "quote": shared},
+    ]
+    text, _ = context.build_context(quotes, token_budget=0)
+    assert "[2] (Section: Klima)\n(Text wie Passage 1)" in text
+    passages = context._passages(quotes)
+    passages[0]["sentences"].pop()  # the referenced sentence is cut from passage 1
+    context._resolve_references(passages)
+    text = context._render(passages)
+    assert "Text wie Passage" not in text
+    assert f"[2] (Section: Klima)\n{shared}" in text and text.count(shared) == 1
+    # Untouched targets keep the reference
+    passages = context._passages(quotes)
+    context._resolve_references(passages)
+    assert "(Text wie Passage 1)" in context._render(passages)
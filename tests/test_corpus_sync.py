@@ -0,0 +1,113 @@
+import json
+import pytest
+import corpus
+
+
+class _Resp:
+    def __init__(self, data, status_code=200):
+        self._data, self.status_code = data, status_code
+
+    def json(self):
+        return self._data
+
+
+class FakeCorpusAPI:
+    """In-memory corpora/documents/chunks behind corpus._get/_post/_post_with_retry/_delete."""
+
+    def __init__(self):
+        self.corpora = {}  # name -> {document name: {"displayName", "chunks": {chunk name: hash}}}
+        self.writes = []
+
+    def add_corpus(self, docs: dict[str, list[str]]):
+        name = "corpora/c1"
+        self.corpora[name] = {f"{name}/documents/{party}": {"displayName": party,
+                                                            "chunks": {f"{name}/documents/{party}/chunks/{i}": h
+                                                                       for i, h in enumerate(hashes)}}
+                              for party, hashes in docs.items()}
+        return name
+
+    def _get(self, url, params=None, timeout=None):
+        path = url.removeprefix(corpus.BASE + "/")
+        if path == "corpora":
+            return _Resp({"corpora": [{"name": n, "displayName": corpus.CORPUS_DISPLAY_NAME} for n in self.corpora]})
+        if path.endswith("/documents"):
+            docs = self.corpora[path.removesuffix("/documents")]
+            return _Resp({"documents": [{"name": d, "displayName": v["displayName"]} for d, v in docs.items()]})
+        doc = path.removesuffix("/chunks")
+        chunks = next(docs[doc]["chunks"] for docs in self.corpora.values() if doc in docs)
+        return _Resp({"chunks": [{"name": c, "customMetadata": [{"key": "hash", "stringValue": h}]}
+                                 for c, h in chunks.items()]})
+
+    def _post(self, url, body, timeout=None):
+        self.writes.append((url.removeprefix(corpus.BASE + "/"), body))
+        if url.endswith("/corpora"):
+            if self.corpora:
+                return _Resp({}, 409)  # one corpus per display name here
+            self.corpora["corpora/new"] = {}
+            return _Resp({"name": "corpora/new"})
+        if url.endswith("/documents"):
+            return _Resp({"name": url.removeprefix(corpus.BASE + "/") + "/" + body["displayName"]})
+        return _Resp({})
+
+    def _delete(self, url, params=None, timeout=None):
+        self.writes.append((url, params))
+        return _Resp({})
+
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeCorpusAPI()
+    monkeypatch.setattr(corpus, "_get", fake._get)
+    monkeypatch.setattr(corpus, "_post", fake._post)
+    monkeypatch.setattr(corpus, "_post_with_retry", lambda url, body, **kw: fake._post(url, body))
+    monkeypatch.setattr(corpus, "_delete", fake._delete)
+    corpus.invalidate_party_doc_map()
+    return fake
+
+
+def _records(tmp_path, records):
+    path = tmp_path / "in.jsonl"
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in records) + "\n", encoding="utf-8")
+    return str(path), [corpus.record_hash({"section": "", **r}) for r in records]
+
+
+KEEP = {"party": "SPD", "section": "Wohnen", "text": "Bezahlbare Wohnungen für alle."}
+NEW = {"party": "SPD", "section": "Verkehr", "text": "Mehr Busse in den Außenbezirken."}
+NEW_PARTY = {"party": "CDU", "section": "Sicherheit", "text": "Mehr Ordnungsdienst in der Innenstadt."}
+
+
+def _existing(api, tmp_path):
+    path, (keep, _, _) = _records(tmp_path, [KEEP, NEW, NEW_PARTY])
+    api.add_corpus({"SPD": [keep, "gone", keep]})  # "gone" and the second copy of `keep` are stale
+    return path
+
+
+def test_sync_adds_keeps_and_deletes_stale(api, tmp_path):
+    report = corpus.sync_lokalomat_corpus(_existing(api, tmp_path))
+
+    assert report == {"SPD": {"unchanged": 1, "added": 1, "stale": 2}, "CDU": {"unchanged": 0, "added": 1, "stale": 0}}
+    uploads = [(u, [r["chunk"]["data"]["stringValue"] for r in b["requests"]])
+               for u, b in api.writes if u.endswith(":batchCreate")]
+    assert sorted(uploads) == [("corpora/c1/documents/CDU/chunks:batchCreate", [NEW_PARTY["text"]]),
+                               ("corpora/c1/documents/SPD/chunks:batchCreate", [NEW["text"]])]
+    deletes = [sorted(r["name"] for r in b["requests"]) for u, b in api.writes if u.endswith(":batchDelete")]
+    assert deletes == [["corpora/c1/documents/SPD/chunks/1", "corpora/c1/documents/SPD/chunks/2"]]
+
+
+def test_keep_stale_leaves_chunks(api, tmp_path):
+    report = corpus.sync_lokalomat_corpus(_existing(api, tmp_path), delete_stale=False)
+    assert report["SPD"]["stale"] == 2
+    assert not [u for u, _ in api.writes if u.endswith(":batchDelete")]
+
+
+def test_dry_run_reports_the_diff_without_writing(api, tmp_path):
+    report = corpus.sync_lokalomat_corpus(_existing(api, tmp_path), dry_run=True)
+    assert report == {"SPD": {"unchanged": 1, "added": 1, "stale": 2}, "CDU": {"unchanged": 0, "added": 1, "stale": 0}}
+    assert api.writes == []
+
+
+def test_dry_run_without_corpus_creates_nothing(api, tmp_path):
+    path, _ = _records(tmp_path, [KEEP, NEW, NEW_PARTY])
+    report = corpus.sync_lokalomat_corpus(path, dry_run=True)
+    assert report == {"SPD": {"unchanged": 0, "added": 2, "stale": 0}, "CDU": {"unchanged": 0, "added": 1, "stale": 0}}
+    assert api.writes == [] and api.corpora == {}
@@ -0,0 +1,67 @@
+import json
+import pytest
+import requests
+import corpus
+
+
+def _http_error(status: int, api_status: str):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps({"error": {"code": status, "status": api_status, "message": "x"}}).encode()
+    return requests.HTTPError(response=resp)
+
+
+def _items(n):
+    return [{"stringValue": f"Chunk {i}", "customMetadata": []} for i in range(n)]
+
+
+class FakeUploader:
+    """Stands in for batchCreate: `reject(texts)` returns the error for a payload, or None to accept it."""
+
+    def __init__(self):
+        self.calls, self.uploaded = [], []
+        self.reject = lambda texts: None
+
+    def __call__(self, url, payload, **kw):
+        texts = [r["chunk"]["data"]["stringValue"] for r in payload["requests"]]
+        self.calls.append(texts)
+        err = self.reject(texts)
+        if err is not None:
+            raise err
+        self.uploaded.extend(texts)
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    fake = FakeUploader()
+    monkeypatch.setattr(corpus, "_post_with_retry", fake)
+    return fake
+
+
+def test_only_the_poisoned_chunk_is_quarantined(uploads, tmp_path):
+    uploads.reject = lambda texts: _http_error(400, "INVALID_ARGUMENT") if "Chunk 5" in texts else None
+    out = tmp_path / "quarantine.jsonl"
+    rejected = corpus.chunks_batch_create("corpora/c/documents/d", _items(9), quarantine=str(out))
+
+    assert [r["index"] for r in rejected] == [5]
+    assert sorted(uploads.uploaded) == sorted(f"Chunk {i}" for i in range(9) if i != 5)
+    lines = [json.loads(l) for l in out.read_text(encoding="utf-8").splitlines()]
+    assert [(l["index"], l["stringValue"], l["status"]) for l in lines] == [(5, "Chunk 5", 400)]
+
+
+def test_rejection_without_quarantine_raises_after_uploading_the_rest(uploads):
+    uploads.reject = lambda texts: _http_error(400, "INVALID_ARGUMENT") if "Chunk 2" in texts else None
+    with pytest.raises(ValueError):
+        corpus.chunks_batch_create("corpora/c/documents/d", _items(4))
+    assert sorted(uploads.uploaded) == ["Chunk 0", "Chunk 1", "Chunk 3"]
+
+
+@pytest.mark.parametrize("status,api_status", [(401, "UNAUTHENTICATED"), (403, "PERMISSION_DENIED"),
+                                               (404, "NOT_FOUND"), (400, "FAILED_PRECONDITION")])
+def test_request_level_errors_abort_without_bisecting(uploads, tmp_path, status, api_status):
+    uploads.reject = lambda texts: _http_error(status, api_status)
+    out = tmp_path / "quarantine.jsonl"
+    with pytest.raises(requests.HTTPError):
+        corpus.chunks_batch_create("corpora/c/documents/d", _items(9), quarantine=str(out))
+    assert len(uploads.calls) == 1
+    assert not out.exists()
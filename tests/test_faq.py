@@ -0,0 +1,29 @@
+import contextvars
+import cache, faq, rag, retrieval
+from semantic_cache import QUESTION_INDEX
+
+
+def test_workers_see_the_callers_context(monkeypatch, tmp_path):
+    seen = []
+
+    def fake_answers(corpus_name, question, parties, **kw):
+        seen.append(("retrieval", cache.current_partition()))
+        return [{"party": p, "status": "ok", "quotes": [{"section": "", "quote": "Text"}]} for p in parties]
+
+    def fake_summary(question, quotes):
+        seen.append(("summary", cache.current_partition()))
+        return "Zusammenfassung"
+    monkeypatch.setattr(retrieval, "answer_per_party_strict", fake_answers)
+    monkeypatch.setattr(rag, "summarize_from_quotes", fake_summary)
+    monkeypatch.setattr(QUESTION_INDEX, "threshold", QUESTION_INDEX.threshold)  # faq.run sets it to 1.0
+    questions = tmp_path / "questions.txt"
+    questions.write_text("Was tun gegen hohe Mieten?\nWie wird die Stadt klimaneutral?\n", encoding="utf-8")
+    out = tmp_path / "store.json"
+
+    def run():
+        cache.use_partition("bochum-2025")
+        return faq.run(str(questions), str(out), "corpora/test", ["SPD", "CDU"], concurrency=2)
+    stats = contextvars.copy_context().run(run)
+
+    assert stats["stored"] == 2
+    assert len(seen) == 6 and all(part == "bochum-2025" for _, part in seen)
@@ -0,0 +1,69 @@
+import asyncio, os, sys
+import httpx
+import pytest
+
+import ratelimit, utils
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+import mock_gemini  # noqa: E402
+
+GEN_URL = f"{utils.BASE}/models/x:generateContent"
+BODY = {"contents": [{"role": "user", "parts": [{"text": "Frage"}]}]}
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    """The mock Gemini app in-process; `delays` are the generateContent latencies (s) in call order."""
+    state = {"delays": [], "cancelled": 0}
+
+    async def delay(ms):
+        try:
+            await asyncio.sleep(state["delays"].pop(0) if state["delays"] else 0.01)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    monkeypatch.setattr(mock_gemini, "_delay", delay)
+    monkeypatch.setattr(utils, "get_async_client",
+                        lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_gemini.app)))
+    monkeypatch.setattr(utils, "HEDGE_PERCENTILE", 90)
+    monkeypatch.setattr(utils, "HEDGE_MIN_DELAY", 0.01)
+    limiter = ratelimit.AdaptiveLimiter("generate", 100, 100, 4)
+    limiter._latencies.extend([0.05] * 20)  # p90 = 50ms
+    monkeypatch.setitem(ratelimit.LIMITERS, "generate", limiter)
+    return state, limiter
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled(mock):
+    state, limiter = mock
+    state["delays"] = [2.0, 0.01]  # original stalls, the hedge is fast
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        r = await utils._apost(GEN_URL, BODY)
+        elapsed = loop.time() - t0
+        await asyncio.sleep(0.05)  # let the cancelled original unwind
+        return r, elapsed
+
+    r, elapsed = asyncio.run(run())
+    assert r.status_code == 200 and "candidates" in r.json()
+    assert elapsed < 1.0
+    assert (limiter.hedged, limiter.hedge_wins) == (1, 1)
+    assert state["cancelled"] == 1 and limiter.in_flight == 0
+
+
+def test_call_faster_than_the_percentile_is_not_hedged(mock):
+    state, limiter = mock
+    state["delays"] = [0.02]
+    r = asyncio.run(utils._apost(GEN_URL, BODY))
+    assert r.status_code == 200
+    assert (limiter.hedged, limiter.hedge_wins) == (0, 0)
+
+
+def test_no_hedge_without_enough_samples(mock):
+    state, limiter = mock
+    limiter._latencies.clear()
+    state["delays"] = [0.2]
+    asyncio.run(utils._apost(GEN_URL, BODY))
+    assert limiter.hedged == 0
@@ -0,0 +1,126 @@
+import json, threading, time
+import pytest
+import requests
+import corpus, utils
+
+
+def _http_error(status: int, api_status: str):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps({"error": {"code": status, "status": api_status}}).encode()
+    return requests.HTTPError(response=resp)
+
+
+class FakeBatchCreate:
+    """Thread-safe batchCreate: `reject(texts)` returns the error for a payload, or None to accept it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls, self.uploaded = [], []
+        self.reject = lambda texts: None
+
+    def __call__(self, url, payload, **kw):
+        texts = [r["chunk"]["data"]["stringValue"] for r in payload["requests"]]
+        with self.lock:
+            self.calls.append(texts)
+        err = self.reject(texts)
+        if err is not None:
+            raise err
+        with self.lock:
+            self.uploaded.extend(texts)
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    fake = FakeBatchCreate()
+    monkeypatch.setattr(corpus, "corpora_create", lambda *a, **kw: "corpora/b")
+    monkeypatch.setattr(corpus, "ensure_document", lambda corpus_name, display_name, custom_metadata=None:
+                        f"{corpus_name}/documents/{display_name}")
+    monkeypatch.setattr(corpus, "_post_with_retry", fake)
+    return fake
+
+
+def _jsonl(tmp_path, texts):
+    path = tmp_path / "in.jsonl"
+    path.write_text("\n".join(json.dumps({"party": "SPD", "section": "S", "text": t}, ensure_ascii=False)
+                              for t in texts) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_rejected_batch_is_bisected_down_to_the_bad_record(remote, tmp_path):
+    texts = [f"Punkt {i} des Programms." for i in range(16)]
+    texts[11] = "GIFT im Text."
+    remote.reject = lambda batch: _http_error(400, "INVALID_ARGUMENT") if "GIFT im Text." in batch else None
+    quarantine = tmp_path / "q.jsonl"
+
+    corpus.build_lokalomat_corpus(_jsonl(tmp_path, texts), batch_size=16, max_workers=2, quarantine=str(quarantine))
+
+    assert sorted(remote.uploaded) == sorted(t for t in texts if t != "GIFT im Text.")
+    assert len(remote.calls) <= 1 + 2 * 4  # log2(16) levels, two halves each
+    lines = [json.loads(l) for l in quarantine.read_text(encoding="utf-8").splitlines()]
+    assert [(l["stringValue"], l["index"], l["status"]) for l in lines] == [("GIFT im Text.", 11, 400)]
+
+
+@pytest.mark.parametrize("status,api_status", [(403, "PERMISSION_DENIED"), (404, "NOT_FOUND"),
+                                               (400, "FAILED_PRECONDITION"), (503, "UNAVAILABLE")])
+def test_only_invalid_argument_is_quarantined(remote, tmp_path, status, api_status):
+    remote.reject = lambda batch: _http_error(status, api_status)
+    quarantine = tmp_path / "q.jsonl"
+    with pytest.raises(requests.HTTPError):
+        corpus.build_lokalomat_corpus(_jsonl(tmp_path, [f"Punkt {i}." for i in range(8)]), batch_size=4,
+                                      max_workers=1, quarantine=str(quarantine))
+    assert not quarantine.exists()
+    assert all(len(c) == 4 for c in remote.calls)  # never bisected
+
+
+def test_retryable_errors_are_retried_before_giving_up(monkeypatch):
+    calls = []
+
+    def flaky(url, body, timeout=None):
+        calls.append(1)
+        if len(calls) < 3:
+            raise _http_error(429 if len(calls) == 1 else 503, "X")
+        return "ok"
+    monkeypatch.setattr(utils, "_post", flaky)
+    monkeypatch.setattr(utils.time, "sleep", lambda s: None)
+    assert utils._post_with_retry("u", {}) == "ok" and len(calls) == 3
+
+
+def test_pipeline_bounds_batches_in_flight():
+    lock, state = threading.Lock(), {"running": 0, "max_running": 0}
+    release = threading.Event()
+
+    def upload(doc, batch):
+        with lock:
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        release.wait(2)
+        with lock:
+            state["running"] -= 1
+        return []
+
+    pipeline = corpus._UploadPipeline(2, upload)
+    submitted = []
+    producer = threading.Thread(target=lambda: [pipeline.submit("d", [i]) or submitted.append(i) for i in range(20)])
+    producer.start()
+    time.sleep(0.2)
+    assert len(submitted) == 4  # 2 uploading + 2 queued, then the producer blocks
+    release.set()
+    producer.join(5)
+    pipeline.close()
+    assert state["max_running"] == 2
+    assert pipeline.batches_done == 20 and pipeline.chunks_done == 20 and not pipeline.errors
+
+
+def test_pipeline_collects_errors_and_keeps_going():
+    def upload(doc, batch):
+        if batch == ["kaputt"]:
+            raise RuntimeError("boom")
+        return [{"index": 0}] if batch == ["abgelehnt"] else []
+
+    pipeline = corpus._UploadPipeline(2, upload)
+    for batch in (["a"], ["kaputt"], ["abgelehnt"], ["b"]):
+        pipeline.submit("d", batch)
+    pipeline.close()
+    assert [d for d, _ in pipeline.errors] == ["d"] and pipeline.batches_done == 3
+    assert pipeline.rejected == 1 and pipeline.chunks_done == 2
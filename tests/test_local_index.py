@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import pytest
+import local_index
+
+CALLS = []
+
+def fake_embed(text: str):
+    """Two-dimensional 'model': Wohnen → x, Verkehr → y."""
+    CALLS.append(text)
+    return np.array([1.0, 0.0] if "Miete" in text or "Wohn" in text else [0.0, 1.0], dtype=np.float32)
+
+
+@pytest.fixture
+def external_index(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in [
+        {"party": "SPD", "section": "Wohnen", "text": "Bezahlbare Wohnungen für alle."},
+        {"party": "CDU", "section": "Verkehr", "text": "Mehr Busse und Bahnen."},
+    ]) + "\n", encoding="utf-8")
+    out = tmp_path / "idx"
+    local_index.build_local_index(str(src), str(out), embeddings=np.array([[1.0, 0.0], [0.0, 1.0]]))
+    return out
+
+
+def test_external_embeddings_use_the_configured_query_embedder(external_index, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_QUERY_EMBEDDER", f"{__name__}:fake_embed")
+    CALLS.clear()
+    index = local_index.LocalIndex(external_index)
+    hits = index.query("Was tun gegen hohe Mieten?", 2)
+    assert CALLS == ["Was tun gegen hohe Mieten?"]
+    assert hits[0]["chunk"]["data"]["stringValue"] == "Bezahlbare Wohnungen für alle."
+
+
+def test_external_embeddings_without_embedder_fall_back_to_bm25(external_index, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_QUERY_EMBEDDER", None)
+    assert local_index.LocalIndex(external_index).embed_query is None
+
+
+def test_malformed_embedder_setting_is_rejected(external_index, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_QUERY_EMBEDDER", "no_colon")
+    with pytest.raises(ValueError):
+        local_index.LocalIndex(external_index)
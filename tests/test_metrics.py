@@ -0,0 +1,18 @@
+from fastapi.testclient import TestClient
+import metrics
+
+
+def test_metrics_with_int_and_string_statuses():
+    metrics.record_upstream("https://example.test/v1beta/corpora/x:query", 200, 0.1, 10, 20)
+    metrics.record_upstream("https://example.test/v1beta/corpora/x:query", "error", 0.2)
+    text = metrics.expose()
+    assert 'status="200"' in text and 'status="error"' in text
+
+
+def test_metrics_endpoint_after_mixed_statuses():
+    import serve.main as m
+    metrics.record_upstream("https://example.test/v1beta/models/x:generateContent", 429, 0.1)
+    metrics.record_upstream("https://example.test/v1beta/models/x:generateContent", "error", 0.1)
+    r = TestClient(m.app).get("/metrics")
+    assert r.status_code == 200
+    assert "kommunalomat_upstream_seconds_count" in r.text
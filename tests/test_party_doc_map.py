@@ -0,0 +1,65 @@
+import threading, time
+import pytest
+import corpus
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    """Fake documents_list: counts calls per corpus; corpora in `blocked` hang until released."""
+    class Listing:
+        def __init__(self):
+            self.calls, self.blocked, self.release = [], set(), threading.Event()
+
+        def __call__(self, corpus_id):
+            self.calls.append(corpus_id)
+            if corpus_id in self.blocked:
+                assert self.release.wait(5)
+            return [{"displayName": "SPD", "name": f"corpora/{corpus_id}/documents/spd"}]
+
+    fake = Listing()
+    monkeypatch.setattr(corpus, "documents_list", fake)
+    monkeypatch.setattr(corpus, "_party_doc_maps", {})
+    monkeypatch.setattr(corpus, "_party_doc_map_locks", {})
+    yield fake
+    fake.release.set()
+
+
+def test_slow_listing_does_not_block_other_corpora(listing):
+    listing.blocked.add("slow")
+    t = threading.Thread(target=corpus.party_doc_map, args=("corpora/slow",))
+    t.start()
+    time.sleep(0.05)
+    t0 = time.monotonic()
+    by_norm, _ = corpus.party_doc_map("corpora/fast")
+    assert time.monotonic() - t0 < 1
+    assert by_norm == {"SPD": "corpora/fast/documents/spd"}
+    listing.release.set()
+    t.join(5)
+
+
+def test_concurrent_cold_lookups_list_once(listing):
+    listing.blocked.add("cold")
+    threads = [threading.Thread(target=corpus.party_doc_map, args=("corpora/cold",)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    listing.release.set()
+    for t in threads:
+        t.join(5)
+    assert listing.calls == ["cold"]
+
+
+def test_expired_map_is_served_and_refreshed_in_background(listing, monkeypatch):
+    monkeypatch.setattr(corpus, "PARTY_DOC_MAP_TTL", 60)
+    corpus._party_doc_maps["stale"] = (time.monotonic() - 120, {"SPD": "old"}, {"SPD": "SPD"})
+    listing.blocked.add("stale")
+
+    by_norm, _ = corpus.party_doc_map("corpora/stale")  # returns at once although the listing hangs
+    assert by_norm == {"SPD": "old"}
+    listing.release.set()
+    for _ in range(100):
+        if corpus._party_doc_maps["stale"][1] != {"SPD": "old"}:
+            break
+        time.sleep(0.01)
+    assert corpus.party_doc_map("corpora/stale")[0] == {"SPD": "corpora/stale/documents/spd"}
+    assert listing.calls == ["stale"]
@@ -0,0 +1,38 @@
+import importlib, json
+import pytest
+import corpus
+
+
+def _jsonl(path, records):
+    path.write_text("\n".join(r if isinstance(r, str) else json.dumps(r, ensure_ascii=False) for r in records) + "\n",
+                    encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    calls = []
+    monkeypatch.setattr(corpus, "corpora_create", lambda *a, **kw: calls.append("corpora_create") or "corpora/new")
+    monkeypatch.setattr(corpus, "_remote_chunks_by_hash", lambda name: calls.append("list") or ({}, {}))
+    return calls
+
+
+@pytest.mark.parametrize("bad", [
+    {"party": "SPD", "section": "Wohnen", "text": "x" * 12000},  # one "word" over CHUNK_MAX_TOKENS
+    "{not json",
+    {"party": "", "text": "Ohne Partei"},
+])
+@pytest.mark.parametrize("run", [corpus.build_lokalomat_corpus, corpus.sync_lokalomat_corpus])
+def test_bad_input_aborts_before_the_corpus_is_touched(tmp_path, remote, bad, run):
+    path = _jsonl(tmp_path / "in.jsonl", [{"party": "SPD", "section": "Wohnen", "text": "Mehr Wohnungen."}, bad])
+    with pytest.raises(ValueError, match="Pre-flight failed"):
+        run(path)
+    assert remote == []
+
+
+def test_import_does_not_load_dotenv(monkeypatch):
+    import dotenv, preflight
+    calls = []
+    monkeypatch.setattr(dotenv, "load_dotenv", lambda *a, **kw: calls.append(a))
+    importlib.reload(preflight)
+    assert calls == []
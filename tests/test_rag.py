@@ -0,0 +1,115 @@
+import asyncio, json
+import pytest
+import rag
+from cache import SUMMARY_CACHE
+
+QUESTION = "Was wollen die Parteien für den Radverkehr tun?"
+
+
+def _answer(party):
+    return {"party": party, "status": "ok", "quotes": [{"section": "Verkehr", "quote": f"{party} baut Radwege aus."}]}
+
+
+class _Resp:
+    def __init__(self, text):
+        self._data = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+    def json(self):
+        return self._data
+
+
+class FakeGemini:
+    """Answers batched calls with `batch(prompt)` and single calls with `single(prompt)` (raise to fail)."""
+
+    def __init__(self):
+        self.calls = []
+        self.batch = lambda prompt: "[]"
+        self.single = lambda prompt: "Einzeln zusammengefasst."
+
+    def __call__(self, url, body, timeout=None):
+        prompt = body["contents"][0]["parts"][0]["text"]
+        batched = "responseSchema" in body["generationConfig"]
+        self.calls.append("batch" if batched else "single")
+        return _Resp((self.batch if batched else self.single)(prompt))
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(rag, "_post", fake)
+
+    async def apost(url, body, timeout=None):
+        return fake(url, body, timeout)
+    monkeypatch.setattr(rag, "_apost", apost)
+    SUMMARY_CACHE.clear()
+    return fake
+
+
+@pytest.mark.parametrize("text", ["", "kein JSON", "```json\n[]\n```", "null", "42", '[{"party": "SPD"}]'])
+def test_malformed_batch_output_yields_nothing(text):
+    assert rag._parse_batch(text, ["SPD"]) == {}
+
+
+def test_batch_output_is_mapped_to_the_requested_labels():
+    text = json.dumps([{"party": "Grüne", "summary": " Grün. "}, {"party": "AfD", "summary": "fremd"},
+                       {"party": "CDU", "summary": ""}, "kaputt"], ensure_ascii=False)
+    decomposed = "Grüne"  # same label in NFD
+    assert rag._parse_batch(text, [decomposed, "CDU", "SPD"]) == {decomposed: "Grün."}
+    assert rag._parse_batch('{"SPD": "Rot."}', ["SPD"]) == {"SPD": "Rot."}
+
+
+def test_batches_are_split_by_token_budget():
+    items = [(p, _answer(p)["quotes"]) for p in ("SPD", "CDU", "Grüne", "FDP")]
+    one = rag._split_batches(QUESTION, items, 10**6)
+    assert one == [items]
+    fixed = rag.estimate_tokens(rag.BATCH_INSTRUCTIONS + rag.INSTRUCTIONS + QUESTION)
+    cost = {p: rag.estimate_tokens(rag._party_block(p, q)[0]) for p, q in items}
+    budget = fixed + cost["SPD"] + cost["CDU"]
+    split = rag._split_batches(QUESTION, items, budget)
+    assert split[0] == items[:2] and len(split) > 1 and sum(split, []) == items
+    assert all(fixed + sum(cost[p] for p, _ in b) <= budget for b in split)
+    assert [len(b) for b in rag._split_batches(QUESTION, items, 1)] == [1, 1, 1, 1]  # oversized: one each
+
+
+def test_parties_missing_from_the_batch_fall_back_to_single_calls(gemini):
+    gemini.batch = lambda prompt: json.dumps([{"party": "SPD", "summary": "Aus dem Batch."}])
+    answers = [_answer("SPD"), _answer("CDU")]
+    rag.summarize_answers_batched(QUESTION, answers)
+    assert [a["summary"] for a in answers] == ["Aus dem Batch.", "Einzeln zusammengefasst."]
+    assert gemini.calls == ["batch", "single"]
+
+
+def test_unparsable_batch_falls_back_for_every_party(gemini):
+    gemini.batch = lambda prompt: "Leider kann ich das nicht als JSON liefern."
+    answers = [_answer("SPD"), _answer("CDU")]
+    rag.summarize_answers_batched(QUESTION, answers)
+    assert [a["summary"] for a in answers] == ["Einzeln zusammengefasst."] * 2
+    assert gemini.calls == ["batch", "single", "single"]
+
+
+def test_failed_fallback_is_reported_per_party(gemini):
+    def broken(prompt):
+        raise RuntimeError("quota")
+    gemini.batch = broken
+    gemini.single = lambda prompt: broken(prompt) if "CDU" in prompt else "SPD einzeln."
+    answers = [_answer("SPD"), _answer("CDU")]
+    rag.summarize_answers_batched(QUESTION, answers)
+    assert answers[0]["summary"] == "SPD einzeln."
+    assert answers[1]["summary_status"] == "error" and "quota" in answers[1]["summary_error"]
+
+
+def test_cached_summaries_skip_the_batch(gemini):
+    answers = [_answer("SPD"), _answer("CDU")]
+    gemini.batch = lambda prompt: json.dumps([{"party": "SPD", "summary": "S."}, {"party": "CDU", "summary": "C."}])
+    rag.summarize_answers_batched(QUESTION, answers)
+    again = [_answer("SPD"), _answer("CDU")]
+    rag.summarize_answers_batched(QUESTION, again)
+    assert [a["summary"] for a in again] == ["S.", "C."] and gemini.calls == ["batch"]
+
+
+def test_async_batch_falls_back_for_missing_parties(gemini):
+    gemini.batch = lambda prompt: json.dumps([{"party": "CDU", "summary": "Aus dem Batch."}])
+    answers = [_answer("SPD"), _answer("CDU"), {"party": "FDP", "status": "no_info"}]
+    asyncio.run(rag.summarize_answers_batched_async(QUESTION, answers))
+    assert [a.get("summary") for a in answers] == ["Einzeln zusammengefasst.", "Aus dem Batch.", None]
+    assert gemini.calls == ["batch", "single"]
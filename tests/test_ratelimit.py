@@ -0,0 +1,129 @@
+import asyncio, threading, time
+import pytest
+import ratelimit
+from ratelimit import AdaptiveLimiter, RateLimitTimeout
+
+
+def _limiter(concurrency=8, rps=1000.0):
+    return AdaptiveLimiter("test", rps=rps, burst=rps, max_concurrency=concurrency)
+
+
+def test_429_halves_the_limit_and_success_grows_it_back():
+    limiter = _limiter(8)
+    limiter.acquire()
+    limiter.release(429, 0.1, "0")
+    assert limiter.limit == 4 and limiter.throttled == 1 and limiter.tokens == 0
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(200, 0.1)
+    assert 4.5 < limiter.limit < 5  # additive: +1/limit per fast success
+    limiter.acquire()
+    limiter.release(429, None, "0")
+    assert limiter.limit == pytest.approx(4.7 / 2, abs=0.2)
+
+
+def test_limit_never_drops_below_the_minimum():
+    limiter = _limiter(2)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(429, None, "0")
+    assert limiter.limit == limiter.min_concurrency
+
+
+def test_retry_after_pauses_the_class():
+    limiter = _limiter()
+    limiter.acquire()
+    limiter.release(429, None, "0.2")
+    t0 = time.monotonic()
+    with pytest.raises(RateLimitTimeout):  # the pause ends after the deadline: fail right away
+        limiter.acquire(deadline=t0 + 0.1)
+    assert time.monotonic() - t0 < 0.05
+    limiter.acquire(deadline=t0 + 2)
+    assert time.monotonic() - t0 >= 0.19
+    limiter.release(200)
+
+
+def test_missing_retry_after_backs_off_exponentially():
+    limiter = _limiter()
+    pauses = []
+    for _ in range(3):
+        limiter.in_flight += 1
+        limiter.release(429, None, None)
+        pauses.append(limiter.blocked_until - time.monotonic())
+    assert 0.4 < pauses[0] <= 1 and 1.9 < pauses[2] <= 4
+
+
+def test_waiters_are_woken_by_release_not_by_polling(monkeypatch):
+    limiter = _limiter(1)
+    tries = []
+    try_ = limiter._try
+    monkeypatch.setattr(limiter, "_try", lambda *a: tries.append(1) or try_(*a))
+    limiter.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: (limiter.acquire(time.monotonic() + 5), got.append(time.monotonic())))
+    waiter.start()
+    time.sleep(0.3)
+    released = time.monotonic()
+    limiter.release(200)
+    waiter.join(2)
+    assert got and got[0] - released < 0.05
+    assert len(tries) <= 4  # 1 for the holder, the rest for the waiter: no 10ms polling over 300ms
+    limiter.release(200)
+
+
+def test_async_waiters_are_woken_by_release():
+    limiter = _limiter(1)
+
+    async def main():
+        await limiter.acquire_async()
+        waiter = asyncio.create_task(limiter.acquire_async(time.monotonic() + 5))
+        await asyncio.sleep(0.2)
+        assert not waiter.done()
+        t0 = time.monotonic()
+        limiter.release(200)
+        await asyncio.wait_for(waiter, 1)
+        return time.monotonic() - t0
+    assert asyncio.run(main()) < 0.05
+    limiter.release(200)
+    assert limiter.stats()["queued"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = _limiter(1)
+
+    async def main():
+        await limiter.acquire_async()
+        waiter = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    asyncio.run(main())
+    assert limiter.stats()["queued"] == 0 and not limiter._wakers
+
+
+def test_busy_partitions_take_turns():
+    limiter = _limiter(1)
+    order = []
+
+    def call(part, name, hold):
+        ratelimit.use_partition(part)
+        limiter.acquire(time.monotonic() + 5)
+        order.append(name)
+        hold.wait(1)
+        limiter.release(200)
+
+    hold = threading.Event()
+    threads = [threading.Thread(target=call, args=("a", "a0", hold))]
+    threads[0].start()
+    time.sleep(0.05)  # a0 holds the slot
+    for i in range(1, 4):
+        for part in ("a", "b"):
+            t = threading.Thread(target=call, args=(part, f"{part}{i}", hold))
+            t.start()
+            threads.append(t)
+            time.sleep(0.01)
+    hold.set()
+    for t in threads:
+        t.join(5)
+    assert order == ["a0", "b1", "a1", "b2", "a2", "b3", "a3"]
@@ -0,0 +1,140 @@
+import asyncio, json, os
+import pytest
+import cache, ratelimit, registry
+from semantic_cache import PartitionedQuestionIndex
+
+
+def _write(path, cfg):
+    path.write_text(json.dumps(cfg), encoding="utf-8")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))  # distinct mtime on coarse clocks
+
+
+@pytest.fixture
+def reg(tmp_path):
+    path = tmp_path / "corpora.json"
+    _write(path, {"default": "dortmund-2025", "corpora": {
+        "dortmund-2025": {"corpus": "corpora/do", "city": "Dortmund", "year": 2025, "hosts": ["dortmund.test"]},
+        "bochum-2025": {"corpus": "corpora/bo", "city": "Bochum", "year": 2025, "hosts": ["bochum.test"],
+                        "parties": ["SPD", "CDU"], "max_requests": 1},
+    }})
+    r = registry.Registry(str(path), reload_interval=0.0001)
+    r.load()
+    r.file = path
+    return r
+
+
+def test_routing_by_key_host_and_default(reg):
+    assert reg.resolve("bochum-2025").corpus == "corpora/bo"
+    assert reg.resolve(None, "bochum.test:8080").key == "bochum-2025"
+    assert reg.resolve(None, "unknown.test").key == "dortmund-2025"
+    assert reg.resolve("dortmund-2025", "bochum.test").key == "dortmund-2025"  # explicit key wins
+    assert reg.resolve("bochum-2025").parties == ["SPD", "CDU"]
+    assert reg.resolve("dortmund-2025").title == "Kommunal-O-Mat Dortmund 2025"
+    with pytest.raises(registry.UnknownCorpus):
+        reg.resolve("essen-2025")
+
+
+def test_reload_adds_entries_and_keeps_registry_on_errors(reg):
+    cfg = json.loads(reg.file.read_text(encoding="utf-8"))
+    cfg["corpora"]["essen-2025"] = {"corpus": "corpora/es", "city": "Essen"}
+    limiter = reg.resolve("bochum-2025").limiter
+    _write(reg.file, cfg)
+    assert reg.resolve("essen-2025").corpus == "corpora/es"
+    assert reg.resolve("bochum-2025").limiter is limiter  # in-flight counts survive a reload
+
+    reg.file.write_text("{broken", encoding="utf-8")
+    st = os.stat(reg.file)
+    os.utime(reg.file, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000))
+    assert reg.resolve("essen-2025").corpus == "corpora/es"
+    assert reg.error and "JSONDecodeError" in reg.error
+
+
+def test_without_file_single_entry_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("CORPUS_NAME", "corpora/env")
+    r = registry.Registry(str(tmp_path / "missing.json"))
+    assert r.resolve().corpus == "corpora/env"
+
+
+def test_admission_is_bounded_per_corpus(reg):
+    bochum, dortmund = reg.resolve("bochum-2025"), reg.resolve("dortmund-2025")
+
+    async def main():
+        async with bochum.admit(None):
+            with pytest.raises(registry.CorpusBusy):
+                async with bochum.admit(0.05):
+                    pass
+            async with dortmund.admit(0.05):  # other city unaffected
+                pass
+        async with bochum.admit(0.05):
+            pass
+    asyncio.run(main())
+    assert bochum.limiter.stats()["rejected"] == 1 and bochum.limiter.in_flight == 0
+
+
+def test_answer_cache_partitions_are_separate():
+    c = cache.AnswerCache("test", maxsize=2, ttl=0)
+
+    async def in_partition(name, fn):
+        cache.use_partition(name)
+        return fn()
+
+    async def main():
+        await asyncio.create_task(in_partition("a", lambda: c.set("k", 1)))
+        assert await asyncio.create_task(in_partition("b", lambda: c.get("k"))) is None
+        for i in range(5):  # fills b only
+            await asyncio.create_task(in_partition("b", lambda i=i: c.set(f"x{i}", i)))
+        assert await asyncio.create_task(in_partition("a", lambda: c.get("k"))) == 1
+    asyncio.run(main())
+    assert set(c.stats()["partitions"]) == {"a", "b"}
+
+
+def test_question_index_is_keyed_by_corpus():
+    index = PartitionedQuestionIndex(size=8)
+
+    async def in_partition(name, fn):
+        cache.use_partition(name)
+        return fn()
+
+    async def main():
+        await asyncio.create_task(in_partition("a", lambda: index.add("Was soll gegen steigende Mieten getan werden?", "s")))
+        same = await asyncio.create_task(in_partition(
+            "a", lambda: index.lookup("Was wollen die Parteien gegen steigende Mieten tun?", "s")))
+        other = await asyncio.create_task(in_partition(
+            "b", lambda: index.lookup("Was wollen die Parteien gegen steigende Mieten tun?", "s")))
+        return same, other
+    same, other = asyncio.run(main())
+    assert same is not None and other is None
+
+
+def test_activate_ignores_the_entry_city_in_its_question_index(reg):
+    import contextvars, semantic_cache
+    ctx = contextvars.copy_context()
+    ctx.run(reg.resolve("bochum-2025").activate)
+    ctx.run(semantic_cache.QUESTION_INDEX.add, "Was plant die Partei für Radwege?", "corpora/bo")
+    assert ctx.run(semantic_cache.QUESTION_INDEX.lookup, "Radwege in Bochum?", "corpora/bo") is not None
+    assert semantic_cache.QUESTION_INDEX.index("bochum-2025").city == "Bochum"
+
+
+def test_upstream_slot_goes_to_the_corpus_with_fewer_calls_in_flight():
+    limiter = ratelimit.AdaptiveLimiter("test", rps=1000, burst=1000, max_concurrency=1)
+    order = []
+
+    async def call(part, name, hold):
+        ratelimit.use_partition(part)
+        await limiter.acquire_async()
+        order.append(name)
+        await hold.wait()
+        limiter.release(200)
+
+    async def main():
+        hold = asyncio.Event()
+        tasks = [asyncio.create_task(call("busy", f"busy{i}", hold)) for i in range(4)]
+        await asyncio.sleep(0.05)  # busy0 runs, busy1-3 queue
+        tasks.append(asyncio.create_task(call("quiet", "quiet", hold)))
+        await asyncio.sleep(0.05)
+        hold.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    asyncio.run(main())
+    assert order[:2] == ["busy0", "quiet"]
+    assert limiter.stats()["in_flight"] == 0
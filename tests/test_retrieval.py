@@ -0,0 +1,146 @@
+import asyncio, time
+import pytest
+import corpus, retrieval
+from cache import HITS_CACHE, hits_key
+
+
+@pytest.fixture
+def warm_map(monkeypatch):
+    monkeypatch.setattr(corpus, "_party_doc_maps", {
+        "warm": (time.monotonic(), {"SPD": "corpora/warm/documents/spd"}, {"SPD": "SPD"})})
+    return "corpora/warm"
+
+
+def test_warm_party_map_is_served_without_a_thread(warm_map, monkeypatch):
+    async def no_thread(*a, **kw):
+        raise AssertionError("to_thread used for a cached map")
+    monkeypatch.setattr(retrieval.asyncio, "to_thread", no_thread)
+    HITS_CACHE.set(hits_key(warm_map, "Was tun gegen hohe Mieten?", "SPD", 2), [{"chunk": {}}])
+
+    hits, party = asyncio.run(retrieval.retrieve_party_hits_async(warm_map, "SPD", "Was tun gegen hohe Mieten?"))
+    assert party == "SPD" and hits == [{"chunk": {}}]
+
+
+def test_cold_party_map_is_listed_in_a_thread(monkeypatch):
+    monkeypatch.setattr(corpus, "_party_doc_maps", {})
+    listed = []
+
+    def fake_list(corpus_name):
+        listed.append(corpus_name)
+        return [{"displayName": "SPD", "name": f"corpora/{corpus_name}/documents/spd"}]
+    monkeypatch.setattr(corpus, "documents_list", fake_list)
+
+    docs_map, party_map = asyncio.run(retrieval.map_party_to_doc_async("corpora/cold"))
+    assert docs_map == {"SPD": "corpora/cold/documents/spd"} and listed == ["cold"]
+    assert asyncio.run(retrieval.map_party_to_doc_async("corpora/cold"))[1] == {"SPD": "SPD"}
+    assert listed == ["cold"]
+
+
+def test_concurrent_workers_see_the_request_context(monkeypatch):
+    import budget, cache, ratelimit
+    seen = []
+
+    def fake_hits(corpus_name, party, question, k=2):
+        seen.append((party, budget.deadline(), cache.current_partition(), ratelimit._partition.get()))
+        return [], party
+    monkeypatch.setattr(retrieval, "retrieve_party_hits", fake_hits)
+
+    def request():
+        deadline = budget.start(10)
+        cache.use_partition("bochum-2025")
+        ratelimit.use_partition("bochum-2025")
+        retrieval.answer_per_party_strict("corpora/test", "Was tun gegen hohe Mieten?", ["SPD", "CDU"])
+        return deadline
+    import contextvars
+    deadline = contextvars.copy_context().run(request)
+    assert sorted(seen) == [("CDU", deadline, "bochum-2025", "bochum-2025"),
+                            ("SPD", deadline, "bochum-2025", "bochum-2025")]
+
+
+def _hit(text, party=None, doc=None, score=0.9):
+    meta = [{"key": "party", "stringValue": party}] if party else []
+    name = f"corpora/g/documents/{doc}/chunks/{text}" if doc else f"corpora/g/chunks/{text}"
+    return {"chunkRelevanceScore": score, "chunk": {"name": name, "data": {"stringValue": text}, "customMetadata": meta}}
+
+
+class FakeQuery(list):
+    """Records corpora_query calls; each call answers with the next of `responses`(name, filters)."""
+
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+
+    def __call__(self, corpus_name, query, results_count=10, metadata_filters=None):
+        self.append((corpus_name, results_count, metadata_filters))
+        return self.responses.pop(0)(corpus_name, metadata_filters)
+
+
+@pytest.fixture
+def grouped_corpus(monkeypatch):
+    docs = {"SPD": "corpora/g/documents/spd", "CDU": "corpora/g/documents/cdu", "Grüne": "corpora/g/documents/gruene"}
+    monkeypatch.setattr(corpus, "_party_doc_maps", {"g": (time.monotonic(), docs, {p: p for p in docs})})
+    HITS_CACHE.clear()
+    queries = FakeQuery()
+    monkeypatch.setattr(retrieval, "corpora_query", queries)
+
+    async def query_async(*a, **kw):
+        return queries(*a, **kw)
+    monkeypatch.setattr(retrieval, "corpora_query_async", query_async)
+    return queries
+
+
+def _filtered(metadata_filters):
+    return [c["stringValue"] for c in metadata_filters[0]["conditions"]]
+
+
+def test_grouped_hits_are_split_per_party(grouped_corpus):
+    grouped_corpus.responses.append(lambda name, filters: [
+        _hit("spd1", "SPD"), _hit("afd1", "AfD"), _hit("cdu1", "CDU"),
+        _hit("spd2", doc="spd"),             # no party metadata: attributed by its document
+        _hit("x1"),                          # neither: dropped
+        _hit("spd3", "SPD"), _hit("cdu2", "CDU"), _hit("gruene1", "Grüne"), _hit("gruene2", "Grüne"),
+    ])
+    out = retrieval.retrieve_grouped_hits("corpora/g", ["SPD", "CDU", "Grüne"], "Radwege im Grouped-Test?", k=2)
+
+    texts = {p: [h["chunk"]["data"]["stringValue"] for h in hits] for p, (hits, _) in out.items()}
+    assert texts == {"SPD": ["spd1", "spd2"], "CDU": ["cdu1", "cdu2"], "Grüne": ["gruene1", "gruene2"]}
+    assert len(grouped_corpus) == 1 and sorted(_filtered(grouped_corpus[0][2])) == ["CDU", "Grüne", "SPD"]
+
+
+def test_crowded_out_party_gets_a_follow_up_query(grouped_corpus):
+    grouped_corpus.responses += [
+        lambda name, filters: [_hit(f"spd{i}", "SPD") for i in range(12)],  # full page, CDU crowded out
+        lambda name, filters: [_hit("cdu1", "CDU")],
+    ]
+    out = retrieval.retrieve_grouped_hits("corpora/g", ["SPD", "CDU"], "Radwege im Follow-up-Test?", k=2, overfetch=3)
+    assert len(out["SPD"][0]) == 2 and [h["chunk"]["data"]["stringValue"] for h in out["CDU"][0]] == ["cdu1"]
+    assert _filtered(grouped_corpus[1][2]) == ["CDU"]
+
+
+def test_unknown_party_is_not_queried(grouped_corpus):
+    grouped_corpus.responses.append(lambda name, filters: [_hit("spd1", "SPD")])
+    out = retrieval.retrieve_grouped_hits("corpora/g", ["SPD", "Volt"], "Radwege im Unbekannt-Test?", k=2)
+    assert out["Volt"] == ([], "Volt") and _filtered(grouped_corpus[0][2]) == ["SPD"]
+
+
+def _rejected_filter_then_per_document(grouped_corpus):
+    def grouped(name, filters):
+        raise RuntimeError("400 metadataFilters")
+    per_doc = lambda name, filters: [_hit(name.rsplit("/", 1)[1] + "1", doc=name.rsplit("/", 1)[1])]
+    grouped_corpus.responses += [grouped, per_doc, per_doc]
+
+
+def test_grouped_failure_falls_back_to_per_document(grouped_corpus):
+    _rejected_filter_then_per_document(grouped_corpus)
+    answers = retrieval.answer_per_party_strict("corpora/g", "Radwege im Fallback-Test?", ["SPD", "CDU"],
+                                                strategy="grouped", concurrent=False)
+    assert [(a["party"], a["status"], a["quotes"][0]["quote"]) for a in answers] == [("SPD", "ok", "spd1"), ("CDU", "ok", "cdu1")]
+    assert [q[0] for q in grouped_corpus] == ["corpora/g", "corpora/g/documents/spd", "corpora/g/documents/cdu"]
+
+
+def test_grouped_failure_falls_back_to_per_document_async(grouped_corpus):
+    _rejected_filter_then_per_document(grouped_corpus)
+    answers = asyncio.run(retrieval.answer_per_party_strict_async(
+        "corpora/g", "Radwege im Async-Fallback-Test?", ["SPD", "CDU"], strategy="grouped", max_workers=1))
+    assert [(a["party"], a["status"]) for a in answers] == [("SPD", "ok"), ("CDU", "ok")]
+    assert grouped_corpus[0][2] is not None and [q[2] for q in grouped_corpus[1:]] == [None, None]
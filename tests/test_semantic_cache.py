@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from semantic_cache import QuestionIndex, embed_question
+
+
+def _score(a: str, b: str) -> float:
+    return float(np.dot(embed_question(a), embed_question(b)))
+
+
+def _index(*questions, scope="corpora/test"):
+    index = QuestionIndex(size=16, threshold=0.85)
+    for q in questions:
+        index.add(q, scope)
+    return index
+
+
+@pytest.mark.parametrize("asked,indexed", [
+    ("Ist die Partei gegen Windräder?", "Ist die Partei für Windräder?"),
+    ("Wollen die Parteien weniger Parkplätze in der Innenstadt?", "Wollen die Parteien mehr Parkplätze in der Innenstadt?"),
+    ("Soll die Gewerbesteuer gesenkt werden?", "Soll die Gewerbesteuer nicht gesenkt werden?"),
+    ("Soll die Grundsteuer erhöht werden?", "Soll die Grundsteuer gesenkt werden?"),
+])
+def test_opposite_questions_do_not_match(asked, indexed):
+    assert _index(indexed).lookup(asked, "corpora/test") is None
+
+
+def test_polarity_words_are_features():
+    assert _score("Ist die Partei für Windräder?", "Ist die Partei gegen Windräder?") < 0.85
+    assert _score("mehr Parkplätze", "weniger Parkplätze") < 0.85
+
+
+def test_city_name_is_a_feature():
+    assert _score("Radwege in Dortmund", "Radwege in Bochum") < _score("Radwege in Dortmund", "Radwege in Dortmund")
+
+
+def test_rephrased_question_still_matches():
+    index = _index("Was soll gegen steigende Mieten getan werden?")
+    match = index.lookup("Was wollen die Parteien gegen steigende Mieten tun?", "corpora/test")
+    assert match is not None and match[0] == "Was soll gegen steigende Mieten getan werden?"
+
+
+@pytest.mark.parametrize("asked", [
+    "Radwege in Dortmund?",  # the request's own example
+    "Radwege?",
+])
+def test_template_question_matches_its_paraphrases(asked):
+    match = _index("Was plant die Partei für Radwege?").lookup(asked, "corpora/test")
+    assert match is not None and match[0] == "Was plant die Partei für Radwege?"
+
+
+def test_fuer_and_zu_are_no_stance():
+    match = _index("Was plant die Partei für Tempo 30?").lookup("Wie steht die Partei zu Tempo 30?", "corpora/test")
+    assert match is not None
+
+
+def test_only_the_corpus_city_is_ignored():
+    assert _index("Was plant die Partei für Radwege?").lookup("Radwege in Bochum?", "corpora/test") is None
+    bochum = QuestionIndex(size=16, threshold=0.85, city="Bochum")
+    bochum.add("Was plant die Partei für Radwege?", "corpora/test")
+    assert bochum.lookup("Radwege in Bochum?", "corpora/test") is not None
+    assert bochum.lookup("Radwege in Dortmund?", "corpora/test") is None
+
+
+def test_other_scope_does_not_match():
+    index = _index("Was soll gegen steigende Mieten getan werden?", scope="corpora/a")
+    assert index.lookup("Was wollen die Parteien gegen steigende Mieten tun?", "corpora/b") is None
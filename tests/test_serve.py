@@ -0,0 +1,104 @@
+import asyncio, contextvars, json, time
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import budget, cache, faq, ratelimit, retrieval, utils
+from serve import main
+
+QUOTES = {p: [{"quote": f"{p} will mehr Radwege.", "section": "Verkehr"}] for p in ("SPD", "CDU")}
+
+
+def _cached_summary(question, quotes):
+    ctx = contextvars.copy_context()
+    ctx.run(cache.use_partition, "default")
+    return ctx.run(cache.SUMMARY_CACHE.get, cache.summary_key(question, quotes))
+
+
+@pytest.fixture
+def slow_gemini(monkeypatch):
+    """generateContent takes 0.4s, one call at a time; retrieval and the FAQ store are stubbed."""
+    async def handler(request):
+        await asyncio.sleep(0.4)
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": "Zusammenfassung"}]}}]})
+
+    async def answers(corpus_name, question, parties, **kw):
+        return [{"party": p, "status": "ok", "quotes": QUOTES[p]} for p in parties]
+
+    monkeypatch.setattr(utils, "get_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(utils, "HEDGE_PERCENTILE", 100)
+    monkeypatch.setitem(ratelimit.LIMITERS, "generate", ratelimit.AdaptiveLimiter("generate", 100, 100, 1))
+    monkeypatch.setattr(retrieval, "answer_per_party_strict_async", answers)
+    monkeypatch.setattr(faq, "lookup", lambda *a, **kw: None)
+    monkeypatch.setattr(budget, "REQUEST_DEADLINE", 0.2)
+    cache.SUMMARY_CACHE.clear()
+
+
+def test_late_summaries_still_fill_the_cache(slow_gemini):
+    question = "Was tun die Parteien für Radwege?"
+    with TestClient(main.app) as client:
+        t0 = time.monotonic()
+        r = client.post("/", data={"question": question, "parties": ["SPD", "CDU"]})
+        assert r.status_code == 200 and time.monotonic() - t0 < 0.4  # answered before any summary
+        # The CDU summary waits for the single slot well past the request's deadline
+        while main._background and time.monotonic() - t0 < 5:
+            time.sleep(0.05)
+    assert _cached_summary(question, QUOTES["SPD"]) == "Zusammenfassung"
+    assert _cached_summary(question, QUOTES["CDU"]) == "Zusammenfassung"
+
+
+def _slots():
+    return main.REGISTRY.resolve().limiter.in_flight
+
+
+def _events(text):
+    return [block.split("\n", 1)[0].removeprefix("event: ") for block in text.strip().split("\n\n")]
+
+
+def test_stream_reports_errors_and_frees_its_slot(monkeypatch):
+    def broken(*a, **kw):
+        raise RuntimeError("FAQ-Speicher kaputt")
+
+    monkeypatch.setattr(faq, "lookup", broken)
+    with TestClient(main.app) as client:
+        r = client.post("/stream", data={"question": "Radwege?", "parties": ["SPD"]})
+    assert _events(r.text) == ["error", "done"]
+    assert "FAQ-Speicher kaputt" in r.text
+    assert _slots() == 0
+
+
+def test_stream_runs_with_the_request_budget(monkeypatch):
+    seen = []
+    monkeypatch.setattr(faq, "lookup", lambda *a, **kw: seen.append(budget.remaining()) or [])
+    monkeypatch.setattr(budget, "REQUEST_DEADLINE", 7)
+    with TestClient(main.app) as client:
+        r = client.post("/stream", data={"question": "Radwege?", "parties": ["SPD"]})
+    assert _events(r.text) == ["done"]
+    assert seen and 0 < seen[0] <= 7
+
+
+def test_stream_frees_its_slot_if_the_client_is_gone_before_the_body(monkeypatch):
+    monkeypatch.setattr(faq, "lookup", lambda *a, **kw: [])
+    body = b"question=Radwege%3F&parties=SPD"
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+             "method": "POST", "scheme": "http", "path": "/stream", "raw_path": b"/stream", "root_path": "",
+             "query_string": b"", "client": ("127.0.0.1", 1), "server": ("test", 80),
+             "headers": [(b"host", b"test"), (b"content-type", b"application/x-www-form-urlencoded"),
+                         (b"content-length", str(len(body)).encode())]}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise OSError("connection reset")
+
+    async def run():
+        try:
+            await main.app.router({**scope, "app": main.app}, receive, send)  # without the buffering middleware
+        except Exception:
+            pass
+        return _slots()
+
+    assert asyncio.run(run()) == 0
@@ -1,16 +1,145 @@
-import requests, json, unicodedata, re, os
+import requests, json, unicodedata, re, os, threading, asyncio, contextvars, weakref, random, time
+import httpx
+from requests.adapters import HTTPAdapter
+from metrics import record_upstream
+from ratelimit import limiter_for, RateLimitTimeout, RATE_LIMIT_QUEUE_TIMEOUT
+import budget
+
+BASE = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+
+# Hedged requests (async :query / :generateContent only, both free of side effects): when a call
+# is slower than the HEDGE_PERCENTILE of recent calls of its class, a duplicate is sent and the
+# first response wins. Skipped while the limiter has no spare capacity. >= 100 disables hedging.
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))  # seconds; never hedge sooner
+
+# Shared HTTP client for all Gemini API calls: pooled keep-alive connections + timeouts
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))               # connections kept per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))       # seconds
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+# The async client multiplexes many in-flight requests per worker, so it may open more connections
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
 
 def _check_key():
-    if not GEMINI_API_KEY:
-        raise RuntimeError("Set GOOGLE_API_KEY in your environment")
+    if not os.environ.get("GENAI_API_KEY"):
+        raise RuntimeError("Set GENAI_API_KEY in your environment")
+
+def get_session() -> requests.Session:
+    """Process-wide requests.Session; urllib3's connection pool is thread-safe."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update(get_headers())  # default headers live only here
+                _session = s
+    return _session
+
+def get_async_client() -> httpx.AsyncClient:
+    """httpx.AsyncClient for the running event loop (connections cannot be shared across loops)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers=get_headers(),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+async def warm_connections(n: int = 4, url: str | None = None) -> str:
+    """Opens up to n keep-alive connections of this loop's client (DNS + TLS) before the first request.
+    n concurrent GETs of the model resource: cheap, no side effects, not worth rate limiting."""
+    client = get_async_client()
+    url = url or f"{BASE}/{get_gen_model()}"
 
-def _post(url, body):
-    r = requests.post(url, headers=HEADERS, data=json.dumps(body))
+    async def _one():
+        t0 = time.perf_counter()
+        r = await client.get(url, timeout=HTTP_CONNECT_TIMEOUT * 2)
+        record_upstream(url, r.status_code, time.perf_counter() - t0, 0, len(r.content))
+        return r.status_code
+
+    results = await asyncio.gather(*(_one() for _ in range(max(1, n))), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if len(errors) == len(results):
+        raise errors[0]
+    return f"{len(results) - len(errors)} connections, status {sorted({r for r in results if isinstance(r, int)})}"
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _timed(method, url, *, data=None, **kwargs):
+    """One upstream call through the rate limiter of its endpoint class (ratelimit.py).
+    A 429 pauses the class and the call queues again, until its queue deadline runs out."""
+    limiter = limiter_for(url)
+    deadline = _queue_deadline()
+    r = None
+    while True:
+        try:
+            limiter.acquire(deadline)
+        except RateLimitTimeout:
+            if r is not None:
+                return r  # the last 429: callers handle it like before
+            raise
+        t0 = time.perf_counter()
+        try:
+            r = get_session().request(method, url, data=data, **kwargs)
+        except requests.RequestException:
+            limiter.release("error")
+            record_upstream(url, "error", time.perf_counter() - t0, len(data or ""))
+            raise
+        limiter.release(r.status_code, time.perf_counter() - t0, r.headers.get("Retry-After"))
+        record_upstream(url, r.status_code, time.perf_counter() - t0, len(data or ""), len(r.content))
+        if r.status_code != 429:
+            return r
+
+def _post(url, body, timeout=None):
+    r = _timed("POST", url, data=json.dumps(body), timeout=timeout or HTTP_TIMEOUT)
     if r.status_code == 409: # request not completed due to conflict with target 
         return r  # caller may handle conflicts
     r.raise_for_status()
     return r
 
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def _retry_delay(attempt: int, base: float, resp=None) -> float:
+    # Honour Retry-After (seconds) when the server sends one, else exponential backoff with full jitter
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, base * (2 ** attempt))
+
+def _post_with_retry(url, body, *, retries=5, base=1.0, timeout=None):
+    """_post that retries 429/5xx responses and connection errors with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return _post(url, body, timeout)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in _RETRY_STATUS or attempt == retries:
+                raise
+            time.sleep(_retry_delay(attempt, base, e.response))
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(_retry_delay(attempt, base))
+
 def require_env(name: str) -> str:
     v = os.environ.get(name)
     if not v:
@@ -29,15 +158,117 @@ def get_headers() -> dict:
         "x-goog-api-key": get_api_key(),
     }
 
-GEN_API_KEY = get_api_key()
+def submit_in_context(pool, fn, *args, **kwargs):
+    """pool.submit with a copy of the caller's context, like asyncio.to_thread: the request budget,
+    metrics and the cache/rate-limit partition reach the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
 
-HEADERS = {
-    "Content-Type": "application/json",
-    "x-goog-api-key": GEN_API_KEY,
-}
+def _queue_deadline() -> float:
+    # How long a call may wait for a rate-limit slot: the queue timeout, but never past the request budget
+    d = time.monotonic() + RATE_LIMIT_QUEUE_TIMEOUT
+    return min(d, budget.deadline() or d)
 
-def _get(url, params=None):
-    r = requests.get(url, headers=HEADERS, params=params or {})
+async def _apost(url, body, timeout=None):
+    """Async counterpart of _post (same 409 handling, raises httpx.HTTPStatusError)."""
+    data = json.dumps(body)
+    path = url.split("?", 1)[0]
+    if HEDGE_PERCENTILE < 100 and (path.endswith(":query") or path.endswith(":generateContent")):
+        r = await _apost_hedged(url, data, timeout)
+    else:
+        r = await _apost_once(url, data, timeout)
+    if r.status_code == 409:
+        return r
+    r.raise_for_status()
+    return r
+
+async def _apost_hedged(url, data, timeout):
+    limiter = limiter_for(url)
+    delay = limiter.latency_percentile(HEDGE_PERCENTILE)
+    first = asyncio.ensure_future(_apost_once(url, data, timeout))
+    if delay is None:  # too few samples yet
+        return await first
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=max(delay, HEDGE_MIN_DELAY))
+        if done or not limiter.has_capacity():
+            return await first
+        limiter.count_hedge()
+        tasks.append(asyncio.ensure_future(_apost_once(url, data, timeout)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None and t.result().status_code < 500:
+                    if t is not first:
+                        limiter.count_hedge(won=True)
+                    return t.result()
+        return first.result()  # both failed: report the original call's outcome
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()  # frees its limiter slot and drops the connection
+
+async def _apost_once(url, data, timeout):
+    """One call through the limiter; 429s queue again until the queue deadline (see _timed)."""
+    limiter = limiter_for(url)
+    deadline = _queue_deadline()
+    r = None
+    while r is None or r.status_code == 429:
+        try:
+            await limiter.acquire_async(deadline)
+        except RateLimitTimeout:
+            if r is None:
+                raise
+            break
+        t0 = time.perf_counter()
+        try:
+            r = await get_async_client().post(url, content=data, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+        except BaseException as e:  # incl. cancellation: the slot must be freed
+            limiter.release("error")
+            if isinstance(e, httpx.HTTPError):
+                record_upstream(url, "error", time.perf_counter() - t0, len(data))
+            raise
+        limiter.release(r.status_code, time.perf_counter() - t0, r.headers.get("Retry-After"))
+        record_upstream(url, r.status_code, time.perf_counter() - t0, len(data), len(r.content))
+    return r
+
+async def _astream_sse(url, body, timeout=None):
+    """POSTs body and yields each JSON payload of a server-sent-event response (e.g. ?alt=sse)."""
+    client = get_async_client()
+    payload = json.dumps(body)
+    limiter = limiter_for(url)
+    deadline = _queue_deadline()
+    while True:
+        await limiter.acquire_async(deadline)
+        t0, status, received, first = time.perf_counter(), "error", 0, None
+        try:
+            async with client.stream("POST", url, content=payload, timeout=timeout or httpx.USE_CLIENT_DEFAULT) as r:
+                status, first = r.status_code, time.perf_counter() - t0
+                retry_after = r.headers.get("Retry-After")
+                if r.status_code == 429 and time.monotonic() < deadline:
+                    continue  # nothing streamed yet: queue again (finally frees the slot)
+                if r.status_code >= 400:
+                    await r.aread()
+                    r.raise_for_status()
+                async for line in r.aiter_lines():
+                    received += len(line) + 1
+                    if line.startswith("data:"):
+                        data = line[5:].strip()
+                        if data:
+                            yield json.loads(data)
+                return
+        finally:
+            # The slot is held for the whole stream; latency feedback uses the time to the headers
+            limiter.release(status, first, retry_after if status == 429 else None)
+            record_upstream(url, status, time.perf_counter() - t0, len(payload), received)
+
+def _get(url, params=None, timeout=None):
+    r = _timed("GET", url, params=params or {}, timeout=timeout or HTTP_TIMEOUT)
+    r.raise_for_status()
+    return r
+
+def _delete(url, params=None, timeout=None):
+    r = _timed("DELETE", url, params=params or {}, timeout=timeout or HTTP_TIMEOUT)
     r.raise_for_status()
     return r
 
@@ -47,9 +278,24 @@ def count_tokens(text: str, model: str = "models/gemini-2.0-flash") -> int:
     """Fragt bei Google ab, wie viele Tokens der Text hat."""
     url = f"{BASE}/{model}:countTokens"
     body = {"contents": [{"role":"user","parts":[{"text": text}]}]}
-    r = requests.post(url, headers=HEADERS, data=json.dumps(body))
-    r.raise_for_status()
-    return r.json().get("totalTokens", 0)
+    return _post(url, body).json().get("totalTokens", 0)
+
+# Offline token estimate: per started TOKEN_WORD_CHARS letters of a word one token, digits and
+# punctuation one each. TOKEN_ESTIMATE_SCALE corrects it against countTokens (preflight.py --check-tokens).
+TOKEN_WORD_CHARS = int(os.getenv("TOKEN_WORD_CHARS", "4"))
+TOKEN_ESTIMATE_SCALE = float(os.getenv("TOKEN_ESTIMATE_SCALE", "1.0"))
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+
+def estimate_tokens(text: str) -> int:
+    """Offline token estimate (no API call) for budgeting prompts and sizing chunks."""
+    n = 0
+    for t in _TOKEN_RE.findall(text or ""):
+        n += -(-len(t) // TOKEN_WORD_CHARS) if t[0].isalpha() else 1
+    return max(1, round(n * TOKEN_ESTIMATE_SCALE))
+
+def _corpus_key(corpus_name: str) -> str:
+    # Some calls take the bare corpus id, others the "corpora/<id>" path
+    return corpus_name.split("/")[1] if corpus_name.startswith("corpora/") else corpus_name
 
 def _norm(s: str) -> str:
     # NFC normalization to avoid "Grüne" vs "Grüne" issues
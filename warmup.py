@@ -0,0 +1,123 @@
+import asyncio, importlib, os, sys, time, traceback
+
+# Start-up warm-up: everything the first POST would otherwise pay for (imports of the pipeline,
+# config, the corpus registry, template compilation, DNS/TLS of pooled connections, party→document
+# listing and the FAQ store of every registry entry, optionally one retrieval query) runs once at start. Each step is timed for
+# /__boot; /__ready only answers 200 once all required steps are done, so a Cloud Run startup
+# probe on it keeps users away until then.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "no", "off")
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "")  # e.g. "Wohnen"; empty = no warm-up query
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))  # keep-alive connections opened up front
+WARMUP_STEP_TIMEOUT = float(os.getenv("WARMUP_STEP_TIMEOUT", "30"))  # seconds per step
+
+PIPELINE_MODULES = ("utils", "cache", "semantic_cache", "corpus", "retrieval", "rag")
+
+BOOT = {"started": None, "finished": None, "ready": False, "steps": []}
+
+
+def record(name: str, seconds: float, ok: bool = True, required: bool = False, detail=None):
+    """Adds a step to the boot report (also used by boot.py for the import of serve.main)."""
+    entry = {"step": name, "ms": round(seconds * 1000, 1), "ok": ok, "required": required}
+    if detail is not None:
+        entry["detail" if ok else "error"] = detail
+    BOOT["steps"].append(entry)
+    print(f"BOOT: {name} {'ok' if ok else 'FAILED'} in {entry['ms']:.0f} ms"
+          + (f" ({detail})" if detail is not None else ""), flush=True)
+    return entry
+
+async def _step(name: str, fn, *, required: bool = False, sync: bool = True):
+    """Runs one step (sync ones in a thread, so /__boot stays responsive) and records it."""
+    t0 = time.perf_counter()
+    try:
+        coro = asyncio.to_thread(fn) if sync else fn()
+        detail = await asyncio.wait_for(coro, WARMUP_STEP_TIMEOUT)
+    except Exception as e:
+        record(name, time.perf_counter() - t0, ok=False, required=required, detail=f"{type(e).__name__}: {e}")
+        if required:
+            traceback.print_exc()
+        return False
+    record(name, time.perf_counter() - t0, required=required, detail=detail)
+    return True
+
+def _import_pipeline():
+    for name in PIPELINE_MODULES:
+        importlib.import_module(name)
+    return f"{len(PIPELINE_MODULES)} modules"
+
+def _check_config():
+    from utils import get_api_key, get_gen_model
+    get_api_key()
+    return get_gen_model()
+
+def _prefetch_party_doc_map(corpus_name):
+    from retrieval import RETRIEVAL_BACKEND
+    if RETRIEVAL_BACKEND == "local":
+        from local_index import get_index
+        index = get_index()  # memory-mapped, so this only reads meta/vocab
+        return f"local index {index.version}"
+    from corpus import party_doc_map
+    by_norm, _ = party_doc_map(corpus_name, refresh=True)
+    return f"{len(by_norm)} documents"
+
+def _load_registry(registry):
+    return f"{registry.load()} corpora"
+
+def _load_faq_store(corpus_name, path=None):
+    import faq
+    return f"{faq.load_store(path, corpus_name=corpus_name)} questions"
+
+async def _warmup_query(corpus_name):
+    # Straight to the corpus: no answer caches, no entry in the similar-question index
+    from retrieval import corpora_query_async
+    hits = await corpora_query_async(corpus_name, WARMUP_QUERY, results_count=1)
+    return f"{len(hits)} hits"
+
+async def run(registry, template=None):
+    """Runs all warm-up steps in the serving event loop (its httpx client is the one warmed up)."""
+    BOOT["started"] = time.time()
+    if not WARMUP_ENABLED:
+        BOOT["ready"] = True
+        BOOT["finished"] = time.time()
+        return
+    ok = await _step("import_pipeline", _import_pipeline, required=True)
+    ok = await _step("config", _check_config, required=True) and ok
+    ok = await _step("registry", lambda: _load_registry(registry), required=True) and ok
+    if template is not None:
+        ok = await _step("templates", template, required=True) and ok
+    if ok:
+        # Not fatal: the first request opens connections / lists documents itself
+        from utils import warm_connections
+        await _step("connections", lambda: warm_connections(WARMUP_CONNECTIONS), sync=False)
+        for entry in registry.entries.values():
+            suffix = f":{entry.key}" if len(registry.entries) > 1 else ""
+            await _step(f"party_doc_map{suffix}", lambda: _prefetch_party_doc_map(entry.corpus))
+            if entry.faq_store or os.getenv("FAQ_STORE"):
+                await _step(f"faq_store{suffix}", lambda: _load_faq_store(entry.corpus, entry.faq_store))
+        if WARMUP_QUERY:
+            corpus_name = registry.entries[registry.default].corpus
+            await _step("warmup_query", lambda: _warmup_query(corpus_name), sync=False)
+    BOOT["ready"] = ok
+    BOOT["finished"] = time.time()
+
+def is_ready() -> bool:
+    return BOOT["ready"]
+
+def env_info() -> dict:
+    return {
+        "python": sys.version,
+        "port_env": os.getenv("PORT"),
+        "corpus_name": os.getenv("CORPUS_NAME"),
+        "corpus_registry": os.getenv("CORPUS_REGISTRY"),
+        "gen_model": os.getenv("GEN_MODEL"),
+        "genai_api_key_len": len(os.getenv("GENAI_API_KEY") or ""),
+    }
+
+def report() -> dict:
+    started, finished = BOOT["started"], BOOT["finished"]
+    return {
+        **env_info(),
+        "ready": BOOT["ready"],
+        "warming_up": started is not None and finished is None,
+        "warmup_ms": round((finished - started) * 1000, 1) if started and finished else None,
+        "steps": list(BOOT["steps"]),
+    }